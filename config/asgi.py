@@ -11,6 +11,12 @@ from smartpark.routing import websocket_urlpatterns  # noqa: E402
 # Create the default Django ASGI application
 django_application = get_asgi_application()
 
+# Fon vazifalari faqat server jarayonida ishlaydi (manage.py buyruqlari va testlarda emas);
+# bir nechta worker bo'lsa ham ularni faqat yetakchisi bajaradi
+from smartpark.scheduler import scheduler  # noqa: E402
+
+scheduler.start()
+
 # Wrap with WebSocket support
 application = ProtocolTypeRouter(
     {
@@ -133,6 +133,8 @@ except Exception:
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
+            # Yo'laklar parallel yozadi: tranzaksiya boshidayoq yozish qulfi olinadi
+            "OPTIONS": {"transaction_mode": "IMMEDIATE", "timeout": 20},
         }
     }
 
@@ -196,14 +198,94 @@ FREE_MINUTES = 10  # 10 daqiqa bepul
 
 AUTH_USER_MODEL = "smartpark.CustomUser"
 MIN_TIME_BETWEEN_ENTRIES = 2
+STATS_RECONCILE_SECONDS = 300  # statistikani DB bilan solishtirish oralig'i (s)
+BROADCAST_COALESCE_SECONDS = (
+    0.2  # shu oraliqdagi o'zgarishlar bitta delta bo'lib ketadi
+)
+DETAILED_COUNT_CACHE_SECONDS = (
+    60  # batafsil ro'yxat umumiy soni keshda turadigan vaqt (s)
+)
+EXPORT_CACHE_DIR = RUNTIME_DIR / "export_cache"  # tugagan kunlar eksport fayllari
+EXPORT_CACHE_MAX_FILES = 200  # shundan oshsa eng eski fayllar o'chiriladi
+
+# Kamera rasmlari fon threadida yoziladi; ro'yxatlar uchun kichik WebP nusxalar
+IMAGE_WRITE_ASYNC = True
+IMAGE_QUEUE_SIZE = 200  # to'lsa rasm so'rovning o'zida yoziladi
+IMAGE_WRITE_WORKERS = 2  # rasm va eskizlarni yozadigan threadlar
+IMAGE_THUMB_SIZE = (240, 180)
+IMAGE_THUMB_QUALITY = 70
+RETENTION_DAYS = 20  # shundan eski yozuvlar va kunlik rasm papkalari o'chiriladi
+RETENTION_BATCH_SIZE = 1000  # bitta tranzaksiyada o'chiriladigan yozuvlar
+RETENTION_BATCH_PAUSE = (
+    0.05  # partiyalar orasida kutish, kirish/chiqish navbatda qolmasligi uchun (s)
+)
+RETENTION_AUTO_PURGE = (
+    False  # True bo'lsa har kuni 03:30 da rejalashtiruvchi o'zi o'chiradi
+)
+
+# Fon vazifalari (smartpark.scheduler): faqat server jarayonida, bir nechta worker
+# bo'lsa DB dagi lease ni ushlagan yetakchi bajaradi
+SCHEDULER_ENABLED = env.bool("SCHEDULER_ENABLED", True)
+SCHEDULER_LEASE_SECONDS = 60  # yetakchi shuncha vaqt javob bermasa boshqasi oladi
+
+# Unikassa (smartpark.unikassa, smartpark.fiscal_outbox)
+UNIKASSA_BASE_URL = env.str(
+    "UNIKASSA_BASE_URL", "https://api.unikassa.uz/api/v1/integrate"
+)
+UNIKASSA_FISCAL = env.str("UNIKASSA_FISCAL", "ZZ000000000000")
+UNIKASSA_TIMEOUT = (3.05, 10)  # ulanish, javob (s)
+UNIKASSA_RETRIES = 2  # ulanish xatosi va 429/502/503/504 da darhol qayta urinish
+UNIKASSA_BACKOFF = 0.5  # s, har urinishda ikki baravar
+UNIKASSA_POOL_SIZE = 4  # ochiq (keep-alive) ulanishlar
+FISCAL_MAX_ATTEMPTS = 20  # shundan keyin savdo "failed" bo'ladi
+FISCAL_RETRY_DELAY = 5  # s, outbox qayta urinishi, har safar ikki baravar
+FISCAL_RETRY_MAX_DELAY = 600
+FISCAL_SENDING_TIMEOUT = 300  # "sending" da qolib ketgan savdo navbatga qaytadi
+FISCAL_BATCH_SIZE = 20  # bir partiyada olinadigan savdolar
+FISCAL_CONCURRENCY = 4  # parallel /send/sale so'rovlari (<= UNIKASSA_POOL_SIZE)
+FISCAL_BATCH_HISTORY = 50  # status() da ko'rsatiladigan oxirgi partiyalar
 
 # XPrinter USB sozlamalari
 XPRINTER_VENDOR_ID = 0x1FC9  # XPrinter Vendor ID (VID)
 XPRINTER_PRODUCT_ID = 0x2016  # XPrinter Product ID (PID)
 XPRINTER_TIMEOUT = 1000  # USB timeout (ms)
 
+# Shlakbaum (serial) sozlamalari
+BARRIER_PORTS = env.list("BARRIER_PORTS", [])  # bo'sh bo'lsa OS bo'yicha COM3 / ttyUSB0
+BARRIER_BAUDRATE = 9600
+BARRIER_SETTLE_SECONDS = 2  # port ochilgandan keyin bir marta kutiladi (s)
+BARRIER_RECONNECT_SECONDS = 5  # ulanish uzilganda qayta urinish oralig'i (s)
+
+# Kirish/chiqish yo'laklari (kamera + shlakbaum); bo'sh bo'lsa bitta "entry" va bitta "exit"
+# Masalan: {"name": "kirish-1", "direction": "entry", "cameras": ["192.168.1.64"],
+#           "barrier_ports": ["/dev/ttyUSB0"], "auto_open": False, "auto_close": 10}
+GATE_LANES = []
+GATE_LANE_WORKERS = True  # har bir yo'lak o'z threadida, hodisalar kelish tartibida
+GATE_LANE_QUEUE_SIZE = 100  # yo'lak navbati to'lsa kamera 503 oladi
+GATE_EVENT_TIMEOUT = (
+    30  # javob shuncha kutiladi, keyin 202 (hodisa navbatda qoladi) (s)
+)
+# Bloklangan/bepul/taksi raqamlar keshi signal va channel layer orqali yangilanadi;
+# signalsiz o'zgarishlar (update(), SQL) shuncha vaqtdan keyin baribir o'qiladi (s)
+PLATE_POLICY_MAX_AGE = 300
+# Chiqishda noto'g'ri o'qilgan raqam (0/O, 8/B ...) ochiq yozuvlarga moslashtiriladi
+PLATE_MATCH_MAX_EDITS = (
+    1  # o'xshash belgilardan tashqari nechta belgi farq qilishi mumkin
+)
+PLATE_MATCH_MIN_CONFIDENCE = 0.8  # bundan past ishonchda taklif ham qilinmaydi
+# Yozuv faqat farq o'xshash belgilarda bo'lsa avtomatik yopiladi; boshqa moslik
+# (bitta boshqa belgi) operatorga taklif sifatida yuboriladi
+PLATE_INDEX_RECONCILE_SECONDS = (
+    300  # ochiq raqamlar indeksi DB bilan solishtiriladigan oraliq (s)
+)
+
 # Printer configuration
 PRINTER_NAME = env.str("PRINTER_NAME", None)
+PRINTER_CACHE_SECONDS = 300  # topilgan printer nomi shuncha vaqt eslab qolinadi (s)
+PRINT_QUEUE_SIZE = 50  # chek navbatining maksimal uzunligi
+PRINT_MAX_ATTEMPTS = 3  # shundan keyin chek dead-letter ro'yxatiga o'tadi
+PRINT_RETRY_DELAY = 2  # qayta urinishlar orasidagi kutish, har safar 2 baravar (s)
+RECEIPT_FONT = "arial.ttf"  # Unikassa cheki shrifti (topilmasa standart shrift)
 
 
 LOGGING = {
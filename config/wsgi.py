@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
 application = get_wsgi_application()
+
+# Fon vazifalari faqat server jarayonida (smartpark.scheduler)
+from smartpark.scheduler import scheduler  # noqa: E402
+
+scheduler.start()
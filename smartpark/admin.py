@@ -2,7 +2,15 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
 from django.utils import timezone
-from .models import CustomUser, VehicleEntry, Cars
+from .models import (
+    CustomUser,
+    VehicleEntry,
+    Cars,
+    TariffPlan,
+    DailyParkingStats,
+    FiscalOutbox,
+)
+from .change_events import change_events
 
 
 @admin.register(CustomUser)
@@ -75,6 +83,7 @@ class VehicleEntryAdmin(admin.ModelAdmin):
         ("entry_time"),
         ("exit_time"),
         "is_paid",
+        "fiscal_status",
     ]
     search_fields = ["uuid", "number_plate", "total_amount"]
     date_hierarchy = "entry_time"
@@ -107,12 +116,16 @@ class VehicleEntryAdmin(admin.ModelAdmin):
 
     @admin.action(description="Tanlanganlarni to'langan deb belgilash")
     def action_mark_as_paid(self, request, queryset):
+        ids = list(queryset.values_list("id", flat=True))
         updated = queryset.update(is_paid=True)
+        change_events.report_updated(ids)  # update() signal yubormaydi
         self.message_user(request, f"{updated} ta yozuv to'langan qilindi")
 
     @admin.action(description="Tanlanganlarni to'lanmagan deb belgilash")
     def action_mark_as_unpaid(self, request, queryset):
+        ids = list(queryset.values_list("id", flat=True))
         updated = queryset.update(is_paid=False)
+        change_events.report_updated(ids)  # update() signal yubormaydi
         self.message_user(request, f"{updated} ta yozuv to'lanmagan qilindi")
 
     @admin.action(
@@ -120,7 +133,10 @@ class VehicleEntryAdmin(admin.ModelAdmin):
     )
     def action_set_exit_now(self, request, queryset):
         now = timezone.now()
-        updated = queryset.filter(exit_time__isnull=True).update(exit_time=now)
+        queryset = queryset.filter(exit_time__isnull=True)
+        ids = list(queryset.values_list("id", flat=True))
+        updated = queryset.update(exit_time=now)
+        change_events.report_updated(ids)  # update() signal yubormaydi
         self.message_user(request, f"{updated} ta yozuvga chiqish vaqti qo'yildi")
 
 
@@ -139,6 +155,73 @@ class CarsAdmin(admin.ModelAdmin):
     list_editable = ["is_free", "is_special_taxi", "is_blocked"]
 
 
+@admin.register(TariffPlan)
+class TariffPlanAdmin(admin.ModelAdmin):
+    list_display = [
+        "name",
+        "category",
+        "hour_price",
+        "free_minutes",
+        "quarter_price",
+        "daily_hours",
+        "valid_from",
+        "valid_to",
+        "is_active",
+    ]
+    list_filter = ["category", "is_active"]
+    search_fields = ["name"]
+    ordering = ["category", "-valid_from"]
+
+
+@admin.register(DailyParkingStats)
+class DailyParkingStatsAdmin(admin.ModelAdmin):
+    list_display = [
+        "day",
+        "entries",
+        "exits",
+        "open_entries",
+        "paid_count",
+        "revenue",
+        "free_exits",
+        "peak_occupancy",
+    ]
+    date_hierarchy = "day"
+    readonly_fields = ["updated_at"]
+
+
+@admin.register(FiscalOutbox)
+class FiscalOutboxAdmin(admin.ModelAdmin):
+    list_display = [
+        "id",
+        "entry",
+        "status",
+        "attempts",
+        "next_attempt_at",
+        "created_at",
+        "sent_at",
+        "last_error",
+    ]
+    list_filter = ["status"]
+    date_hierarchy = "created_at"
+    raw_id_fields = ["entry"]
+    readonly_fields = ["response", "created_at", "sent_at", "claimed_at"]
+    actions = ["action_retry", "action_confirm_sent"]
+
+    @admin.action(description="Xato / tekshirilganlarni qayta yuborish")
+    def action_retry(self, request, queryset):
+        from .fiscal_outbox import fiscal_outbox
+
+        count = fiscal_outbox.retry_failed(list(queryset.values_list("id", flat=True)))
+        self.message_user(request, f"{count} ta savdo navbatga qaytarildi")
+
+    @admin.action(description="Fiskal modulda bor - yuborilgan deb belgilash")
+    def action_confirm_sent(self, request, queryset):
+        from .fiscal_outbox import fiscal_outbox
+
+        count = fiscal_outbox.confirm_sent(list(queryset.values_list("id", flat=True)))
+        self.message_user(request, f"{count} ta savdo yuborilgan deb belgilandi")
+
+
 # Admin UI titles
 admin.site.site_header = "Smart AutoPark Admin"
 admin.site.site_title = "Smart AutoPark"
@@ -1,85 +1,273 @@
-import serial
-import time
+"""Shlakbaum (barrier) boshqaruvi serial port orqali.
+
+``barrier`` is a long-lived controller: the port is opened once (the
+2 s settle after opening is paid only on connect, not per command) and
+commands go through an asyncio queue on the controller's own event loop
+thread, so an "open" reaches the device within milliseconds.
+
+- ``open(auto_close=N)`` schedules the close on a loop timer instead of
+  sleeping; another open before it fires restarts the timer.
+- A write error drops the port; the command is retried after
+  reconnecting, and a background task keeps reconnecting while the
+  device is away. Every port in ``BARRIER_PORTS`` is tried in order.
+
+``control_barrier_command`` and ``control_barrier_time`` are kept as
+non-blocking wrappers around ``barrier``.
+"""
+
+import asyncio
 import os
+import threading
+from concurrent.futures import Future
 
+import serial
+from django.conf import settings
 
-def control_barrier_time(delay_seconds=10):
-    """
-    Shlakboumni ochadi va N soniyadan keyin avtomatik yopadi.
-    """
-    try:
-        # Operating system ga qarab port nomini aniqlash
-        if os.name == "nt":  # Windows
-            port = "COM3"  # Windows da COM3, COM4, COM5... bo'lishi mumkin
-        else:  # Linux/Mac
-            port = "/dev/ttyUSB0"  # Linux da /dev/ttyUSB0, /dev/ttyUSB1...
+COMMANDS = {
+    "open": b"O",  # Bu sizning qurilmangizga bog'liq (masalan b'\xA0\x01\x01\xA2')
+    "close": b"C",
+}
 
-        baudrate = 9600
+DEFAULT_BAUDRATE = 9600
+DEFAULT_SETTLE_SECONDS = 2  # Port ochilgandan keyin barqarorlashish
+DEFAULT_RECONNECT_SECONDS = 5
+WRITE_ATTEMPTS = 3
 
-        with serial.Serial(port, baudrate, timeout=1) as ser:
-            time.sleep(2)  # Port ochilgandan keyin barqarorlashish
 
-            # Ochish buyrug'i
-            ser.write(
-                b"O"
-            )  # Bu sizning qurilmangizga bog'liq (masalan b'\xA0\x01\x01\xA2')
-            print("✅ Barrier OPEN command sent")
+def default_ports():
+    # Operating system ga qarab port nomini aniqlash
+    if os.name == "nt":  # Windows da COM3, COM4, COM5... bo'lishi mumkin
+        return ["COM3", "COM1", "COM2", "COM4", "COM5", "COM6", "COM7", "COM8"]
+    return ["/dev/ttyUSB0", "/dev/ttyUSB1"]
 
-            # Kutish
-            time.sleep(delay_seconds)
 
-            # Yopish buyrug'i
-            ser.write(b"C")
-            print("✅ Barrier CLOSE command sent")
+class BarrierError(Exception):
+    pass
 
-    except serial.SerialException as e:
-        print(f"❌ Serial port error: {e}")
-    except Exception as e:
-        print(f"❌ Unexpected error: {e}")
 
+class BarrierController:
+    """Holds the barrier serial port open and serializes commands to it."""
 
-def control_barrier_command(action="open"):
-    """
-    Shlakbaumni boshqarish: 'open' yoki 'close'
-    Qurilmaga serial orqali signal yuboradi.
-    """
-    try:
-        # Operating system ga qarab port nomini aniqlash
-        if os.name == "nt":  # Windows
-            port = "COM3"  # Windows da COM3, COM4, COM5... bo'lishi mumkin
-        else:  # Linux/Mac
-            port = "/dev/ttyUSB0"  # Linux da /dev/ttyUSB0, /dev/ttyUSB1...
-
-        baudrate = 9600  # Modulga mos ravishda sozlang (odatda 9600)
-
-        # Command ni aniqlash
-        if action == "open":
-            command = b"O"  # O = Open (sizning modulga bog'liq, ba'zida b'\xA0\x01\x01\xA2' bo'lishi mumkin)
-        elif action == "close":
-            command = b"C"  # C = Close
-        else:
+    def __init__(
+        self, ports=None, baudrate=None, settle_seconds=None, reconnect_seconds=None
+    ):
+        self._ports = ports
+        self._baudrate = baudrate
+        self._settle_seconds = settle_seconds
+        self._reconnect_seconds = reconnect_seconds
+        self._lock = threading.Lock()
+        self._thread = None
+        self._loop = None
+        self._queue = None
+        self._serial = None
+        self._port = None
+        self._connect_lock = None
+        self._close_timer = None
+        self.last_error = None
+
+    def _setting(self, value, name, default):
+        return value if value is not None else getattr(settings, name, default)
+
+    @property
+    def ports(self):
+        return self._setting(self._ports, "BARRIER_PORTS", None) or default_ports()
+
+    @property
+    def connected(self):
+        return self._serial is not None
+
+    @property
+    def port(self):
+        return self._port
+
+    def start(self):
+        """Start the controller thread (idempotent)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            ready = threading.Event()
+            self._thread = threading.Thread(
+                target=self._run, args=(ready,), name="barrier-controller", daemon=True
+            )
+            self._thread.start()
+        ready.wait()
+
+    def stop(self, timeout=5):
+        """Close the port and stop the controller thread."""
+        with self._lock:
+            thread, loop = self._thread, self._loop
+            self._thread = None
+        if thread is None or loop is None:
+            return
+        loop.call_soon_threadsafe(self._queue.put_nowait, None)
+        thread.join(timeout)
+
+    def submit(self, action, auto_close=None):
+        """Queue ``action`` ("open"/"close"); the future resolves once it is written."""
+        if action not in COMMANDS:
             raise ValueError("Action must be 'open' or 'close'")
+        self.start()
+        future = Future()
+        self._loop.call_soon_threadsafe(self._enqueue, action, auto_close, future)
+        return future
+
+    def open(self, auto_close=None):
+        """Open the barrier; close it after ``auto_close`` seconds if given."""
+        return self.submit("open", auto_close)
+
+    def close(self):
+        return self.submit("close")
+
+    async def aopen(self, auto_close=None):
+        return await asyncio.wrap_future(self.open(auto_close))
+
+    async def aclose(self):
+        return await asyncio.wrap_future(self.close())
+
+    # Quyidagilar faqat controller loopida ishlaydi
 
-        # Serial port ochiladi
-        with serial.Serial(port, baudrate, timeout=1) as ser:
-            time.sleep(2)  # Port ochilgandan keyin kutish
-            ser.write(command)
-            print(f"✅ Barrier command sent: {action}")
-
-    except serial.SerialException as e:
-        print(f"❌ Serial port error: {e}")
-        # Windows da COM port topilmagan bo'lsa, boshqa COM portlarni sinab ko'rish
-        if os.name == "nt":
-            print("🔄 Trying other COM ports...")
-            for com_port in ["COM1", "COM2", "COM4", "COM5", "COM6", "COM7", "COM8"]:
+    def _run(self, ready):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._connect_lock = asyncio.Lock()
+        ready.set()
+        try:
+            loop.run_until_complete(self._main())
+        finally:
+            self._cancel_close_timer()
+            self._disconnect()
+            loop.close()
+            self._loop = None
+
+    def _enqueue(self, action, auto_close, future):
+        # Yangi buyruq eski avtomatik yopishni bekor qiladi
+        self._cancel_close_timer()
+        self._queue.put_nowait((action, auto_close, future))
+
+    def _cancel_close_timer(self):
+        if self._close_timer is not None:
+            self._close_timer.cancel()
+            self._close_timer = None
+
+    def _auto_close(self):
+        self._close_timer = None
+        self._queue.put_nowait(("close", None, None))
+
+    async def _main(self):
+        keeper = asyncio.ensure_future(self._keep_connected())
+        try:
+            while True:
+                item = await self._queue.get()
+                if item is None:
+                    return
+                action, auto_close, future = item
+                if future is not None and not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    await self._write(COMMANDS[action])
+                    print(f"✅ Barrier command sent: {action}")
+                    if action == "open" and auto_close is not None:
+                        self._close_timer = self._loop.call_later(
+                            auto_close, self._auto_close
+                        )
+                    if future is not None:
+                        future.set_result(self._port)
+                except Exception as e:
+                    print(f"❌ Barrier command {action} failed: {e}")
+                    if future is not None:
+                        future.set_exception(e)
+        finally:
+            keeper.cancel()
+            await asyncio.gather(keeper, return_exceptions=True)
+
+    async def _keep_connected(self):
+        """Reconnect in the background so the next command does not wait for it."""
+        while True:
+            if self._serial is None:
                 try:
-                    with serial.Serial(com_port, baudrate, timeout=1) as ser:
-                        time.sleep(1)
-                        ser.write(command)
-                        print(f"✅ Barrier command sent via {com_port}: {action}")
-                        return
-                except Exception:
+                    await self._connect()
+                except BarrierError:
+                    pass
+            await asyncio.sleep(
+                self._setting(
+                    self._reconnect_seconds,
+                    "BARRIER_RECONNECT_SECONDS",
+                    DEFAULT_RECONNECT_SECONDS,
+                )
+            )
+
+    async def _connect(self):
+        async with self._connect_lock:
+            if self._serial is not None:
+                return
+            baudrate = self._setting(
+                self._baudrate, "BARRIER_BAUDRATE", DEFAULT_BAUDRATE
+            )
+            errors = []
+            for port in self.ports:
+                try:
+                    ser = serial.Serial(port, baudrate, timeout=1, write_timeout=1)
+                except (serial.SerialException, OSError) as e:
+                    errors.append(f"{port}: {e}")
                     continue
-            print("❌ No available COM ports found")
-    except Exception as e:
-        print(f"❌ Unexpected error: {e}")
+                await asyncio.sleep(
+                    self._setting(
+                        self._settle_seconds,
+                        "BARRIER_SETTLE_SECONDS",
+                        DEFAULT_SETTLE_SECONDS,
+                    )
+                )
+                self._serial, self._port, self.last_error = ser, port, None
+                print(f"✅ Barrier connected on {port}")
+                return
+            self.last_error = "; ".join(errors) or "No serial ports configured"
+            raise BarrierError(f"❌ Serial port error: {self.last_error}")
+
+    def _disconnect(self, error=None):
+        ser, self._serial = self._serial, None
+        if error is not None:
+            self.last_error = str(error)
+            print(f"❌ Serial port error on {self._port}: {error}")
+        if ser is not None:
+            try:
+                ser.close()
+            except Exception:
+                pass
+
+    async def _write(self, command):
+        error = None
+        for attempt in range(WRITE_ATTEMPTS):
+            if attempt:
+                await asyncio.sleep(0.1 * 2**attempt)
+            try:
+                await self._connect()
+                self._serial.write(command)
+                self._serial.flush()
+                return
+            except BarrierError as e:
+                error = e
+            except (serial.SerialException, OSError) as e:
+                error = e
+                self._disconnect(e)
+        raise BarrierError(str(error))
+
+
+barrier = BarrierController()
+
+
+def control_barrier_time(delay_seconds=10):
+    """
+    Shlakboumni ochadi va N soniyadan keyin avtomatik yopadi.
+    Kutmaydi: yopish controller taymerida bajariladi.
+    """
+    return barrier.open(auto_close=delay_seconds)
+
+
+def control_barrier_command(action="open"):
+    """
+    Shlakbaumni boshqarish: 'open' yoki 'close'
+    Qurilmaga serial orqali signal yuboradi (navbat orqali, kutmaydi).
+    """
+    return barrier.submit(action)
@@ -0,0 +1,127 @@
+import json
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+
+from .images import thumbnail_url
+from .stats import (
+    listed_entries_filter,
+    local_date,
+    local_today,
+    occupancy,
+)
+
+GROUP_NAME = "home_updates"
+SEQ_CACHE_KEY = "smartpark:home_updates:seq"
+
+
+def serialize_entry(entry):
+    """One row of the home page entries table."""
+    duration_hours = None
+    if entry.exit_time and entry.entry_time:
+        duration_hours = (entry.exit_time - entry.entry_time).total_seconds() / 3600
+
+    return {
+        "id": entry.id,
+        "number_plate": entry.number_plate,
+        "entry_time": entry.entry_time.strftime("%H:%M"),
+        "exit_time": entry.exit_time.strftime("%H:%M") if entry.exit_time else None,
+        # Klient jadvalni saralashi uchun to'liq vaqt
+        "entry_ts": entry.entry_time.isoformat(),
+        "total_amount": entry.total_amount or 0,
+        "is_paid": entry.is_paid,
+        "entry_image": entry.entry_image.url if entry.entry_image else None,
+        "exit_image": entry.exit_image.url if entry.exit_image else None,
+        "entry_thumb": thumbnail_url(entry.entry_image),
+        "exit_thumb": thumbnail_url(entry.exit_image),
+        "status": "inside"
+        if not entry.exit_time
+        else ("paid" if entry.is_paid else "unpaid"),
+        "duration_hours": duration_hours,
+    }
+
+
+def is_listed(entry, day):
+    """Python-side twin of ``listed_entries_filter`` for a single entry."""
+    if entry.entry_time is None:
+        return False
+    entry_day = local_date(entry.entry_time)
+    if entry_day == day:
+        return True
+    return (
+        entry_day == day - timedelta(days=1)
+        and entry.exit_time is not None
+        and local_date(entry.exit_time) == day
+    )
+
+
+def next_seq():
+    # add() faqat kalit yo'q bo'lsa yozadi, incr() esa atomar
+    cache.add(SEQ_CACHE_KEY, 0, timeout=None)
+    return cache.incr(SEQ_CACHE_KEY)
+
+
+def current_seq():
+    return cache.get(SEQ_CACHE_KEY, 0)
+
+
+def build_change(entry_id, action, entry=None, deleted=False, number_plate=None):
+    """One item of a delta's ``changes`` list: an upsert with the row, or a remove."""
+    if entry is not None and not deleted and is_listed(entry, local_today()):
+        op, entry_data = "upsert", serialize_entry(entry)
+    else:
+        op, entry_data = "remove", None
+    return {
+        "op": op,
+        "action": action,
+        "entry_id": entry_id,
+        "number_plate": entry.number_plate if entry is not None else number_plate,
+        "entry": entry_data,
+    }
+
+
+def encode_delta(changes):
+    """JSON text of an ``entry_delta`` carrying one or more entry changes.
+
+    Encoded once here; consumers forward the text as-is. ``seq`` increases
+    by exactly one per delta, so a client that sees a gap asks for a
+    snapshot instead of trusting its local list.
+    """
+    return json.dumps(
+        {
+            "type": "entry_delta",
+            "seq": next_seq(),
+            "changes": changes,
+            "statistics": occupancy.snapshot(),
+        }
+    )
+
+
+def delta_event(text):
+    return {"type": "entry_delta", "text": text}
+
+
+def publish_changes(changes):
+    """Broadcast a delta to every home page client (from sync code)."""
+    async_to_sync(get_channel_layer().group_send)(
+        GROUP_NAME, delta_event(encode_delta(changes))
+    )
+
+
+def build_snapshot():
+    """Full state for a client that is (re)synchronising."""
+    from .models import VehicleEntry
+
+    # seq so'rovdan oldin olinadi: keyingi deltalar takrorlansa ham zarar yo'q
+    seq = current_seq()
+    entries = VehicleEntry.objects.filter(
+        listed_entries_filter(local_today())
+    ).order_by("-entry_time")
+    return {
+        "type": "snapshot",
+        "seq": seq,
+        "statistics": occupancy.snapshot(),
+        "vehicle_entries": [serialize_entry(entry) for entry in entries],
+    }
@@ -0,0 +1,206 @@
+import re
+
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from django.core.files.base import File
+
+READ_CHUNK_SIZE = 64 * 1024
+
+LICENSE_PLATE_RE = re.compile(rb"<licensePlate>(.*?)</licensePlate>")
+JPEG_CONTENT_TYPE = b"Content-Type: image/jpeg"
+JPEG_MAGIC = b"\xff\xd8\xff"
+HEADER_END = b"\r\n\r\n"
+CRLF = b"\r\n"
+
+
+class CameraUpload:
+    """Result of parsing one ANPR camera event.
+
+    ``image`` is a memoryview into the request buffer (no copy was made),
+    or None if the event carried no JPEG part. ``declares_jpeg`` is only
+    meaningful for bodies without a boundary.
+    """
+
+    __slots__ = ("number_plate", "image", "has_boundary", "declares_jpeg")
+
+    def __init__(
+        self, number_plate=None, image=None, has_boundary=False, declares_jpeg=False
+    ):
+        self.number_plate = number_plate
+        self.image = image
+        self.has_boundary = has_boundary
+        self.declares_jpeg = declares_jpeg
+
+    def image_file(self, name):
+        """Wrap the JPEG slice as a Django File for ImageField assignment."""
+        if self.image is None:
+            return None
+        return MemoryViewFile(self.image, name=name)
+
+
+class MemoryViewFile(File):
+    """Read-only File over a memoryview.
+
+    Storage backends consume ``chunks()``, so the JPEG is copied out of the
+    request buffer one chunk at a time instead of as a whole ``bytes`` object.
+    """
+
+    def __init__(self, view, name=None):
+        super().__init__(None, name=name)
+        self._view = view
+        self._pos = 0
+
+    @property
+    def size(self):
+        return len(self._view)
+
+    def open(self, mode=None):
+        self.seek(0)
+        return self
+
+    @property
+    def closed(self):
+        return False
+
+    def close(self):
+        pass
+
+    def seek(self, pos, whence=0):
+        if whence == 1:
+            pos += self._pos
+        elif whence == 2:
+            pos += len(self._view)
+        self._pos = max(0, min(pos, len(self._view)))
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else self._pos + size
+        data = bytes(self._view[self._pos : end])
+        self._pos += len(data)
+        return data
+
+    def chunks(self, chunk_size=None):
+        chunk_size = chunk_size or self.DEFAULT_CHUNK_SIZE
+        view = self._view
+        for start in range(0, len(view), chunk_size):
+            yield bytes(view[start : start + chunk_size])
+
+    def multiple_chunks(self, chunk_size=None):
+        return self.size > (chunk_size or self.DEFAULT_CHUNK_SIZE)
+
+
+def get_boundary(content_type):
+    """Extract the multipart boundary from a Content-Type header value."""
+    if "boundary=" not in content_type:
+        return None
+    boundary = content_type.split("boundary=")[-1].split(";")[0].strip().strip('"')
+    return boundary or None
+
+
+def read_request_body(request):
+    """Read the request stream once into a single preallocated buffer.
+
+    ``request.body`` would do the same read but then also get decoded to a
+    string by the old code; here the buffer is returned as-is so callers can
+    slice it with memoryview.
+    """
+    try:
+        content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except (TypeError, ValueError):
+        content_length = 0
+
+    max_size = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+    if max_size is not None and content_length > max_size:
+        raise RequestDataTooBig(
+            "Request body exceeded settings.DATA_UPLOAD_MAX_MEMORY_SIZE."
+        )
+
+    if content_length <= 0:
+        return bytearray(request.read())
+
+    buffer = bytearray(content_length)
+    view = memoryview(buffer)
+    pos = 0
+    while pos < content_length:
+        chunk = request.read(min(READ_CHUNK_SIZE, content_length - pos))
+        if not chunk:
+            break
+        view[pos : pos + len(chunk)] = chunk
+        pos += len(chunk)
+    view.release()
+    if pos < content_length:
+        del buffer[pos:]
+    return buffer
+
+
+def find_license_plate(buffer, start=0, end=None):
+    """Return the <licensePlate> value found in buffer[start:end], or None."""
+    match = LICENSE_PLATE_RE.search(buffer, start, len(buffer) if end is None else end)
+    if not match:
+        return None
+    return match.group(1).decode("utf-8", errors="ignore")
+
+
+def iter_parts(buffer, boundary):
+    """Yield (header_start, body_start, body_end) offsets of each multipart part."""
+    delimiter = boundary.encode()
+    positions = []
+    pos = buffer.find(delimiter)
+    while pos != -1:
+        positions.append(pos)
+        pos = buffer.find(delimiter, pos + len(delimiter))
+
+    for left, right in zip(positions, positions[1:]):
+        header_start = left + len(delimiter)
+        header_end = buffer.find(HEADER_END, header_start, right)
+        if header_end == -1:
+            continue
+        body_start = header_end + len(HEADER_END)
+        # Each body ends with CRLF followed by the "--" delimiter prefix.
+        body_end = buffer.rfind(CRLF, body_start, right)
+        if body_end == -1:
+            body_end = right
+        yield header_start, body_start, body_end
+
+
+def parse_camera_buffer(buffer, content_type):
+    """Pull the licence plate and JPEG slice out of a raw camera event body."""
+    boundary = get_boundary(content_type)
+    view = memoryview(buffer)
+
+    if not boundary:
+        # No boundary: fall back to locating raw JPEG data by its magic bytes
+        image = None
+        declares_jpeg = JPEG_CONTENT_TYPE in buffer
+        if declares_jpeg:
+            jpeg_start = buffer.find(JPEG_MAGIC)
+            if jpeg_start != -1:
+                image = view[jpeg_start:]
+        return CameraUpload(
+            find_license_plate(buffer), image, declares_jpeg=declares_jpeg
+        )
+
+    number_plate = None
+    image = None
+    for header_start, body_start, body_end in iter_parts(buffer, boundary):
+        is_jpeg = buffer.find(JPEG_CONTENT_TYPE, header_start, body_start) != -1
+        if is_jpeg:
+            if image is None:
+                image = view[body_start:body_end]
+        elif number_plate is None:
+            number_plate = find_license_plate(buffer, body_start, body_end)
+
+    if number_plate is None:
+        # Some cameras send the XML outside of a proper part
+        number_plate = find_license_plate(buffer)
+
+    return CameraUpload(number_plate, image, has_boundary=True)
+
+
+def parse_camera_upload(request):
+    """Read and parse an ANPR camera request in a single pass over its stream."""
+    buffer = read_request_body(request)
+    return parse_camera_buffer(buffer, request.headers.get("Content-Type", ""))
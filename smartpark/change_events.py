@@ -0,0 +1,196 @@
+import asyncio
+import contextvars
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from .broadcast import (
+    GROUP_NAME,
+    build_change,
+    delta_event,
+    encode_delta,
+    is_listed,
+    publish_changes,
+)
+from .plate_index import open_plates
+from .rollups import refresh_entries
+from .stats import local_today, occupancy
+
+DEFAULT_COALESCE_SECONDS = 0.2
+
+EntryChange = namedtuple("EntryChange", "action entry deleted number_plate")
+
+
+def merge_change(pending, entry_id, change):
+    """Keep only the latest change per entry; a new entry stays "created" until published."""
+    previous = pending.get(entry_id)
+    if previous is not None and previous.action == "created":
+        if change.deleted:
+            # Klientlar bu yozuvni hali ko'rmagan
+            del pending[entry_id]
+            return
+        change = change._replace(action="created")
+    pending[entry_id] = change
+
+
+class ChangeEventScheduler:
+    """Coalesces VehicleEntry changes into one ``entry_delta`` per window.
+
+    Signals call ``entry_changed()``; bulk code that bypasses signals
+    (``update()``, raw deletes) calls ``report_updated()``/``report_deleted()``.
+    Inside ``batch()`` everything is held until the block exits and then
+    published as a single delta.
+
+    Outside a batch the first change arms a ``BROADCAST_COALESCE_SECONDS``
+    timer on the event loop serving the WebSocket consumers (bound in
+    ``HomeConsumer.connect``). The timer has to live on that loop: the
+    in-memory channel layer does not wake a consumer for messages sent
+    from foreign threads. With no loop bound, nobody is listening, so the
+    change is published immediately.
+    """
+
+    def __init__(self, window=None):
+        self._window = window
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pending = {}
+        self._armed = False
+        self._loop = None
+
+    @property
+    def window(self):
+        if self._window is not None:
+            return self._window
+        return getattr(settings, "BROADCAST_COALESCE_SECONDS", DEFAULT_COALESCE_SECONDS)
+
+    def bind_loop(self, loop):
+        self._loop = loop
+
+    def entry_changed(self, entry, action, deleted=False):
+        self._enqueue(entry.id, EntryChange(action, entry, deleted, entry.number_plate))
+
+    def report_updated(self, entry_ids, action="updated"):
+        """Announce rows changed with ``QuerySet.update()``; they are re-read on publish."""
+        occupancy.invalidate()
+        open_plates.invalidate()
+        refresh_entries(entry_ids)
+        for entry_id in entry_ids:
+            self._enqueue(entry_id, EntryChange(action, None, False, None))
+
+    def report_deleted(self, entry_ids):
+        """Announce rows removed without post_delete signals."""
+        occupancy.invalidate()
+        open_plates.invalidate()
+        for entry_id in entry_ids:
+            self._enqueue(entry_id, EntryChange("deleted", None, True, None))
+
+    @contextmanager
+    def batch(self):
+        """Collect every change made in this thread and publish them once on exit."""
+        if getattr(self._local, "batch", None) is not None:
+            # Ichma-ich batch: tashqi batch yakunida yuboriladi
+            yield
+            return
+        self._local.batch = {}
+        try:
+            yield
+        finally:
+            pending, self._local.batch = self._local.batch, None
+        self._publish(pending)
+
+    def _enqueue(self, entry_id, change):
+        batch = getattr(self._local, "batch", None)
+        if batch is not None:
+            merge_change(batch, entry_id, change)
+            return
+
+        with self._lock:
+            merge_change(self._pending, entry_id, change)
+            if self._armed:
+                return
+            self._armed = True
+
+        loop = self._loop
+        if self.window > 0 and loop is not None and not loop.is_closed():
+            try:
+                # Bo'sh context: chaqiruvchi threadning asgiref holati taymerga o'tmasin
+                loop.call_soon_threadsafe(
+                    loop.call_later,
+                    self.window,
+                    self._flush_later,
+                    context=contextvars.Context(),
+                )
+                return
+            except RuntimeError:
+                pass  # loop yopilgan
+        self.flush()
+
+    def _flush_later(self):
+        asyncio.ensure_future(self._aflush())
+
+    async def _aflush(self):
+        try:
+            text = await database_sync_to_async(self._take_delta)()
+            if text:
+                await get_channel_layer().group_send(GROUP_NAME, delta_event(text))
+        except Exception as e:
+            print("[BROADCAST ERROR]:", e)
+
+    def _take_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._armed = False
+        return pending
+
+    def _take_delta(self):
+        changes = self._build_changes(self._take_pending())
+        return encode_delta(changes) if changes else None
+
+    def flush(self):
+        """Publish everything queued outside of ``batch()`` right now."""
+        self._publish(self._take_pending())
+
+    def _publish(self, pending):
+        changes = self._build_changes(pending)
+        if changes:
+            publish_changes(changes)
+
+    def _build_changes(self, pending):
+        if not pending:
+            return []
+        from .models import VehicleEntry
+
+        # update() bilan o'zgargan yozuvlarni bitta so'rovda o'qiymiz
+        reload_ids = [
+            entry_id
+            for entry_id, change in pending.items()
+            if change.entry is None and not change.deleted
+        ]
+        reloaded = VehicleEntry.objects.in_bulk(reload_ids) if reload_ids else {}
+
+        today = local_today()
+        changes = []
+        for entry_id, change in pending.items():
+            entry = change.entry
+            if entry is None and not change.deleted:
+                entry = reloaded.get(entry_id)
+            if change.deleted and entry is not None and not is_listed(entry, today):
+                # Ekranda bo'lmagan eski yozuv o'chirildi - klientga yubormaymiz
+                continue
+            changes.append(
+                build_change(
+                    entry_id,
+                    change.action,
+                    entry=entry,
+                    deleted=change.deleted,
+                    number_plate=change.number_plate,
+                )
+            )
+        return changes
+
+
+change_events = ChangeEventScheduler()
@@ -1,13 +1,23 @@
+import asyncio
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.utils import timezone
 from datetime import datetime
 from .models import VehicleEntry
+from .broadcast import build_snapshot
+from .change_events import change_events
+from .images import thumbnail_url
+from .print_spooler import PrintQueueFull, print_spooler
+from .stats import parse_day, statistics_for
 
 
 class HomeConsumer(AsyncWebsocketConsumer):
     async def connect(self):
+        # Delta oynasi taymeri shu event loopda ishlaydi
+        change_events.bind_loop(asyncio.get_running_loop())
+        print_spooler.bind_loop(asyncio.get_running_loop())
+
         # Join the home_updates group
         await self.channel_layer.group_add("home_updates", self.channel_name)
         await self.accept()
@@ -28,7 +38,9 @@ class HomeConsumer(AsyncWebsocketConsumer):
         data = json.loads(text_data)
         message_type = data.get("type")
 
-        if message_type == "get_statistics":
+        if message_type == "get_snapshot":
+            await self.send_snapshot()
+        elif message_type == "get_statistics":
             await self.send_statistics(
                 data.get("date", timezone.now().date().isoformat())
             )
@@ -55,6 +67,8 @@ class HomeConsumer(AsyncWebsocketConsumer):
             await self.handle_print_receipt(data.get("entry_id"))
         elif message_type == "print_simple_receipt":
             await self.handle_print_simple_receipt(data.get("entry_id"))
+        elif message_type == "retry_print_job":
+            await self.handle_retry_print_job(data.get("job_id"))
         elif message_type == "clear_exit_time":
             await self.handle_clear_exit_time(data.get("entry_id"))
         elif message_type == "find_xprinter":
@@ -63,33 +77,9 @@ class HomeConsumer(AsyncWebsocketConsumer):
             await self.handle_test_xprinter()
 
     # Handle broadcast messages from signals
-    async def broadcast_update(self, event):
-        """Handle broadcast updates from VehicleEntry signals"""
-        await self.send(
-            text_data=json.dumps(
-                {
-                    "type": "model_update",
-                    "statistics": event["statistics"],
-                    "vehicle_entries": event["vehicle_entries"],
-                    "action": event["action"],
-                    "entry_id": event.get("entry_id"),
-                    "number_plate": event.get("number_plate"),
-                }
-            )
-        )
-
-        # If this is a payment completion, also send latest unpaid entry update
-        if event.get("action") == "payment_completed":
-            today = timezone.now().date().isoformat()
-            latest_unpaid = await self.get_latest_unpaid_entry(today)
-            await self.send(
-                text_data=json.dumps(
-                    {
-                        "type": "latest_unpaid_entry_update",
-                        "data": latest_unpaid,
-                    }
-                )
-            )
+    async def entry_delta(self, event):
+        """Forward a pre-encoded delta from smartpark.broadcast"""
+        await self.send(text_data=event["text"])
 
     async def broadcast_notification(self, event):
         """Handle broadcast notifications"""
@@ -105,6 +95,12 @@ class HomeConsumer(AsyncWebsocketConsumer):
             )
         )
 
+    async def print_job_status(self, event):
+        """Print spooler job status (queued/printing/retrying/done/failed)"""
+        await self.send(
+            text_data=json.dumps({"type": "print_job_update", "data": event["data"]})
+        )
+
     async def latest_unpaid_entry_update(self, event):
         """Handle latest unpaid entry updates"""
         await self.send(
@@ -118,75 +114,7 @@ class HomeConsumer(AsyncWebsocketConsumer):
 
     @database_sync_to_async
     def get_statistics(self, date_str):
-        try:
-            # Convert date string to timezone-aware datetime for proper filtering
-            date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
-            # Create timezone-aware datetime range for the entire day
-            start_datetime = timezone.make_aware(
-                datetime.combine(date_obj, datetime.min.time())
-            )
-            end_datetime = timezone.make_aware(
-                datetime.combine(date_obj, datetime.max.time())
-            )
-        except ValueError:
-            # Fallback to today if date parsing fails
-            today = timezone.now().date()
-            start_datetime = timezone.make_aware(
-                datetime.combine(today, datetime.min.time())
-            )
-            end_datetime = timezone.make_aware(
-                datetime.combine(today, datetime.max.time())
-            )
-
-        # Get entries that either:
-        # 1. Entered today (normal case)
-        # 2. Entered yesterday but exited today (overnight parking)
-        today_entries = VehicleEntry.objects.filter(
-            entry_time__gte=start_datetime, entry_time__lte=end_datetime
-        )
-
-        # Also include vehicles that entered yesterday but exited today
-        yesterday_start = timezone.make_aware(
-            datetime.combine(date_obj - timezone.timedelta(days=1), datetime.min.time())
-        )
-        yesterday_end = timezone.make_aware(
-            datetime.combine(date_obj - timezone.timedelta(days=1), datetime.max.time())
-        )
-
-        overnight_entries = VehicleEntry.objects.filter(
-            entry_time__gte=yesterday_start,
-            entry_time__lte=yesterday_end,
-            exit_time__gte=start_datetime,
-            exit_time__lte=end_datetime,
-        )
-
-        # Calculate statistics separately for each queryset
-        today_total = today_entries.count()
-        today_exits = today_entries.filter(exit_time__isnull=False).count()
-        today_inside = today_entries.filter(exit_time__isnull=True).count()
-        today_unpaid = today_entries.filter(
-            is_paid=False, exit_time__isnull=False
-        ).count()
-
-        overnight_total = overnight_entries.count()
-        overnight_exits = overnight_entries.filter(exit_time__isnull=False).count()
-        overnight_inside = overnight_entries.filter(exit_time__isnull=True).count()
-        overnight_unpaid = overnight_entries.filter(
-            is_paid=False, exit_time__isnull=False
-        ).count()
-
-        # Combine the results
-        total_entries = today_total + overnight_total
-        total_exits = today_exits + overnight_exits
-        total_inside = today_inside + overnight_inside
-        unpaid_entries = today_unpaid + overnight_unpaid
-
-        return {
-            "total_entries": total_entries,
-            "total_exits": total_exits,
-            "total_inside": total_inside,
-            "unpaid_entries": unpaid_entries,
-        }
+        return statistics_for(parse_day(date_str))
 
     @database_sync_to_async
     def get_vehicle_entries(self, date_str, search_query=""):
@@ -265,6 +193,8 @@ class HomeConsumer(AsyncWebsocketConsumer):
                     "is_paid": entry.is_paid,
                     "entry_image": entry.entry_image.url if entry.entry_image else None,
                     "exit_image": entry.exit_image.url if entry.exit_image else None,
+                    "entry_thumb": thumbnail_url(entry.entry_image),
+                    "exit_thumb": thumbnail_url(entry.exit_image),
                     "status": "inside"
                     if not entry.exit_time
                     else ("paid" if entry.is_paid else "unpaid"),
@@ -333,72 +263,7 @@ class HomeConsumer(AsyncWebsocketConsumer):
 
     def get_statistics_sync(self, date_str):
         """Synchronous version of get_statistics for use in mark_as_paid"""
-        try:
-            date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
-            start_datetime = timezone.make_aware(
-                datetime.combine(date_obj, datetime.min.time())
-            )
-            end_datetime = timezone.make_aware(
-                datetime.combine(date_obj, datetime.max.time())
-            )
-        except ValueError:
-            today = timezone.now().date()
-            start_datetime = timezone.make_aware(
-                datetime.combine(today, datetime.min.time())
-            )
-            end_datetime = timezone.make_aware(
-                datetime.combine(today, datetime.max.time())
-            )
-
-        # Get entries that either:
-        # 1. Entered today (normal case)
-        # 2. Entered yesterday but exited today (overnight parking)
-        today_entries = VehicleEntry.objects.filter(
-            entry_time__gte=start_datetime, entry_time__lte=end_datetime
-        )
-
-        # Also include vehicles that entered yesterday but exited today
-        yesterday_start = timezone.make_aware(
-            datetime.combine(date_obj - timezone.timedelta(days=1), datetime.min.time())
-        )
-        yesterday_end = timezone.make_aware(
-            datetime.combine(date_obj - timezone.timedelta(days=1), datetime.max.time())
-        )
-
-        overnight_entries = VehicleEntry.objects.filter(
-            entry_time__gte=yesterday_start,
-            entry_time__lte=yesterday_end,
-            exit_time__gte=start_datetime,
-            exit_time__lte=end_datetime,
-        )
-
-        # Calculate statistics separately for each queryset
-        today_total = today_entries.count()
-        today_exits = today_entries.filter(exit_time__isnull=False).count()
-        today_inside = today_entries.filter(exit_time__isnull=True).count()
-        today_unpaid = today_entries.filter(
-            is_paid=False, exit_time__isnull=False
-        ).count()
-
-        overnight_total = overnight_entries.count()
-        overnight_exits = overnight_entries.filter(exit_time__isnull=False).count()
-        overnight_inside = overnight_entries.filter(exit_time__isnull=True).count()
-        overnight_unpaid = overnight_entries.filter(
-            is_paid=False, exit_time__isnull=False
-        ).count()
-
-        # Combine the results
-        total_entries = today_total + overnight_total
-        total_exits = today_exits + overnight_exits
-        total_inside = today_inside + overnight_inside
-        unpaid_entries = today_unpaid + overnight_unpaid
-
-        return {
-            "total_entries": total_entries,
-            "total_exits": total_exits,
-            "total_inside": total_inside,
-            "unpaid_entries": unpaid_entries,
-        }
+        return statistics_for(parse_day(date_str))
 
     def get_vehicle_entries_sync(self, date_str, search_query=""):
         """Synchronous version of get_vehicle_entries for use in mark_as_paid"""
@@ -473,6 +338,8 @@ class HomeConsumer(AsyncWebsocketConsumer):
                     "is_paid": entry.is_paid,
                     "entry_image": entry.entry_image.url if entry.entry_image else None,
                     "exit_image": entry.exit_image.url if entry.exit_image else None,
+                    "entry_thumb": thumbnail_url(entry.entry_image),
+                    "exit_thumb": thumbnail_url(entry.exit_image),
                     "status": "inside"
                     if not entry.exit_time
                     else ("paid" if entry.is_paid else "unpaid"),
@@ -532,6 +399,8 @@ class HomeConsumer(AsyncWebsocketConsumer):
                 "exit_image": latest_entry.exit_image.url
                 if latest_entry.exit_image
                 else None,
+                "entry_thumb": thumbnail_url(latest_entry.entry_image),
+                "exit_thumb": thumbnail_url(latest_entry.exit_image),
             }
         else:
             return None
@@ -599,6 +468,8 @@ class HomeConsumer(AsyncWebsocketConsumer):
                 "exit_image": latest_entry.exit_image.url
                 if latest_entry.exit_image
                 else None,
+                "entry_thumb": thumbnail_url(latest_entry.entry_image),
+                "exit_thumb": thumbnail_url(latest_entry.exit_image),
             }
         else:
             return None
@@ -698,17 +569,7 @@ class HomeConsumer(AsyncWebsocketConsumer):
                 text_data=json.dumps({"type": "exit_time_cleared", "data": result})
             )
 
-            # Send real-time updates to all clients
-            await self.channel_layer.group_send(
-                "home_updates",
-                {
-                    "type": "broadcast_update",
-                    "statistics": result["statistics"],
-                    "vehicle_entries": result["vehicle_entries"],
-                    "action": "exit_time_cleared",
-                    "entry_id": entry_id,
-                },
-            )
+            # Boshqa klientlarga delta post_save signalidan yuboriladi
 
             # Send latest unpaid entry update
             if result["latest_unpaid_entry"]:
@@ -725,6 +586,14 @@ class HomeConsumer(AsyncWebsocketConsumer):
                 text_data=json.dumps({"type": "clear_exit_time_error", "data": result})
             )
 
+    @database_sync_to_async
+    def get_snapshot(self):
+        return build_snapshot()
+
+    async def send_snapshot(self):
+        snapshot = await self.get_snapshot()
+        await self.send(text_data=json.dumps(snapshot))
+
     async def send_statistics(self, date_str):
         stats = await self.get_statistics(date_str)
         await self.send(
@@ -758,17 +627,7 @@ class HomeConsumer(AsyncWebsocketConsumer):
                 text_data=json.dumps({"type": "payment_update", "data": result})
             )
 
-            # Send real-time updates to all clients
-            await self.channel_layer.group_send(
-                "home_updates",
-                {
-                    "type": "broadcast_update",
-                    "statistics": result["statistics"],
-                    "vehicle_entries": result["vehicle_entries"],
-                    "action": "payment_completed",
-                    "entry_id": entry_id,
-                },
-            )
+            # Boshqa klientlarga delta post_save signalidan yuboriladi
 
             # Send latest unpaid entry update
             if result["latest_unpaid_entry"]:
@@ -792,86 +651,20 @@ class HomeConsumer(AsyncWebsocketConsumer):
             )
 
     def print_receipt_to_xprinter_sync(self, entry_id):
-        """Synchronous version of print_receipt_to_xprinter for use in mark_as_paid"""
+        """Queue the receipt on the print spooler; the result comes as print_job_update"""
         try:
             entry = VehicleEntry.objects.get(id=entry_id)
-
-            # Calculate duration
-            if entry.exit_time and entry.entry_time:
-                total_seconds = int(
-                    (entry.exit_time - entry.entry_time).total_seconds()
-                )
-                if total_seconds < 3600:
-                    minutes = (total_seconds + 59) // 60  # ceil to next minute
-                    duration_text = f"{minutes} daqiqa"
-                elif total_seconds < 86400:
-                    hours = total_seconds // 3600
-                    remaining_seconds = total_seconds % 3600
-                    minutes = (remaining_seconds + 59) // 60  # ceil minutes
-                    if minutes == 60:
-                        hours += 1
-                        minutes = 0
-                    if minutes == 0:
-                        duration_text = f"{hours} soat"
-                    else:
-                        duration_text = f"{hours} soat {minutes} daqiqa"
-                else:
-                    days = total_seconds // 86400
-                    remaining_seconds = total_seconds % 86400
-                    hours = remaining_seconds // 3600
-                    remaining_seconds = remaining_seconds % 3600
-                    minutes = (remaining_seconds + 59) // 60  # ceil minutes
-                    if minutes == 60:
-                        hours += 1
-                        minutes = 0
-                    if hours == 24:
-                        days += 1
-                        hours = 0
-                    if hours == 0 and minutes == 0:
-                        duration_text = f"{days} kun"
-                    elif minutes == 0:
-                        duration_text = f"{days} kun {hours} soat"
-                    else:
-                        duration_text = f"{days} kun {hours} soat {minutes} daqiqa"
-            else:
-                duration_text = "0 daqiqa"
-
-            # Import utils dan print_receipt funksiyasini
-            from .utils import print_receipt
-
-            # Chek chiqarish uchun ma'lumotlarni tayyorlash
-            exit_time_str = (
-                entry.exit_time.strftime("%Y-%m-%d %H:%M") if entry.exit_time else "--"
-            )
-            payment_amount_str = (
-                f"{int(entry.total_amount)} so'm" if entry.total_amount else "0 so'm"
-            )
-
-            # print_receipt funksiyasini chaqirish
-            success = print_receipt(
-                printer_name=None,
-                company_name="IDSOFT GROUP",
-                project_name="SMART AUTO PARK",
-                location="URGANCH MARKAZIY DEHQON BOZORI",
-                address="7-SHAX JIZZAX KO'CHA 1-UY",
-                car_number=entry.number_plate,
-                entry_time=entry.entry_time.strftime("%Y-%m-%d %H:%M"),
-                exit_time=exit_time_str,
-                duration=duration_text,
-                payment_amount=payment_amount_str,
-                thank_message="Tashrifingiz uchun Rahmat!",
-            )
-
-            if success:
-                return {
-                    "success": True,
-                    "message": f"Chek {entry.number_plate} uchun muvaffaqiyatli chiqarildi",
-                }
-            else:
-                return {"success": False, "error": "Chek chiqarishda xatolik yuz berdi"}
-
+            job = print_spooler.submit_entry(entry)
+            return {
+                "success": True,
+                "queued": True,
+                "job_id": job.id,
+                "message": f"Chek {entry.number_plate} uchun navbatga qo'shildi",
+            }
         except VehicleEntry.DoesNotExist:
             return {"success": False, "error": "Entry topilmadi"}
+        except PrintQueueFull as e:
+            return {"success": False, "error": str(e)}
         except Exception as e:
             return {"success": False, "error": f"Xatolik: {str(e)}"}
 
@@ -887,6 +680,26 @@ class HomeConsumer(AsyncWebsocketConsumer):
             text_data=json.dumps({"type": "print_receipt_result", "data": result})
         )
 
+    async def handle_retry_print_job(self, job_id):
+        """Resubmit a failed (dead-lettered) print job"""
+        try:
+            job = print_spooler.retry(job_id)
+            result = (
+                {
+                    "success": True,
+                    "queued": True,
+                    "job_id": job.id,
+                    "message": "Chek qayta navbatga qo'shildi",
+                }
+                if job
+                else {"success": False, "error": "Chek topilmadi"}
+            )
+        except PrintQueueFull as e:
+            result = {"success": False, "error": str(e)}
+        await self.send(
+            text_data=json.dumps({"type": "print_receipt_result", "data": result})
+        )
+
     async def handle_print_simple_receipt(self, entry_id):
         """Handle print simple receipt request - same as print_receipt"""
         result = await self.print_receipt_to_xprinter(entry_id)
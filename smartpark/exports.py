@@ -0,0 +1,440 @@
+"""Streaming XLSX/CSV export of VehicleEntry rows.
+
+Rows are read once with ``.iterator()`` as plain tuples and written as
+they arrive, so memory stays flat however many rows are exported. The
+summary (entries, free/paid exits, revenue, inside/exited) is counted
+in the same pass.
+
+CSV is produced by a generator behind ``StreamingHttpResponse``. XLSX
+uses openpyxl's write-only workbook: rows go to a temporary file on
+disk and the finished file is streamed with ``FileResponse``. Since the
+summary is only known after the last row, it is written to its own
+"Statistika" sheet, which is still the first sheet in the file.
+
+The columns come from an ``ExportLayout``: ``DETAILED_LAYOUT`` for the
+detailed entries page, ``DAILY_LAYOUT`` for the one-day export.
+
+Exports of finished days can go through ``export_cache``: the file is
+built once into ``EXPORT_CACHE_DIR`` and later downloads with the same
+filters and the same data are served straight from disk.
+"""
+
+import csv
+import hashlib
+import json
+import os
+import tempfile
+from collections import namedtuple
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Count, Max, Q, Sum
+from django.http import FileResponse, StreamingHttpResponse
+
+EXPORT_FIELDS = ("number_plate", "entry_time", "exit_time", "total_amount", "is_paid")
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+CSV_CONTENT_TYPE = "text/csv; charset=utf-8"
+
+ITERATOR_CHUNK_SIZE = 2000
+
+DEFAULT_EXPORT_CACHE_MAX_FILES = 200
+
+# headers/widths: ustunlar; format_row: qator qiymatlari;
+# styles: (to'langan, chiqqan) -> har bir ustun uchun nomlangan stil
+ExportLayout = namedtuple("ExportLayout", "headers widths format_row styles")
+
+
+def export_rows(entries):
+    """Yield (number_plate, entry_time, exit_time, total_amount, is_paid) once, in chunks."""
+    return entries.values_list(*EXPORT_FIELDS).iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+
+
+def format_detailed_row(number_plate, entry_time, exit_time, total_amount, is_paid):
+    """One table row, formatted like the detailed entries page."""
+    if exit_time:
+        duration_hours = (exit_time - entry_time).total_seconds() / 3600
+        duration_str = f"{duration_hours:.1f} soat"
+    else:
+        duration_str = "Ichkarida"
+    return [
+        number_plate,
+        entry_time.strftime("%Y-%m-%d %H:%M") if entry_time else "",
+        exit_time.strftime("%Y-%m-%d %H:%M") if exit_time else "",
+        duration_str,
+        total_amount or 0,
+        "To'langan" if is_paid else "To'lanmagan",
+        "Ichkarida" if not exit_time else "Chiqib ketgan",
+    ]
+
+
+def format_daily_row(number_plate, entry_time, exit_time, total_amount, is_paid):
+    """One row of the one-day export: times only and a single status column."""
+    if not exit_time:
+        status = "Ichkarida"
+    else:
+        status = "To'langan" if is_paid else "To'lanmagan"
+    return [
+        number_plate,
+        entry_time.strftime("%H:%M") if entry_time else "",
+        exit_time.strftime("%H:%M") if exit_time else "",
+        total_amount or 0,
+        status,
+    ]
+
+
+DETAILED_LAYOUT = ExportLayout(
+    headers=[
+        "Avtomobil raqami",
+        "Kirish vaqti",
+        "Chiqish vaqti",
+        "Davomiyligi",
+        "To'lov miqdori (so'm)",
+        "To'lov holati",
+        "Holat",
+    ],
+    # Ustun kengliklari (write-only rejimda oldindan berilishi shart)
+    widths=[18, 18, 18, 14, 22, 15, 15],
+    format_row=format_detailed_row,
+    # oxirgi ikki ustun holat bo'yicha rangli
+    styles={
+        (paid, exited): ["export_cell"] * 5
+        + [
+            "export_green" if paid else "export_red",
+            "export_green" if exited else "export_yellow",
+        ]
+        for paid in (False, True)
+        for exited in (False, True)
+    },
+)
+
+DAILY_LAYOUT = ExportLayout(
+    headers=[
+        "Avtomobil raqami",
+        "Kirish vaqti",
+        "Chiqish vaqti",
+        "To'lov miqdori (so'm)",
+        "Holati",
+    ],
+    widths=[18, 14, 14, 22, 15],
+    format_row=format_daily_row,
+    # Holati: ichkarida - sariq, to'langan - yashil, to'lanmagan - qizil
+    styles={
+        (paid, exited): ["export_cell"] * 4
+        + ["export_yellow" if not exited else "export_green" if paid else "export_red"]
+        for paid in (False, True)
+        for exited in (False, True)
+    },
+)
+
+
+class ExportSummary:
+    """Summary counters filled while the rows are written."""
+
+    __slots__ = (
+        "total_entries",
+        "free_exits",
+        "paid_exits",
+        "total_revenue",
+        "inside_count",
+    )
+
+    def __init__(self):
+        self.total_entries = 0
+        self.free_exits = 0
+        self.paid_exits = 0
+        self.total_revenue = 0
+        self.inside_count = 0
+
+    def add(self, exit_time, total_amount):
+        self.total_entries += 1
+        if not exit_time:
+            self.inside_count += 1
+        elif total_amount and total_amount > 0:
+            self.paid_exits += 1
+            self.total_revenue += total_amount
+        elif not total_amount:
+            self.free_exits += 1
+
+    @property
+    def exited_count(self):
+        return self.total_entries - self.inside_count
+
+    def rows(self):
+        return [
+            ("Jami kirishlar:", self.total_entries),
+            ("Bepul chiqishlar (0 so'm):", self.free_exits),
+            ("To'lovli chiqishlar:", self.paid_exits),
+            ("Jami tushum:", f"{self.total_revenue:,} so'm"),
+            ("Ichkarida qolganlar:", self.inside_count),
+            ("Chiqib ketganlar:", self.exited_count),
+        ]
+
+
+class _Echo:
+    """csv.writer uchun: yozilgan qatorni qaytaradi"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows, summary, layout=DETAILED_LAYOUT):
+    writer = csv.writer(_Echo())
+    # Excel UTF-8 ni to'g'ri ochishi uchun BOM
+    yield "\ufeff" + writer.writerow(layout.headers)
+    for number_plate, entry_time, exit_time, total_amount, is_paid in rows:
+        summary.add(exit_time, total_amount)
+        yield writer.writerow(
+            layout.format_row(
+                number_plate, entry_time, exit_time, total_amount, is_paid
+            )
+        )
+    yield writer.writerow([])
+    for label, value in summary.rows():
+        yield writer.writerow([label, value])
+
+
+def write_csv(rows, output, layout=DETAILED_LAYOUT):
+    """Write ``rows`` into a binary file as UTF-8 CSV; returns the summary."""
+    summary = ExportSummary()
+    for line in iter_csv(rows, summary, layout):
+        output.write(line.encode("utf-8"))
+    return summary
+
+
+def csv_response(entries, filename, layout=DETAILED_LAYOUT):
+    """CSV export streamed row by row."""
+    response = StreamingHttpResponse(
+        iter_csv(export_rows(entries), ExportSummary(), layout),
+        content_type=CSV_CONTENT_TYPE,
+    )
+    response["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
+
+
+def write_xlsx(rows, output, title, date_str=None, layout=DETAILED_LAYOUT):
+    """Write ``rows`` into ``output`` (path or binary file) as XLSX; returns the summary."""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+    from openpyxl.utils import get_column_letter
+
+    def solid(color):
+        return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+    wb = Workbook(write_only=True)
+
+    # Stillar bir marta ro'yxatdan o'tadi: har bir katak uchun Font/Fill
+    # obyektlarini qayta hash qilish eksportning eng sekin qismi edi
+    thin = Side(style="thin")
+    boxed = {
+        "border": Border(left=thin, right=thin, top=thin, bottom=thin),
+        "alignment": Alignment(horizontal="center", vertical="center"),
+    }
+    for name, extra in (
+        (
+            "export_header",
+            {"font": Font(bold=True, color="FFFFFF"), "fill": solid("366092")},
+        ),
+        ("export_cell", {}),
+        ("export_green", {"fill": solid("C6EFCE")}),
+        ("export_red", {"fill": solid("FFC7CE")}),
+        ("export_yellow", {"fill": solid("FFEB9C")}),
+    ):
+        wb.add_named_style(NamedStyle(name=name, **boxed, **extra))
+
+    stats_ws = wb.create_sheet("Statistika")
+    ws = wb.create_sheet("Batafsil yozuvlar")
+    for index, width in enumerate(layout.widths, 1):
+        ws.column_dimensions[get_column_letter(index)].width = width
+    stats_ws.column_dimensions["A"].width = 30
+    stats_ws.column_dimensions["B"].width = 20
+
+    def cell(sheet, value, style=None, font=None, fill=None):
+        c = WriteOnlyCell(sheet, value=value)
+        if style is not None:
+            c.style = style
+        if font is not None:
+            c.font = font
+        if fill is not None:
+            c.fill = fill
+        return c
+
+    ws.append([cell(ws, header, "export_header") for header in layout.headers])
+
+    summary = ExportSummary()
+    for number_plate, entry_time, exit_time, total_amount, is_paid in rows:
+        summary.add(exit_time, total_amount)
+        values = layout.format_row(
+            number_plate, entry_time, exit_time, total_amount, is_paid
+        )
+        styles = layout.styles[bool(is_paid), bool(exit_time)]
+        ws.append([cell(ws, value, style) for value, style in zip(values, styles)])
+
+    stats_ws.append(
+        [cell(stats_ws, f"SMART AUTOPARK - {title}", font=Font(bold=True, size=16))]
+    )
+    stats_ws.merged_cells.add("A1:D1")
+    if date_str:
+        stats_ws.append(
+            [cell(stats_ws, f"Sana: {date_str}", font=Font(bold=True, size=12))]
+        )
+        stats_ws.merged_cells.add("A2:D2")
+    stats_ws.append([])
+    heading = cell(
+        stats_ws,
+        "KUNLIK STATISTIKA",
+        font=Font(bold=True, size=14),
+        fill=solid("E7E6E6"),
+    )
+    stats_ws.append([heading])
+    bold = Font(bold=True)
+    for label, value in summary.rows():
+        value_font = (
+            Font(bold=True, color="008000") if "tushum" in label.lower() else bold
+        )
+        stats_ws.append(
+            [cell(stats_ws, label, font=bold), cell(stats_ws, value, font=value_font)]
+        )
+
+    wb.save(output)
+    return summary
+
+
+def xlsx_response(entries, filename, title, date_str=None, layout=DETAILED_LAYOUT):
+    """XLSX export built on disk with constant memory and streamed back."""
+    output = tempfile.TemporaryFile(suffix=".xlsx")
+    try:
+        write_xlsx(export_rows(entries), output, title, date_str, layout)
+        output.seek(0)
+    except Exception:
+        output.close()
+        raise
+    # FileResponse faylni bo'laklab yuboradi va oxirida yopadi (vaqtinchalik fayl o'chadi)
+    return FileResponse(
+        output, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE
+    )
+
+
+def export_fingerprint(entries):
+    """What stands in for "last modified" of ``entries``, in one aggregate query.
+
+    VehicleEntry has no ``updated_at``; a new or deleted row, an exit or a
+    payment changes at least one of these values.
+    """
+    values = entries.order_by().aggregate(
+        rows=Count("id"),
+        last_id=Max("id"),
+        exits=Count("exit_time"),
+        last_exit=Max("exit_time"),
+        paid=Count("id", filter=Q(is_paid=True)),
+        amount=Sum("total_amount"),
+    )
+    return sorted(values.items())
+
+
+class ExportCache:
+    """Finished export files on disk, keyed by (filters, format, data fingerprint).
+
+    A changed fingerprint gives a new key, so stale files are never served;
+    they just age out once the directory holds more than
+    ``EXPORT_CACHE_MAX_FILES`` files (least recently served first).
+    """
+
+    def __init__(self, directory=None, max_files=None):
+        self._directory = directory
+        self._max_files = max_files
+
+    @property
+    def directory(self):
+        return Path(
+            self._directory
+            or getattr(settings, "EXPORT_CACHE_DIR", None)
+            or Path(settings.BASE_DIR) / "export_cache"
+        )
+
+    @property
+    def max_files(self):
+        return self._max_files or getattr(
+            settings, "EXPORT_CACHE_MAX_FILES", DEFAULT_EXPORT_CACHE_MAX_FILES
+        )
+
+    def key(self, params, fingerprint):
+        signature = json.dumps([sorted(params.items()), fingerprint], default=str)
+        return hashlib.sha256(signature.encode()).hexdigest()
+
+    def file_for(self, key, extension, build):
+        """(path, hit) for ``key``; on a miss ``build(output)`` writes the file first."""
+        directory = self.directory
+        path = directory / f"{key}.{extension}"
+        if path.exists():
+            # Oxirgi foydalanish vaqti - tozalashda eng eskilari o'chadi
+            os.utime(path)
+            return path, True
+
+        directory.mkdir(parents=True, exist_ok=True)
+        # Boshqa so'rov yarim yozilgan faylni ko'rmasligi uchun: avval .part, keyin rename
+        fd, part = tempfile.mkstemp(dir=directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as output:
+                build(output)
+            os.replace(part, path)
+        except BaseException:
+            try:
+                os.unlink(part)
+            except FileNotFoundError:
+                pass
+            raise
+        self.prune()
+        return path, False
+
+    def prune(self):
+        files = [path for path in self.directory.iterdir() if path.suffix != ".part"]
+        if len(files) <= self.max_files:
+            return
+        files.sort(key=lambda path: path.stat().st_mtime)
+        for path in files[: len(files) - self.max_files]:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def response(
+        self,
+        entries,
+        filename,
+        export_format,
+        params,
+        title,
+        date_str=None,
+        layout=DETAILED_LAYOUT,
+    ):
+        """Serve the export of ``entries`` from disk, building it on the first request."""
+        if export_format == "csv":
+            content_type = CSV_CONTENT_TYPE
+
+            def build(output):
+                write_csv(export_rows(entries), output, layout)
+
+        else:
+            content_type = XLSX_CONTENT_TYPE
+
+            def build(output):
+                write_xlsx(export_rows(entries), output, title, date_str, layout)
+
+        key = self.key(
+            dict(params, format=export_format, layout=layout.headers),
+            export_fingerprint(entries),
+        )
+        path, hit = self.file_for(key, export_format, build)
+        response = FileResponse(
+            open(path, "rb"),
+            as_attachment=True,
+            filename=filename,
+            content_type=content_type,
+        )
+        response["X-Export-Cache"] = "hit" if hit else "miss"
+        return response
+
+
+export_cache = ExportCache()
@@ -0,0 +1,510 @@
+"""Durable outbox for Unikassa sales.
+
+``fiscal_outbox.enqueue(payload, entry_id)`` stores the sale as a
+``FiscalOutbox`` row and returns at once; the cashier never waits for
+the fiscal API. A background thread sends the due rows through
+``unikassa`` after the row is committed:
+
+- due rows are taken in batches of ``FISCAL_BATCH_SIZE``; each row is
+  claimed with a conditional UPDATE (pending -> sending), so several
+  threads or processes never send the same sale twice at once;
+- a batch is posted ``FISCAL_CONCURRENCY`` sales at a time over the
+  client's keep-alive pool; the outcome is saved on the outbox rows and
+  reconciled onto ``VehicleEntry.fiscal_*``;
+- ``FiscalUnavailable`` (the sale did not reach the API) puts the row
+  back to pending with a doubling delay (``FISCAL_RETRY_DELAY`` ..
+  ``FISCAL_RETRY_MAX_DELAY``); after ``FISCAL_MAX_ATTEMPTS`` tries, or
+  on ``FiscalRejected``, it is failed;
+- ``FiscalUncertain`` (read timeout, unreadable answer) and a row left
+  in "sending" by a crashed process for ``FISCAL_SENDING_TIMEOUT``
+  seconds both mean the sale may already be registered. Such rows go to
+  "review" and are never re-sent automatically - the operator checks
+  the fiscal module and re-queues them (admin) only if the sale is not
+  there, so no sale gets two receipts.
+
+Sent receipts are printed and every final result is announced to the
+home page. Rows survive restarts; the ``fiscal_outbox`` scheduler job
+wakes the sender to pick them up. ``status()`` reports the queue and the
+latency / failure figures of the last ``FISCAL_BATCH_HISTORY`` batches.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from .broadcast import GROUP_NAME
+from .unikassa import FiscalError, FiscalRejected, FiscalUncertain, unikassa
+
+DEFAULT_MAX_ATTEMPTS = 20
+DEFAULT_RETRY_DELAY = 5  # s, har urinishda ikki baravar
+DEFAULT_RETRY_MAX_DELAY = 600
+DEFAULT_SENDING_TIMEOUT = 300
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_CONCURRENCY = 4
+DEFAULT_BATCH_HISTORY = 50
+IDLE_SECONDS = 30
+
+
+class BatchMetrics:
+    """Latency and failure figures of the recent outbox batches."""
+
+    def __init__(self, history=DEFAULT_BATCH_HISTORY):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=history)
+        self.batches = 0
+        self.sent = 0
+        self.deferred = 0
+        self.failed = 0
+        self.review = 0
+
+    def record(self, started, seconds, latencies, sent, deferred, failed, review=0):
+        latencies = sorted(latencies)
+        batch = {
+            "started": started.isoformat(),
+            "size": len(latencies),
+            "sent": sent,
+            "deferred": deferred,
+            "failed": failed,
+            "review": review,
+            "seconds": round(seconds, 3),
+            "sale_p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+            "sale_max_ms": round(latencies[-1] * 1000, 1),
+        }
+        with self._lock:
+            self._recent.append(batch)
+            self.batches += 1
+            self.sent += sent
+            self.deferred += deferred
+            self.failed += failed
+            self.review += review
+        return batch
+
+    def snapshot(self):
+        with self._lock:
+            recent = list(self._recent)
+            totals = {
+                "batches": self.batches,
+                "sent": self.sent,
+                "deferred": self.deferred,
+                "failed": self.failed,
+                "review": self.review,
+            }
+        seconds = [batch["seconds"] for batch in recent]
+        return {
+            "totals": totals,
+            "recent_avg_seconds": round(sum(seconds) / len(seconds), 3)
+            if seconds
+            else None,
+            "recent_failure_rate": (
+                round(
+                    sum(b["deferred"] + b["failed"] + b["review"] for b in recent)
+                    / sum(b["size"] for b in recent),
+                    3,
+                )
+                if recent
+                else None
+            ),
+            "last": recent[-1] if recent else None,
+            "recent": recent,
+        }
+
+
+class OutboxWorker:
+    """Sends pending ``FiscalOutbox`` rows in a background thread."""
+
+    def __init__(
+        self,
+        client=None,
+        max_attempts=None,
+        retry_delay=None,
+        retry_max_delay=None,
+        batch_size=None,
+        concurrency=None,
+        on_sent=None,
+    ):
+        self._client = client
+        self._max_attempts = max_attempts
+        self._retry_delay = retry_delay
+        self._retry_max_delay = retry_max_delay
+        self._batch_size = batch_size
+        self._concurrency = concurrency
+        self._on_sent = on_sent
+        self._metrics = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._worker = None
+
+    def _setting(self, value, name, default):
+        return value if value is not None else getattr(settings, name, default)
+
+    @property
+    def client(self):
+        return self._client or unikassa
+
+    @property
+    def metrics(self):
+        if self._metrics is None:
+            self._metrics = BatchMetrics(
+                self._setting(None, "FISCAL_BATCH_HISTORY", DEFAULT_BATCH_HISTORY)
+            )
+        return self._metrics
+
+    def enqueue(self, payload, entry_id=None):
+        """Store a sale; it is sent after the surrounding transaction commits."""
+        from .models import FiscalOutbox, FiscalStatus
+
+        row = FiscalOutbox.objects.create(entry_id=entry_id, payload=payload)
+        if entry_id is not None:
+            self._mark_entries([entry_id], FiscalStatus.PENDING)
+        transaction.on_commit(self.wake)
+        return row
+
+    def wake(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="fiscal-outbox", daemon=True
+                )
+                self._worker.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            # Bu thread so'rov siklidan tashqarida: eskirgan ulanishlarni o'zimiz yopamiz
+            close_old_connections()
+            try:
+                self.flush()
+                delay = self.seconds_until_due()
+            except Exception as e:
+                print("[FISCAL OUTBOX ERROR]:", e)
+                delay = IDLE_SECONDS
+            finally:
+                close_old_connections()
+            self._wake.wait(delay)
+
+    def due_ids(self, limit=None):
+        from .models import FiscalOutbox, FiscalStatus
+
+        ids = (
+            FiscalOutbox.objects.filter(
+                status=FiscalStatus.PENDING, next_attempt_at__lte=timezone.now()
+            )
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        return list(ids[:limit] if limit else ids)
+
+    def seconds_until_due(self):
+        from .models import FiscalOutbox, FiscalStatus
+
+        next_at = FiscalOutbox.objects.filter(status=FiscalStatus.PENDING).aggregate(
+            next_at=Min("next_attempt_at")
+        )["next_at"]
+        if next_at is None:
+            return IDLE_SECONDS
+        return max(0.0, min((next_at - timezone.now()).total_seconds(), IDLE_SECONDS))
+
+    def claim(self, row_id):
+        """Take a pending row for sending; False if someone else has it."""
+        from .models import FiscalOutbox, FiscalStatus
+
+        return bool(
+            FiscalOutbox.objects.filter(id=row_id, status=FiscalStatus.PENDING).update(
+                status=FiscalStatus.SENDING, claimed_at=timezone.now()
+            )
+        )
+
+    def recover_stale(self):
+        """Move rows stuck in "sending" (crashed sender) to manual review."""
+        from .models import FiscalOutbox, FiscalStatus
+
+        timeout = self._setting(None, "FISCAL_SENDING_TIMEOUT", DEFAULT_SENDING_TIMEOUT)
+        rows = FiscalOutbox.objects.filter(
+            status=FiscalStatus.SENDING,
+            claimed_at__lt=timezone.now() - timedelta(seconds=timeout),
+        )
+        # Yuborish paytida to'xtagan: chek ro'yxatga olingan bo'lishi mumkin
+        self._mark_entries(
+            rows.exclude(entry=None).values_list("entry_id", flat=True),
+            FiscalStatus.REVIEW,
+        )
+        count = rows.update(
+            status=FiscalStatus.REVIEW,
+            last_error="Yuborish tugamadi (jarayon to'xtagan), qo'lda tekshiring",
+        )
+        if count:
+            self._notify(
+                "⚠️ Soliq cheklarini tekshiring",
+                f"{count} ta savdo yuborilayotganda to'xtadi; qayta yuborishdan oldin tekshiring",
+                "warning",
+            )
+        return count
+
+    def flush(self, limit=None):
+        """Send every due row once, batch by batch; returns how many were sent."""
+        self.recover_stale()
+        batch_size = self._setting(
+            self._batch_size, "FISCAL_BATCH_SIZE", DEFAULT_BATCH_SIZE
+        )
+        sent = taken = 0
+        while limit is None or taken < limit:
+            due = self.due_ids(
+                batch_size if limit is None else min(batch_size, limit - taken)
+            )
+            if not due:
+                break
+            claimed = [row_id for row_id in due if self.claim(row_id)]
+            taken += len(due)
+            if claimed:
+                sent += self.send_batch(claimed)
+        return sent
+
+    def send(self, row_id):
+        """Send one claimed row and record the outcome; True if it was sent."""
+        return self.send_batch([row_id]) == 1
+
+    def send_batch(self, row_ids):
+        """Post claimed rows concurrently, record and reconcile the outcomes."""
+        from .models import FiscalOutbox, FiscalStatus
+
+        rows = list(FiscalOutbox.objects.filter(id__in=row_ids).order_by("id"))
+        if not rows:
+            return 0
+        concurrency = self._setting(
+            self._concurrency, "FISCAL_CONCURRENCY", DEFAULT_CONCURRENCY
+        )
+        started_at = timezone.now()
+        started = time.perf_counter()
+        if len(rows) == 1 or concurrency <= 1:
+            results = [self._post(row) for row in rows]
+        else:
+            # Faqat HTTP parallel; DB ga yozish shu threadda (ulanishlar threadga bog'liq)
+            with ThreadPoolExecutor(
+                min(concurrency, len(rows)), thread_name_prefix="fiscal-send"
+            ) as pool:
+                results = list(pool.map(self._post, rows))
+        seconds = time.perf_counter() - started
+
+        for row, (response, error, _) in zip(rows, results):
+            if error is None:
+                self.record_sent(row, response)
+            elif isinstance(error, FiscalUncertain):
+                self.record_uncertain(row, error)
+            else:
+                self.record_failure(
+                    row, error, retry=not isinstance(error, FiscalRejected)
+                )
+        self.reconcile(rows)
+
+        outcome = [row.status for row in rows]
+        self.metrics.record(
+            started_at,
+            seconds,
+            [latency for _, _, latency in results],
+            sent=outcome.count(FiscalStatus.SENT),
+            deferred=outcome.count(FiscalStatus.PENDING),
+            failed=outcome.count(FiscalStatus.FAILED),
+            review=outcome.count(FiscalStatus.REVIEW),
+        )
+        return outcome.count(FiscalStatus.SENT)
+
+    def _post(self, row):
+        """(response, error, seconds) for one sale; never raises."""
+        started = time.perf_counter()
+        try:
+            response, error = self.client.send_sale(row.payload), None
+        except FiscalError as e:
+            response, error = None, e
+        except Exception as e:
+            # Kutilmagan xato: so'rov yetib borganmi noma'lum - qayta yubormaymiz
+            response, error = None, FiscalUncertain(f"{type(e).__name__}: {e}")
+        return response, error, time.perf_counter() - started
+
+    def reconcile(self, rows):
+        """Copy final outcomes of ``rows`` onto their ``VehicleEntry``."""
+        from .models import FiscalStatus, VehicleEntry
+
+        entries = []
+        for row in rows:
+            if row.entry_id is None or row.status not in (
+                FiscalStatus.SENT,
+                FiscalStatus.FAILED,
+                FiscalStatus.REVIEW,
+            ):
+                continue
+            response = row.response if isinstance(row.response, dict) else {}
+            entries.append(
+                VehicleEntry(
+                    id=row.entry_id,
+                    fiscal_status=row.status,
+                    fiscal_receipt=str(response.get("ReceiptSeq", ""))[:20],
+                    fiscal_sign=str(response.get("FiscalSign", ""))[:64],
+                )
+            )
+        if entries:
+            # O'chirilgan yozuvlar uchun UPDATE hech narsa qilmaydi
+            VehicleEntry.objects.bulk_update(
+                entries, ["fiscal_status", "fiscal_receipt", "fiscal_sign"]
+            )
+        return len(entries)
+
+    def _mark_entries(self, entry_ids, status):
+        from .models import VehicleEntry
+
+        VehicleEntry.objects.filter(id__in=entry_ids).update(fiscal_status=status)
+
+    def record_sent(self, row, response):
+        from .models import FiscalStatus
+
+        row.status = FiscalStatus.SENT
+        row.attempts += 1
+        row.response = response
+        row.sent_at = timezone.now()
+        row.last_error = ""
+        row.save(
+            update_fields=["status", "attempts", "response", "sent_at", "last_error"]
+        )
+        self._after_sent(row)
+
+    def record_failure(self, row, error, retry):
+        from .models import FiscalStatus
+
+        row.attempts += 1
+        row.last_error = str(error)[:1000]
+        max_attempts = self._setting(
+            self._max_attempts, "FISCAL_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS
+        )
+        if retry and row.attempts < max_attempts:
+            row.status = FiscalStatus.PENDING
+            row.next_attempt_at = timezone.now() + timedelta(
+                seconds=self.retry_delay(row.attempts)
+            )
+        else:
+            row.status = FiscalStatus.FAILED
+            print(f"[FISCAL ERROR]: #{row.id}: {error}")
+            self._notify(
+                "❌ Soliq cheki yuborilmadi",
+                f"Savdo #{row.id}: {row.last_error}",
+                "error",
+            )
+        row.save(update_fields=["status", "attempts", "last_error", "next_attempt_at"])
+
+    def record_uncertain(self, row, error):
+        """The API may have registered the sale: park the row for the operator."""
+        from .models import FiscalStatus
+
+        row.attempts += 1
+        row.status = FiscalStatus.REVIEW
+        row.last_error = str(error)[:1000]
+        print(f"[FISCAL REVIEW]: #{row.id}: {error}")
+        self._notify(
+            "⚠️ Soliq chekini tekshiring",
+            f"Savdo #{row.id}: Unikassa javob bermadi, chek chiqqan bo'lishi mumkin. "
+            "Tekshirib, kerak bo'lsa qayta yuboring",
+            "warning",
+        )
+        row.save(update_fields=["status", "attempts", "last_error"])
+
+    def retry_delay(self, attempts):
+        delay = self._setting(
+            self._retry_delay, "FISCAL_RETRY_DELAY", DEFAULT_RETRY_DELAY
+        )
+        max_delay = self._setting(
+            self._retry_max_delay, "FISCAL_RETRY_MAX_DELAY", DEFAULT_RETRY_MAX_DELAY
+        )
+        return min(delay * 2 ** (attempts - 1), max_delay)
+
+    def retry_failed(self, ids=None):
+        """Put failed rows back in the queue (all, or only ``ids``).
+
+        Rows in review are re-queued only when named in ``ids``: the
+        operator has checked that the sale was not registered.
+        """
+        from .models import FiscalOutbox, FiscalStatus
+
+        if ids is None:
+            rows = FiscalOutbox.objects.filter(status=FiscalStatus.FAILED)
+        else:
+            rows = FiscalOutbox.objects.filter(
+                id__in=ids, status__in=[FiscalStatus.FAILED, FiscalStatus.REVIEW]
+            )
+        self._mark_entries(
+            rows.exclude(entry=None).values_list("entry_id", flat=True),
+            FiscalStatus.PENDING,
+        )
+        count = rows.update(
+            status=FiscalStatus.PENDING, attempts=0, next_attempt_at=timezone.now()
+        )
+        if count:
+            transaction.on_commit(self.wake)
+        return count
+
+    def confirm_sent(self, ids):
+        """Close review rows the operator found registered in the fiscal module."""
+        from .models import FiscalOutbox, FiscalStatus
+
+        rows = FiscalOutbox.objects.filter(id__in=ids, status=FiscalStatus.REVIEW)
+        self._mark_entries(
+            rows.exclude(entry=None).values_list("entry_id", flat=True),
+            FiscalStatus.SENT,
+        )
+        return rows.update(status=FiscalStatus.SENT, sent_at=timezone.now())
+
+    def _after_sent(self, row):
+        if self._on_sent is not None:
+            self._on_sent(row)
+            return
+        from .view_unikassa import print_receipt_from_unikassa
+
+        try:
+            print_receipt_from_unikassa(row.response, row.entry_id)
+        except Exception as e:
+            print("[FISCAL PRINT ERROR]:", e)
+
+    def _notify(self, title, message, notification_type):
+        try:
+            async_to_sync(get_channel_layer().group_send)(
+                GROUP_NAME,
+                {
+                    "type": "broadcast_notification",
+                    "title": title,
+                    "message": message,
+                    "notification_type": notification_type,
+                    "timestamp": timezone.now().isoformat(),
+                },
+            )
+        except Exception as e:
+            print("[FISCAL OUTBOX ERROR]:", e)
+
+    def status(self):
+        from .models import FiscalOutbox, FiscalStatus
+
+        counts = dict(
+            FiscalOutbox.objects.values_list("status")
+            .annotate(n=Count("id"))
+            .order_by()
+        )
+        oldest = FiscalOutbox.objects.filter(status=FiscalStatus.PENDING).aggregate(
+            oldest=Min("created_at")
+        )["oldest"]
+        return {
+            "counts": {status: counts.get(status, 0) for status in FiscalStatus.values},
+            "oldest_pending": oldest.isoformat() if oldest else None,
+            "running": self._worker is not None and self._worker.is_alive(),
+            "requests": self.client.requests,
+            "retried": self.client.retried,
+            "batches": self.metrics.snapshot(),
+        }
+
+
+fiscal_outbox = OutboxWorker()
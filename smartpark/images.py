@@ -0,0 +1,220 @@
+"""Camera image storage: off-request writes, content-hash names, thumbnails.
+
+``image_store.save("entries", plate, data, day)`` returns the storage
+name at once and the JPEG is written by a small pool of background
+threads (``IMAGE_WRITE_WORKERS``; Pillow releases the GIL while it
+decodes and encodes), so the entry/exit transaction no longer waits for
+the disk. The name is assigned to the
+ImageField as a plain string (``entry.entry_image = name``).
+
+- Names are sharded by day and carry a content hash
+  (``entries/2026/10/17/01A123BC_9f86d081884c7d65.jpg``): a frame the
+  camera sends twice for the same plate is stored once, and a whole day
+  can be dropped by ``retention`` without touching other days.
+- Each original gets a small WebP thumbnail under ``thumbs/`` for the
+  list views; ``thumbnail_url()`` points at ``image_thumbnail``, which
+  also builds a missing thumbnail on demand (old images, queue lag).
+- Until the writer catches up, the bytes are kept in memory and served
+  from there. If the queue is full the image is written in the caller.
+"""
+
+import hashlib
+import io
+import posixpath
+import queue
+import threading
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from PIL import Image, features
+
+DEFAULT_QUEUE_SIZE = 200
+DEFAULT_WORKERS = 2
+DEFAULT_THUMB_SIZE = (240, 180)
+DEFAULT_THUMB_QUALITY = 70
+HASH_LENGTH = 16
+THUMBS_DIR = "thumbs"
+
+THUMB_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+THUMB_EXTENSION = ".webp" if THUMB_FORMAT == "WEBP" else ".jpg"
+THUMB_CONTENT_TYPE = "image/webp" if THUMB_FORMAT == "WEBP" else "image/jpeg"
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def day_directory(prefix, day):
+    """``entries/2026/10/17`` - images are sharded by the day they were taken."""
+    return posixpath.join(prefix, day.strftime("%Y/%m/%d"))
+
+
+def image_name(prefix, number_plate, data, day):
+    """Storage name of a camera JPEG; equal bytes on one day give an equal name."""
+    plate = "".join(ch for ch in (number_plate or "") if ch.isalnum()) or "NOMALUM"
+    return posixpath.join(
+        day_directory(prefix, day), f"{plate}_{content_hash(data)}.jpg"
+    )
+
+
+def thumbnail_name(name):
+    stem, _ = posixpath.splitext(name)
+    return posixpath.join(THUMBS_DIR, stem + THUMB_EXTENSION)
+
+
+def make_thumbnail(data, size=None, quality=None):
+    """Small WebP (or JPEG) copy of ``data``."""
+    size = size or getattr(settings, "IMAGE_THUMB_SIZE", DEFAULT_THUMB_SIZE)
+    quality = quality or getattr(settings, "IMAGE_THUMB_QUALITY", DEFAULT_THUMB_QUALITY)
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEG ni o'qishda kichraytiradi - to'liq o'lchamda dekodlanmaydi
+        image.draft("RGB", (size[0] * 2, size[1] * 2))
+        image = image.convert("RGB")
+        image.thumbnail(size)
+        output = io.BytesIO()
+        image.save(output, THUMB_FORMAT, quality=quality)
+    return output.getvalue()
+
+
+def thumbnail_url(field_file):
+    """URL of the thumbnail for an ImageField value, or None."""
+    if not field_file:
+        return None
+    return reverse("image_thumbnail", args=[field_file.name])
+
+
+class ImageStore:
+    """Writes camera images in background threads."""
+
+    def __init__(self, storage=None, maxsize=None, workers=None):
+        self._storage = storage
+        self._maxsize = maxsize
+        self._workers = workers
+        self._queue = None
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pending = {}
+        self.written = 0
+        self.deduplicated = 0
+
+    @property
+    def storage(self):
+        return self._storage or default_storage
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._queue is None:
+                maxsize = self._maxsize or getattr(
+                    settings, "IMAGE_QUEUE_SIZE", DEFAULT_QUEUE_SIZE
+                )
+                self._queue = queue.Queue(maxsize=maxsize)
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            workers = self._workers or getattr(
+                settings, "IMAGE_WRITE_WORKERS", DEFAULT_WORKERS
+            )
+            while len(self._threads) < workers:
+                thread = threading.Thread(
+                    target=self._run,
+                    name=f"image-store-{len(self._threads)}",
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def save(self, prefix, number_plate, data, day):
+        """Queue ``data`` for writing; returns its storage name (None without data)."""
+        if data is None:
+            return None
+        name = image_name(prefix, number_plate, data, day)
+        if not getattr(settings, "IMAGE_WRITE_ASYNC", True):
+            self._write(name, data)
+            return name
+        with self._lock:
+            if name in self._pending:
+                self.deduplicated += 1
+                return name
+            self._pending[name] = data
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(name)
+        except queue.Full:
+            # Disk sekin: so'rovning o'zida yoziladi, rasm yo'qolmaydi
+            print("[IMAGE STORE]: navbat to'la, rasm darhol yoziladi")
+            self._write_pending(name)
+        return name
+
+    def pending(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def join(self):
+        """Wait until every queued image is written."""
+        if self._queue is not None:
+            self._queue.join()
+
+    def read(self, name):
+        """Bytes of an original, from memory if it is not written yet."""
+        data = self._pending.get(name)
+        if data is not None:
+            return bytes(data)
+        with self.storage.open(name, "rb") as f:
+            return f.read()
+
+    def thumbnail(self, name):
+        """Thumbnail bytes of ``name``; built and stored on first request."""
+        thumb = thumbnail_name(name)
+        storage = self.storage
+        if storage.exists(thumb):
+            with storage.open(thumb, "rb") as f:
+                return f.read()
+        data = make_thumbnail(self.read(name))
+        if name not in self._pending:
+            self._store(thumb, data)
+        return data
+
+    def _run(self):
+        while True:
+            name = self._queue.get()
+            try:
+                self._write_pending(name)
+            except Exception as e:
+                print("[IMAGE STORE ERROR]:", e)
+            finally:
+                self._queue.task_done()
+
+    def _write_pending(self, name):
+        data = self._pending.get(name)
+        if data is None:
+            return
+        try:
+            self._write(name, data)
+        finally:
+            with self._lock:
+                self._pending.pop(name, None)
+
+    def _write(self, name, data):
+        if not self._store(name, data):
+            self.deduplicated += 1
+            return
+        self.written += 1
+        try:
+            self._store(thumbnail_name(name), make_thumbnail(data))
+        except Exception as e:
+            # Buzilgan JPEG: asl rasm saqlanadi, kichik nusxa bo'lmaydi
+            print("[THUMBNAIL ERROR]:", name, e)
+
+    def _store(self, name, data):
+        """Write ``data`` under exactly ``name``; False if it already exists."""
+        storage = self.storage
+        if storage.exists(name):
+            return False
+        saved = storage.save(name, ContentFile(bytes(data)))
+        if saved != name:
+            # Bir vaqtda boshqa jarayon yozib ulgurgan - nusxa kerak emas
+            storage.delete(saved)
+            return False
+        return True
+
+
+image_store = ImageStore()
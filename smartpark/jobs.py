@@ -0,0 +1,56 @@
+"""Background jobs run by ``scheduler`` on the leader worker."""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .scheduler import scheduler
+
+STALE_ENTRY_DAYS = 7
+
+
+@scheduler.job("stale_entries", every=3600, jitter=60)
+def delete_stale_entries():
+    """1 haftadan oshgan chiqmagan mashinalarni (rasmlari bilan) o'chiradi"""
+    from .models import VehicleEntry
+    from .retention import delete_entries
+
+    cutoff = timezone.now() - timedelta(days=STALE_ENTRY_DAYS)
+    deleted = delete_entries(
+        VehicleEntry.objects.filter(exit_time__isnull=True, entry_time__lte=cutoff)
+    )
+    if deleted:
+        print(f"[AUTO CLEANER] Deleted {deleted} old vehicle entries")
+
+
+@scheduler.job("daily_rollups", every=3600, align=True, jitter=120)
+def roll_up_finished_days():
+    """Tugagan kunlarni DailyParkingStats ga yig'adi (yarim tundan keyingi birinchi soatda)"""
+    from .rollups import close_finished_days
+
+    closed = close_finished_days()
+    if closed:
+        print(f"[DAILY STATS] Rolled up {closed} day(s)")
+
+
+@scheduler.job("retention", at="03:30", jitter=600)
+def purge_old_entries():
+    """RETENTION_DAYS dan eski yozuvlar va kunlik rasm papkalari (RETENTION_AUTO_PURGE)"""
+    from .retention import purge_before, retention_cutoff
+
+    if not getattr(settings, "RETENTION_AUTO_PURGE", False):
+        return
+    result = purge_before(retention_cutoff())
+    print(
+        f"[RETENTION] Deleted {result.rows} entries, "
+        f"{result.directories} day directories"
+    )
+
+
+@scheduler.job("fiscal_outbox", every=60, jitter=5)
+def wake_fiscal_outbox():
+    """Qayta ishga tushgandan keyin ham navbatdagi soliq cheklari yuborilishi uchun"""
+    from .fiscal_outbox import fiscal_outbox
+
+    fiscal_outbox.wake()
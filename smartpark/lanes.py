@@ -0,0 +1,271 @@
+"""Gate lanes: which cameras and barrier belong together, and the order their events run in.
+
+Lanes are listed in ``GATE_LANES``::
+
+    GATE_LANES = [
+        {"name": "kirish-1", "direction": "entry", "cameras": ["192.168.1.64"],
+         "barrier_ports": ["/dev/ttyUSB0"]},
+        {"name": "chiqish-1", "direction": "exit", "cameras": ["192.168.1.65"],
+         "barrier_ports": ["/dev/ttyUSB1"], "auto_open": True, "auto_close": 10},
+    ]
+
+Without it there is one "entry" and one "exit" lane sharing
+``barier_control.barrier``, i.e. the old one camera / one port set-up.
+
+A camera event is routed to a lane by the URL (``receive-entry/<lane>/``)
+or by the camera address, otherwise to the first lane of its direction.
+Every lane has its own worker thread: events of one lane are handled
+strictly in arrival order while different lanes run in parallel. Events
+for the same plate are also serialized across lanes by a striped plate
+lock, so an entry on one lane and an exit on another never interleave -
+the exit either sees the finished entry or runs before it.
+
+Async views use ``acall``: the event loop awaits the lane's future, so a
+camera request waiting in a lane queue does not hold a server thread.
+"""
+
+import asyncio
+import queue
+import threading
+import zlib
+from concurrent.futures import Future
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+DIRECTIONS = ("entry", "exit")
+
+DEFAULT_QUEUE_SIZE = 100
+DEFAULT_AUTO_CLOSE = 10
+PLATE_LOCK_STRIPES = 64
+
+_plate_locks = [threading.Lock() for _ in range(PLATE_LOCK_STRIPES)]
+
+
+def plate_lock(number_plate):
+    """Lock shared by every event of ``number_plate`` (striped, so memory stays fixed)."""
+    key = (number_plate or "").upper().encode()
+    return _plate_locks[zlib.crc32(key) % PLATE_LOCK_STRIPES]
+
+
+class UnknownLane(LookupError):
+    pass
+
+
+class LaneBusy(Exception):
+    pass
+
+
+class Lane:
+    """One camera + barrier pair with its own ordered event worker."""
+
+    def __init__(
+        self,
+        name,
+        direction,
+        cameras=(),
+        barrier=None,
+        auto_open=False,
+        auto_close=DEFAULT_AUTO_CLOSE,
+        queue_size=DEFAULT_QUEUE_SIZE,
+        threaded=True,
+    ):
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Lane {name}: direction must be 'entry' or 'exit'")
+        self.name = name
+        self.direction = direction
+        self.cameras = frozenset(cameras)
+        self.barrier = barrier
+        self.auto_open = auto_open
+        self.auto_close = auto_close
+        self.threaded = threaded
+        self.processed = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def __repr__(self):
+        return f"<Lane {self.name} ({self.direction})>"
+
+    def submit(self, number_plate, fn, *args):
+        """Queue ``fn(*args)`` behind this lane's earlier events; returns a Future."""
+        future = Future()
+        if not self.threaded:
+            # Worker o'chirilgan: chaqiruvchi threadda, lekin tartib qulfi bilan
+            if future.set_running_or_notify_cancel():
+                self._execute(future, number_plate, fn, args)
+            return future
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((future, number_plate, fn, args))
+        except queue.Full:
+            raise LaneBusy(f"{self.name} navbati to'la") from None
+        return future
+
+    def call(self, number_plate, fn, *args, timeout=None):
+        """``submit`` and wait for the result."""
+        return self.submit(number_plate, fn, *args).result(timeout)
+
+    async def acall(self, number_plate, fn, *args, timeout=None):
+        """``call`` for async code; on timeout the event stays queued and still runs."""
+        if self.threaded:
+            future = self.submit(number_plate, fn, *args)
+        else:
+            # Workersiz: hodisa sinxron threadda bajariladi (ORM event loopda ishlamaydi)
+            future = await sync_to_async(self.submit)(number_plate, fn, *args)
+        # shield: kutish to'xtatilsa ham navbatdagi hodisa bekor qilinmaydi
+        return await asyncio.wait_for(
+            asyncio.shield(asyncio.wrap_future(future)), timeout
+        )
+
+    def open_barrier(self):
+        """Open this lane's barrier with its auto-close; returns the command future or None."""
+        if self.barrier is None:
+            return None
+        return self.barrier.open(auto_close=self.auto_close)
+
+    def status(self):
+        return {
+            "name": self.name,
+            "direction": self.direction,
+            "cameras": sorted(self.cameras),
+            "queued": self._queue.qsize(),
+            "processed": self.processed,
+            "failed": self.failed,
+            "barrier_connected": bool(self.barrier and self.barrier.connected),
+        }
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name=f"lane-{self.name}", daemon=True
+                )
+                self._worker.start()
+
+    def stop(self, timeout=5):
+        with self._lock:
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            self._queue.put(None)
+            worker.join(timeout)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, number_plate, fn, args = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            # Bu thread so'rov siklidan tashqarida: eskirgan ulanishlarni o'zimiz yopamiz
+            close_old_connections()
+            try:
+                self._execute(future, number_plate, fn, args)
+            finally:
+                close_old_connections()
+
+    def _execute(self, future, number_plate, fn, args):
+        try:
+            with plate_lock(number_plate):
+                result = fn(*args)
+        except BaseException as e:
+            self.failed += 1
+            future.set_exception(e)
+        else:
+            self.processed += 1
+            future.set_result(result)
+
+
+class LaneRegistry:
+    """Lanes built from ``GATE_LANES`` on first use."""
+
+    def __init__(self, config=None):
+        self._config = config
+        self._lanes = None
+        self._lock = threading.Lock()
+
+    def _build(self):
+        from .barier_control import BarrierController, barrier
+
+        config = self._config
+        if config is None:
+            config = getattr(settings, "GATE_LANES", None) or [
+                {"name": "entry", "direction": "entry"},
+                {"name": "exit", "direction": "exit"},
+            ]
+        queue_size = getattr(settings, "GATE_LANE_QUEUE_SIZE", DEFAULT_QUEUE_SIZE)
+        threaded = getattr(settings, "GATE_LANE_WORKERS", True)
+
+        # Bir xil portlar ro'yxati - bitta controller (bitta rele plata ikki shlakbaumni boshqarsa)
+        controllers = {}
+        lanes = {}
+        for item in config:
+            ports = tuple(item.get("barrier_ports") or ())
+            if ports:
+                if ports not in controllers:
+                    controllers[ports] = BarrierController(ports=list(ports))
+                lane_barrier = controllers[ports]
+            else:
+                lane_barrier = barrier
+            lane = Lane(
+                item["name"],
+                item["direction"],
+                cameras=item.get("cameras", ()),
+                barrier=lane_barrier,
+                auto_open=item.get("auto_open", False),
+                auto_close=item.get("auto_close", DEFAULT_AUTO_CLOSE),
+                queue_size=queue_size,
+                threaded=threaded,
+            )
+            if lane.name in lanes:
+                raise ValueError(f"GATE_LANES: {lane.name} takrorlangan")
+            lanes[lane.name] = lane
+        return lanes
+
+    @property
+    def lanes(self):
+        if self._lanes is None:
+            with self._lock:
+                if self._lanes is None:
+                    self._lanes = self._build()
+        return self._lanes
+
+    def get(self, name):
+        try:
+            return self.lanes[name]
+        except KeyError:
+            raise UnknownLane(f"Lane topilmadi: {name}") from None
+
+    def resolve(self, direction, name=None, camera=None):
+        """Lane for an event: by ``name``, else by ``camera`` address, else the first of ``direction``."""
+        if name:
+            lane = self.get(name)
+            if lane.direction != direction:
+                raise UnknownLane(f"{name} - {direction} yo'lagi emas")
+            return lane
+        candidates = [
+            lane for lane in self.lanes.values() if lane.direction == direction
+        ]
+        if not candidates:
+            raise UnknownLane(f"{direction} yo'lagi sozlanmagan")
+        if camera:
+            for lane in candidates:
+                if camera in lane.cameras:
+                    return lane
+        return candidates[0]
+
+    def status(self):
+        return [lane.status() for lane in self.lanes.values()]
+
+    def reset(self):
+        """Stop the workers and rebuild the lanes from settings on next use."""
+        with self._lock:
+            lanes, self._lanes = self._lanes, None
+        for lane in (lanes or {}).values():
+            lane.stop()
+
+
+gate_lanes = LaneRegistry()
@@ -0,0 +1,78 @@
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from smartpark.models import DailyParkingStats
+from smartpark.rollups import first_entry_day, refresh_day
+from smartpark.stats import local_today
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise CommandError(f"Sana YYYY-MM-DD formatida bo'lishi kerak: {value}")
+
+
+class Command(BaseCommand):
+    help = "VehicleEntry yozuvlaridan tugagan kunlar uchun DailyParkingStats hisoblaydi"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--from",
+            dest="date_from",
+            help="Boshlanish sanasi (standart: birinchi yozuv)",
+        )
+        parser.add_argument(
+            "--to", dest="date_to", help="Oxirgi sana (standart: kecha)"
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Mavjud kunlarni ham qayta hisoblash (o'chirilgan yozuvlar tarixdan tushadi)",
+        )
+
+    def handle(self, *args, **options):
+        yesterday = local_today() - timedelta(days=1)
+        last_day = parse_date(options["date_to"]) if options["date_to"] else yesterday
+        if last_day > yesterday:
+            # Bugungi kun hali tugamagan
+            last_day = yesterday
+
+        if options["date_from"]:
+            day = parse_date(options["date_from"])
+        else:
+            day = first_entry_day()
+            if day is None:
+                self.stdout.write("VehicleEntry bo'sh - hisoblanadigan kun yo'q")
+                return
+
+        existing = set()
+        if not options["force"]:
+            existing = set(
+                DailyParkingStats.objects.filter(
+                    day__gte=day, day__lte=last_day
+                ).values_list("day", flat=True)
+            )
+
+        start = time.perf_counter()
+        done = skipped = 0
+        while day <= last_day:
+            if day in existing:
+                skipped += 1
+            else:
+                row = refresh_day(day)
+                done += 1
+                self.stdout.write(
+                    f"{day}: {row.entries} kirish, {row.exits} chiqish, "
+                    f"{row.revenue} so'm, eng ko'p {row.peak_occupancy}"
+                )
+            day += timedelta(days=1)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Hisoblandi: {done} kun, o'tkazib yuborildi: {skipped} "
+                f"({time.perf_counter() - start:.1f} s)"
+            )
+        )
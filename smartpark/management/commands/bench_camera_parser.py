@@ -0,0 +1,107 @@
+import re
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from smartpark.camera_parser import parse_camera_buffer
+
+BOUNDARY = "----CameraBoundary7MA4YWxk"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+
+def build_payload(image_size):
+    """Build a Hikvision-style ANPR event: XML part + JPEG part."""
+    xml = (
+        "<EventNotificationAlert><ANPR>"
+        "<licensePlate>01A777AA</licensePlate>"
+        "</ANPR></EventNotificationAlert>"
+    )
+    jpeg = b"\xff\xd8\xff\xe0" + b"\x11" * max(image_size - 6, 0) + b"\xff\xd9"
+    return (
+        (
+            f"--{BOUNDARY}\r\n"
+            'Content-Disposition: form-data; name="anpr.xml"; filename="anpr.xml"\r\n'
+            "Content-Type: application/xml\r\n\r\n"
+            f"{xml}\r\n"
+            f"--{BOUNDARY}\r\n"
+            'Content-Disposition: form-data; name="detectionPicture.jpg"; '
+            'filename="detectionPicture.jpg"\r\n'
+            "Content-Type: image/jpeg\r\n\r\n"
+        ).encode()
+        + jpeg
+        + f"\r\n--{BOUNDARY}--\r\n".encode()
+    )
+
+
+def legacy_parse(body_bytes, content_type):
+    """The split/decode path receive_entry used before camera_parser (copied as is)."""
+    body_str = body_bytes.decode("utf-8", errors="ignore")
+
+    number_plate_match = re.search(r"<licensePlate>(.*?)</licensePlate>", body_str)
+    number_plate = (
+        number_plate_match.group(1)
+        if number_plate_match
+        else f"TEMP{timezone.now().strftime('%H%M%S')}"
+    )
+
+    boundary = (
+        content_type.split("boundary=")[-1] if "boundary=" in content_type else None
+    )
+
+    image_data = None
+    if boundary:
+        parts = body_bytes.split(boundary.encode())
+        for part in parts:
+            if b"Content-Type: image/jpeg" in part:
+                image_data = part.split(b"\r\n\r\n", 1)[-1].rsplit(b"\r\n", 1)[0]
+                break
+    return number_plate, image_data
+
+
+def new_parse(body_bytes, content_type):
+    upload = parse_camera_buffer(body_bytes, content_type)
+    return upload.number_plate, upload.image
+
+
+class Command(BaseCommand):
+    help = "Kamera multipart parserini eski usul bilan solishtirish (vaqt va xotira)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size-kb", type=int, default=300, help="JPEG hajmi (KB)")
+        parser.add_argument("--iterations", type=int, default=500)
+
+    def measure(self, func, payload, iterations):
+        func(payload, CONTENT_TYPE)  # warm-up
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func(payload, CONTENT_TYPE)
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        result = func(payload, CONTENT_TYPE)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del result
+        return elapsed / iterations, peak
+
+    def handle(self, *args, **options):
+        payload = build_payload(options["size_kb"] * 1024)
+        iterations = options["iterations"]
+
+        old_plate, old_image = legacy_parse(payload, CONTENT_TYPE)
+        new_plate, new_image = new_parse(payload, CONTENT_TYPE)
+        if old_plate != new_plate or bytes(new_image) != old_image:
+            self.stderr.write(self.style.ERROR("Natijalar mos kelmadi!"))
+            return
+
+        self.stdout.write(
+            f"Payload: {len(payload) / 1024:.1f} KB, {iterations} iterations"
+        )
+        for name, func in (("legacy", legacy_parse), ("streaming", new_parse)):
+            per_call, peak = self.measure(func, payload, iterations)
+            self.stdout.write(
+                f"{name:>10}: {per_call * 1e6:9.1f} us/request, "
+                f"peak alloc {peak / 1024:9.1f} KB"
+            )
@@ -0,0 +1,146 @@
+import io
+import os
+import statistics
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from smartpark.management.commands.bench_camera_parser import (
+    BOUNDARY,
+    CONTENT_TYPE,
+    build_payload,
+)
+from smartpark.models import VehicleEntry
+
+
+def camera_jpeg(width=1280, height=720):
+    """Haqiqiy JPEG (shovqin) - eskiz yasash ham o'lchovga kiradi"""
+    image = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    output = io.BytesIO()
+    image.save(output, "JPEG", quality=60)
+    return output.getvalue()
+
+
+def camera_payload(jpeg):
+    """``build_payload`` with ``jpeg`` as the picture part."""
+    head, _, _ = build_payload(0).partition(b"\xff\xd8\xff")
+    return head + jpeg + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def summary(latencies):
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    return (
+        f"p50 {percentile(0.5):.1f}, p95 {percentile(0.95):.1f}, "
+        f"p99 {percentile(0.99):.1f}, o'rtacha {statistics.mean(latencies) * 1000:.1f}"
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Ishlab turgan serverga (manage.py runserver) kamera hodisalarini "
+        "parallel yuborib, kirish/chiqish so'rovlari o'tkazuvchanligini o'lchaydi"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url", default="http://127.0.0.1:8000", help="Server manzili"
+        )
+        parser.add_argument(
+            "--cars", type=int, default=300, help="Avtomobillar soni (kirish + chiqish)"
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=32, help="Bir vaqtdagi kameralar"
+        )
+        parser.add_argument(
+            "--resolution", default="1280x720", help="Kamera rasmi o'lchami, WxH"
+        )
+        parser.add_argument("--prefix", default="LT", help="Sinov raqamlari prefiksi")
+        parser.add_argument(
+            "--probe",
+            default="/login/",
+            help="Yuklama paytida ketma-ket so'raladigan oddiy sahifa (boshqa so'rovlar kutib qoladimi)",
+        )
+        parser.add_argument(
+            "--cleanup", action="store_true", help="Oxirida sinov yozuvlarini o'chirish"
+        )
+
+    def handle(self, *args, **options):
+        width, height = (int(n) for n in options["resolution"].lower().split("x"))
+        base = camera_payload(camera_jpeg(width, height))
+        url = options["url"].rstrip("/")
+        prefix = options["prefix"]
+        local = threading.local()
+        latencies = []
+        statuses = Counter()
+
+        def post(path, payload):
+            session = getattr(local, "session", None)
+            if session is None:
+                session = local.session = requests.Session()
+            started = time.perf_counter()
+            try:
+                status = session.post(
+                    url + path,
+                    data=payload,
+                    headers={"Content-Type": CONTENT_TYPE},
+                    timeout=60,
+                ).status_code
+            except requests.RequestException as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] += 1
+
+        def car(n):
+            payload = base.replace(b"01A777AA", f"{prefix}{n:06d}".encode())
+            post("/receive-entry/", payload)
+            post("/receive-exit/", payload)
+
+        post("/receive-entry/", base)  # ulanish va birinchi so'rov o'lchovga kirmaydi
+        latencies.clear()
+        statuses.clear()
+
+        probes = []
+        finished = threading.Event()
+
+        def probe():
+            session = requests.Session()
+            while not finished.is_set():
+                started = time.perf_counter()
+                try:
+                    session.get(url + options["probe"], timeout=60)
+                except requests.RequestException:
+                    pass
+                probes.append(time.perf_counter() - started)
+                finished.wait(0.05)
+
+        prober = threading.Thread(target=probe, daemon=True)
+        started = time.perf_counter()
+        prober.start()
+        with ThreadPoolExecutor(options["concurrency"]) as pool:
+            list(pool.map(car, range(options["cars"])))
+        elapsed = time.perf_counter() - started
+        finished.set()
+        prober.join()
+
+        self.stdout.write(
+            f"{len(latencies)} so'rov, {options['concurrency']} parallel, "
+            f"{len(base) / 1024:.0f} KB: {len(latencies) / elapsed:.1f} req/s"
+        )
+        self.stdout.write(f"kechikish ms: {summary(latencies)}")
+        self.stdout.write(f"{options['probe']} kechikishi ms: {summary(probes)}")
+        self.stdout.write(f"javoblar: {dict(statuses)}")
+
+        if options["cleanup"]:
+            deleted, _ = VehicleEntry.objects.filter(
+                number_plate__startswith=prefix
+            ).delete()
+            self.stdout.write(f"{deleted} sinov yozuvi o'chirildi")
@@ -0,0 +1,70 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from smartpark.management.commands.bench_ingest import summary
+from smartpark.receipt_render import ReceiptRenderer, qrcode
+
+# Pillow rasm xotirasi: piksel uchun bayt ("1" ham bir bayt, RGB to'rt)
+BYTES_PER_PIXEL = {"1": 1, "L": 1, "P": 1, "RGB": 4, "RGBA": 4}
+
+
+def sample_response(seq=1):
+    return {
+        "ReceiptSeq": seq,
+        "DateTime": "2025-11-22 14:05:31",
+        "FiscalSign": f"{seq:012d}",
+        "QRCodeURL": f"https://ofd.soliq.uz/check?t=ZZ000000000000&r={seq}&c=20251122140531&s={seq:012d}",
+        "SerialNumber": "UZ210317208541",
+        "FMNumber": "ZZ000000000000",
+    }
+
+
+def canvas_kb(image):
+    return image.width * image.height * BYTES_PER_PIXEL[image.mode] / 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Unikassa chekini rasmga aylantirish tezligi va xotirasini o'lchaydi "
+        "(printerga yuborilmaydi)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--count", type=int, default=200, help="Nechta chek chizish"
+        )
+        parser.add_argument("--no-qr", action="store_true", help="QR kodsiz cheklar")
+
+    def handle(self, *args, **options):
+        def response(seq):
+            data = sample_response(seq)
+            if options["no_qr"]:
+                data.pop("QRCodeURL")
+            return data
+
+        renderer = ReceiptRenderer()
+        started = time.perf_counter()
+        image = renderer.render(response(0))
+        cold = time.perf_counter() - started
+
+        latencies = []
+        for seq in range(1, options["count"] + 1):
+            started = time.perf_counter()
+            image = renderer.render(response(seq))
+            latencies.append(time.perf_counter() - started)
+
+        self.stdout.write(
+            f"birinchi chek (shrift + sarlavha): {cold * 1000:.1f} ms"
+            + (
+                ""
+                if qrcode or options["no_qr"]
+                else "; qrcode o'rnatilmagan - QR chizilmadi"
+            )
+        )
+        self.stdout.write(f"{options['count']} chek, ms: {summary(latencies)}")
+        self.stdout.write(
+            f"rasm: {image.width}x{image.height} {image.mode}, "
+            f"xotirada {canvas_kb(image):.0f} KB, "
+            f"printerga {len(image.tobytes()) / 1024:.0f} KB"
+        )
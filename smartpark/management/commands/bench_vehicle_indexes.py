@@ -0,0 +1,223 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from smartpark.models import VehicleEntry
+from smartpark.stats import day_bounds, listed_entries_filter, local_today
+
+PLATE_PREFIX = "BENCH"
+# Seed qilingan yozuvlar uuid'i shu belgidan boshlanadi (haqiqiylari tasodifiy)
+UUID_PREFIX = "f"
+
+
+def hot_queries(plate, day):
+    """(name, queryset to EXPLAIN, callable that runs the real query)."""
+    start, end = day_bounds(day)
+    today_qs = VehicleEntry.objects.filter(entry_time__gte=start, entry_time__lte=end)
+
+    open_entry = VehicleEntry.objects.filter(
+        number_plate=plate, exit_time__isnull=True
+    ).order_by("entry_time")
+    last_entry = VehicleEntry.objects.filter(number_plate=plate).order_by("-entry_time")
+    plate_today = today_qs.filter(number_plate=plate)
+    stats = today_qs.values("exit_time", "is_paid")
+    latest_unpaid = today_qs.filter(is_paid=False, exit_time__isnull=False).order_by(
+        "-exit_time"
+    )
+    unpaid_exits = VehicleEntry.objects.filter(
+        exit_time__gte=start, exit_time__lte=end, is_paid=False
+    ).order_by("-exit_time")
+    listed = VehicleEntry.objects.filter(listed_entries_filter(day)).order_by(
+        "-entry_time"
+    )
+
+    return [
+        ("open entry by plate", open_entry, lambda: open_entry.first()),
+        ("last entry by plate", last_entry, lambda: last_entry.first()),
+        ("plate entries today", plate_today, lambda: plate_today.count()),
+        (
+            "today statistics",
+            stats,
+            lambda: today_qs.aggregate(
+                total=Count("id"),
+                exits=Count("id", filter=Q(exit_time__isnull=False)),
+                unpaid=Count("id", filter=Q(exit_time__isnull=False, is_paid=False)),
+            ),
+        ),
+        ("latest unpaid today", latest_unpaid, lambda: latest_unpaid.first()),
+        ("unpaid exits today", unpaid_exits, lambda: list(unpaid_exits.all())),
+        ("home page list", listed, lambda: list(listed.values_list("id", flat=True))),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "VehicleEntry jadvaliga test yozuvlar qo'shib, asosiy so'rovlarni "
+        "indekslarsiz va indekslar bilan o'lchaydi"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--plates", type=int, default=20_000)
+        parser.add_argument("--days", type=int, default=365)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument(
+            "--no-seed",
+            action="store_true",
+            help="Oldingi seed'dan qolgan yozuvlarni ishlatish",
+        )
+        parser.add_argument(
+            "--keep", action="store_true", help="Seed qilingan yozuvlarni o'chirmaslik"
+        )
+        parser.add_argument(
+            "--plans", action="store_true", help="To'liq EXPLAIN natijasini chiqarish"
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        now = timezone.now()
+
+        if not options["no_seed"]:
+            if self.seeded().exists():
+                raise CommandError(
+                    "Oldingi seed yozuvlari bor: --no-seed bilan ishlating yoki o'chiring"
+                )
+            self.seed(rng, now, options)
+
+        self.analyze()
+        plate = f"{PLATE_PREFIX}{rng.randrange(options['plates']):07d}"
+        queries = hot_queries(plate, local_today())
+
+        indexes = VehicleEntry._meta.indexes
+        existing = self.existing_index_names()
+        try:
+            self.drop_indexes([i for i in indexes if i.name in existing])
+            before = self.measure(queries, options)
+
+            self.create_indexes(indexes)
+            after = self.measure(queries, options)
+        finally:
+            # Jadvalni boshlang'ich holatiga qaytaramiz (migratsiyalar bilan to'qnashmasin)
+            current = self.existing_index_names()
+            self.drop_indexes(
+                [i for i in indexes if i.name in current and i.name not in existing]
+            )
+            self.create_indexes(
+                [i for i in indexes if i.name in existing and i.name not in current]
+            )
+            if not options["keep"]:
+                # delete() har bir yozuv uchun signal yuboradi - 1M qatorda juda sekin
+                seeded = self.seeded()
+                deleted = seeded._raw_delete(seeded.db)
+                self.stdout.write(f"Seed yozuvlari o'chirildi: {deleted}")
+
+        self.report(queries, before, after, options)
+
+    def seeded(self):
+        return VehicleEntry.objects.filter(number_plate__startswith=PLATE_PREFIX)
+
+    def seed(self, rng, now, options):
+        rows, batch_size = options["rows"], options["batch_size"]
+        span = options["days"] * 86400
+        start = time.perf_counter()
+        created = 0
+        while created < rows:
+            batch = []
+            for i in range(created, min(created + batch_size, rows)):
+                entry_time = now - timedelta(seconds=rng.randrange(span))
+                exit_time = None
+                is_paid = False
+                # Taxminan 2% hali ichkarida, chiqqanlarning 90% to'langan
+                if rng.random() > 0.02:
+                    exit_time = entry_time + timedelta(
+                        seconds=rng.randrange(300, 36000)
+                    )
+                    is_paid = rng.random() < 0.9
+                batch.append(
+                    VehicleEntry(
+                        number_plate=f"{PLATE_PREFIX}{rng.randrange(options['plates']):07d}",
+                        entry_time=entry_time,
+                        exit_time=exit_time,
+                        entry_image="",
+                        total_amount=0,
+                        is_paid=is_paid,
+                        uuid=f"{UUID_PREFIX}{i:09x}",
+                    )
+                )
+            with transaction.atomic():
+                VehicleEntry.objects.bulk_create(batch, batch_size=batch_size)
+            created += len(batch)
+            self.stdout.write(f"\rSeed: {created}/{rows}", ending="")
+            self.stdout.flush()
+        self.stdout.write(f"\nSeed tugadi: {time.perf_counter() - start:.1f} s")
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {VehicleEntry._meta.db_table}")
+
+    def existing_index_names(self):
+        with connection.cursor() as cursor:
+            return set(
+                connection.introspection.get_constraints(
+                    cursor, VehicleEntry._meta.db_table
+                )
+            )
+
+    def drop_indexes(self, indexes):
+        with connection.schema_editor() as editor:
+            for index in indexes:
+                editor.remove_index(VehicleEntry, index)
+
+    def create_indexes(self, indexes):
+        if not indexes:
+            return
+        start = time.perf_counter()
+        with connection.schema_editor() as editor:
+            for index in indexes:
+                editor.add_index(VehicleEntry, index)
+        self.analyze()
+        self.stdout.write(
+            f"{len(indexes)} ta indeks yaratildi: {time.perf_counter() - start:.1f} s"
+        )
+
+    def measure(self, queries, options):
+        results = {}
+        for name, queryset, run in queries:
+            run()  # warm-up
+            timings = []
+            for _ in range(options["repeat"]):
+                start = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - start) * 1000)
+            if connection.vendor == "postgresql":
+                plan = queryset.explain(analyze=True)
+            else:
+                plan = queryset.explain()
+            results[name] = (statistics.median(timings), plan)
+        return results
+
+    def report(self, queries, before, after, options):
+        self.stdout.write("")
+        self.stdout.write(
+            f"{'query':<24}{'before ms':>12}{'after ms':>12}{'speedup':>10}"
+        )
+        for name, _, _ in queries:
+            before_ms, before_plan = before[name]
+            after_ms, after_plan = after[name]
+            speedup = before_ms / after_ms if after_ms else float("inf")
+            self.stdout.write(
+                f"{name:<24}{before_ms:>12.3f}{after_ms:>12.3f}{speedup:>9.1f}x"
+            )
+            if options["plans"]:
+                self.stdout.write(f"  before: {before_plan}")
+                self.stdout.write(f"  after:  {after_plan}")
+            else:
+                self.stdout.write(f"  before: {before_plan.splitlines()[0]}")
+                self.stdout.write(f"  after:  {after_plan.splitlines()[0]}")
@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Min
+
+from smartpark.models import VehicleEntry
+from smartpark.retention import purge_before, retention_cutoff
+from smartpark.stats import day_bounds
+
+
+class Command(BaseCommand):
+    help = (
+        "Eski VehicleEntry yozuvlarini partiyalab o'chiradi va o'sha kunlarning "
+        "rasm papkalarini olib tashlaydi"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            help="Shuncha kundan eski yozuvlar (standart: RETENTION_DAYS)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Bitta tranzaksiyada o'chiriladigan yozuvlar soni",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            help="Partiyalar orasidagi kutish, soniya (yuklamani pasaytiradi)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Faqat nechta yozuv o'chishini ko'rsatish",
+        )
+
+    def handle(self, *args, **options):
+        if options["days"] is not None and options["days"] < 1:
+            raise CommandError("--days kamida 1 bo'lishi kerak")
+        cutoff = retention_cutoff(options["days"])
+        start, _ = day_bounds(cutoff)
+        old = VehicleEntry.objects.filter(entry_time__lt=start).aggregate(
+            total=Count("id"), first=Min("entry_time")
+        )
+        self.stdout.write(
+            f"{cutoff} dan oldingi yozuvlar: {old['total']} ta"
+            + (f" (eng eskisi {old['first']:%Y-%m-%d})" if old["first"] else "")
+        )
+        if options["dry_run"]:
+            return
+
+        started = time.perf_counter()
+
+        def progress(result):
+            self.stdout.write(
+                f"  partiya {result.batches}: {result.rows}/{old['total']} yozuv, "
+                f"{result.files} rasm ({time.perf_counter() - started:.1f} s)"
+            )
+
+        result = purge_before(
+            cutoff,
+            batch_size=options["batch_size"],
+            pause=options["sleep"],
+            progress=progress,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"O'chirildi: {result.rows} yozuv, {result.directories} kunlik papka, "
+                f"{result.files} alohida rasm ({time.perf_counter() - started:.1f} s)"
+            )
+        )
@@ -0,0 +1,122 @@
+import itertools
+import json
+import random
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers like the Unikassa integration API (``/send/sale``, ``/get/sync``)."""
+
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        with server.lock:
+            server.requests += 1
+            server.connections.add(self.client_address)
+            server.active += 1
+            server.peak_active = max(server.peak_active, server.active)
+        try:
+            self.answer(server, body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def answer(self, server, body):
+        if server.delay:
+            time.sleep(server.delay)
+        with server.lock:
+            fail = server.fail_next > 0
+            server.fail_next -= fail
+        if fail or (server.fail_rate and random.random() < server.fail_rate):
+            return self.reply(503, {"error": "stub: xizmat vaqtincha ishlamayapti"})
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            return self.reply(400, {"error": "JSON emas"})
+
+        if self.path.endswith("/send/sale"):
+            seq = next(server.receipts)
+            with server.lock:
+                server.sales.append(payload)
+            return self.reply(
+                200,
+                {
+                    "ReceiptSeq": seq,
+                    "DateTime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "FiscalSign": f"{seq:012d}",
+                    "QRCodeURL": f"https://ofd.soliq.uz/check?t=STUB&r={seq}",
+                    "SerialNumber": "STUB0001",
+                    "FMNumber": payload.get("Fiscal", ""),
+                },
+            )
+        if self.path.endswith("/get/sync"):
+            return self.reply(200, {"status": "ok"})
+        return self.reply(404, {"error": f"{self.path} topilmadi"})
+
+    def reply(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_stub_server(port=0, delay=0.0, fail_rate=0.0, verbose=False):
+    """Stub server on 127.0.0.1 (``port=0`` picks a free one); call ``serve_forever``."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    server.delay = delay
+    server.fail_rate = fail_rate
+    server.fail_next = 0  # testlar uchun: keyingi N so'rov 503 oladi
+    server.verbose = verbose
+    server.lock = threading.Lock()
+    server.receipts = itertools.count(1)
+    server.requests = 0
+    server.connections = set()
+    server.active = 0
+    server.peak_active = 0  # bir vaqtda ishlangan eng ko'p so'rov
+    server.sales = []
+    return server
+
+
+class Command(BaseCommand):
+    help = (
+        "Unikassa API ning lokal o'xshashi: UNIKASSA_BASE_URL=http://127.0.0.1:<port> "
+        "bilan cheklarni haqiqiy kassasiz sinash uchun"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument(
+            "--delay", type=float, default=0.0, help="Har javobdan oldin kutish (s)"
+        )
+        parser.add_argument(
+            "--fail-rate",
+            type=float,
+            default=0.0,
+            help="503 qaytaradigan so'rovlar ulushi (0..1)",
+        )
+
+    def handle(self, *args, **options):
+        server = make_stub_server(
+            options["port"], options["delay"], options["fail_rate"], verbose=True
+        )
+        self.stdout.write(f"Unikassa stub: http://127.0.0.1:{server.server_address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
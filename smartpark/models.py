@@ -9,6 +9,8 @@ from django.contrib.auth.hashers import make_password
 from django.core.validators import RegexValidator
 import uuid
 
+from .tariff import TariffSchedule, tariffs
+
 
 def generate_uuid_hex():
     """Generate a punctuation-free UUID string (10 hex chars)."""
@@ -39,12 +41,26 @@ class CustomUser(AbstractUser):
         verbose_name_plural = "Custom Users"
 
 
+class TariffCategory(models.TextChoices):
+    REGULAR = "regular", "Oddiy"
+    SPECIAL_TAXI = "special_taxi", "Maxsus taksi"
+    FREE = "free", "Bepul"
+
+
+class FiscalStatus(models.TextChoices):
+    PENDING = "pending", "Navbatda"
+    SENDING = "sending", "Yuborilmoqda"
+    SENT = "sent", "Yuborildi"
+    FAILED = "failed", "Xato"
+    REVIEW = "review", "Tekshirish kerak"  # yuborilgan bo'lishi mumkin, qayta yuborilmaydi
+
+
 class VehicleEntry(models.Model):
     number_plate = models.CharField(max_length=15)
     entry_time = models.DateTimeField(default=timezone.now)
     exit_time = models.DateTimeField(blank=True, null=True)
-    entry_image = models.ImageField(upload_to="entries/")
-    exit_image = models.ImageField(upload_to="exits/", blank=True, null=True)
+    entry_image = models.ImageField(upload_to="entries/%Y/%m/%d/")
+    exit_image = models.ImageField(upload_to="exits/%Y/%m/%d/", blank=True, null=True)
     total_amount = models.IntegerField(blank=True, null=True)
     is_paid = models.BooleanField(default=False)
     uuid = models.CharField(
@@ -58,13 +74,19 @@ class VehicleEntry(models.Model):
     )
     is_error=models.BooleanField(default=False)
     error_massage=models.CharField(max_length=255,blank=True,null=True)
+    # Soliq cheki holati (fiscal_outbox to'ldiradi)
+    fiscal_status = models.CharField(
+        max_length=10, choices=FiscalStatus.choices, blank=True, default=""
+    )
+    fiscal_receipt = models.CharField(max_length=20, blank=True, default="")
+    fiscal_sign = models.CharField(max_length=64, blank=True, default="")
     
     def __str__(self):
         # Ensure timezone-aware formatting
         entry_time = self.entry_time
         return f"{self.number_plate} - {entry_time.strftime('%Y-%m-%d %H:%M')}"
 
-    def calculate_amount(self):
+    def calculate_amount(self, category=None):
         """Parking fee hisoblash:
         - 10 daqiqa bepul
         - 10 daqiqadan 1 soatgacha: 4000 so'm
@@ -77,105 +99,19 @@ class VehicleEntry(models.Model):
         """
         if not self.exit_time:
             return 0
+        return self.calculate_amount_for_exit_time(self.exit_time, category)
 
-        from config.settings import HOUR_PRICE, FREE_MINUTES
-
-        DAILY_LIMIT = 5 * HOUR_PRICE  # 5 soat uchun maksimum (20000)
-        QUARTER_HOUR_PRICE = 1000  # 15 minut uchun narx
-        QUARTER_HOUR_MINUTES = 15  # 15 daqiqa
-
-        entry = self.entry_time
-        exit = self.exit_time
-
-        # Normalize to timezone-aware datetimes to avoid naive/aware subtraction
-        if timezone.is_naive(entry):
-            entry = timezone.make_aware(entry)
-        else:
-            entry = timezone.localtime(entry)
-
-        if timezone.is_naive(exit):
-            exit = timezone.make_aware(exit)
-        else:
-            exit = timezone.localtime(exit)
+    def calculate_amount_for_exit_time(self, exit_time, category=None):
+        """Parking fee hisoblash berilgan chiqish vaqti uchun.
 
-        # Umumiy davomiylik asosida oddiy hisoblash
-        duration_seconds = (exit - entry).total_seconds()
-        duration_minutes = duration_seconds / 60.0
-
-        # 10 daqiqa va undan kam (shu jumladan 10 daqiqa) bepul
-        if duration_minutes <= FREE_MINUTES:
-            return 0
-
-        # 10 daqiqadan 1 soatgacha (60 minutgacha): 4000 so'm
-        if duration_minutes <= 60:
-            return HOUR_PRICE  # 4000 so'm
-
-        # 1 soatdan 2 soatgacha: har 15 minutga 1000 so'm qo'shiladi
-        TWO_HOURS_MINUTES = 120  # 2 soat
-        if duration_minutes <= TWO_HOURS_MINUTES:
-            minutes_after_first_hour = duration_minutes - 60
-            # 15 minutlik bloklar soni (yuqoriga yaxlitlab)
-            quarter_hour_blocks = int(minutes_after_first_hour / QUARTER_HOUR_MINUTES)
-            if minutes_after_first_hour % QUARTER_HOUR_MINUTES > 0:
-                quarter_hour_blocks += 1
-            # 1 soat uchun 4000 + har 15 minut uchun 1000
-            return HOUR_PRICE + (quarter_hour_blocks * QUARTER_HOUR_PRICE)
-
-        # 2 soatdan 5 soatgacha: har soat uchun 4000 so'm (1 sekund o'tsa ham yangi soat boshlangan deb hisoblanadi)
-        # 2 soat uchun: 4000 (1 soat) + 4000 (1 soatdan 2 soatgacha 4*15min*1000) = 8000
-        two_hours_amount = HOUR_PRICE + (4 * QUARTER_HOUR_PRICE)  # 4000 + 4000 = 8000
-
-        # 2 soatdan keyingi qism: har soat uchun 4000 so'm (1 sekund o'tsa ham yangi soat boshlangan)
-        hours_after_two_hours = (duration_minutes - TWO_HOURS_MINUTES) / 60.0
-        # Har soat uchun 4000 so'm, lekin 1 sekund o'tsa ham yangi soat boshlangan deb hisoblanadi (ceil)
-        import math
-
-        additional_hours = math.ceil(
-            hours_after_two_hours
-        )  # 1 sekund o'tsa ham yangi soat
-
-        total_amount = two_hours_amount + (additional_hours * HOUR_PRICE)
-
-        # 5 soatgacha (20000 so'mgacha) limit
-        if total_amount > DAILY_LIMIT:
-            total_amount = DAILY_LIMIT
-
-        # 5 soatdan keyin: 24 soatgacha faqat 5 soat uchun pul (20000 so'm)
-        # 24 soatdan 1 sekund o'tsa ham har 24 soat uchun 20000 qo'shiladi
-        seconds_in_day = 24 * 60 * 60
-        if duration_seconds > 5 * 60 * 60:  # 5 soatdan oshsa
-            # 5 soatdan 24 soatgacha: 20000 so'm (faqat 5 soat uchun)
-            if duration_seconds < seconds_in_day:
-                return DAILY_LIMIT  # 20000 so'm
-            else:
-                # 24 soatdan 1 sekund o'tsa ham: 20000 + 20000 = 40000
-                # 48 soatdan 1 sekund o'tsa ham: 20000 + 20000 + 20000 = 60000
-                full_days = int(
-                    duration_seconds // seconds_in_day
-                )  # necha marta 24 soat to'ldi (floor)
-                return DAILY_LIMIT + (
-                    full_days * DAILY_LIMIT
-                )  # 20000 + (full_days * 20000)
-
-        return total_amount
-
-    def calculate_amount_for_exit_time(self, exit_time):
-        """Parking fee hisoblash:
-        - 10 daqiqa bepul
-        - 10 daqiqadan 1 soatgacha: 4000 so'm
-        - 1 soatdan keyin: har 15 minutga 1000 so'm qo'shiladi 2 soatgacha
-        - 2 soatdan keyin: yana 1 sekund o`tsa ham 4000 so`m qoshiladi toki 5 soatga yetguncha yani 15 minutlik intervallarga bo`linmaydi
-        - 5 soatgacha (20000 so'mgacha) shunday hisoblanadi
-        - 5 soatdan 24 soatgacha: faqat 5 soat uchun pul (20000 so'm)
-        - 24 soatdan 1 sekund o'tsa ham: 20000 + 20000 = 40000 so'm
-        - 48 soatdan 1 sekund o'tsa ham: 20000 + 20000 + 20000 = 60000 so'm
+        Kirish vaqtida amalda bo'lgan ``category`` tarif rejasi bo'yicha
+        (reja bo'lmasa calculate_amount() dagi standart qoidalar).
         """
-        from config.settings import HOUR_PRICE, FREE_MINUTES
-
-        DAILY_LIMIT = 5 * HOUR_PRICE  # 5 soat uchun maksimum (20000)
-        QUARTER_HOUR_PRICE = 1000  # 15 minut uchun narx
-        QUARTER_HOUR_MINUTES = 15  # 15 daqiqa
+        tariff = tariffs.get(category or TariffCategory.REGULAR, self.entry_time)
+        return tariff.amount(self.duration_seconds(exit_time))
 
+    def duration_seconds(self, exit_time):
+        """Kirishdan ``exit_time`` gacha o'tgan vaqt (sekund)."""
         entry = self.entry_time
         exit = exit_time
 
@@ -190,66 +126,7 @@ class VehicleEntry(models.Model):
         else:
             exit = timezone.localtime(exit)
 
-        # Umumiy davomiylik asosida oddiy hisoblash
-        duration_seconds = (exit - entry).total_seconds()
-        duration_minutes = duration_seconds / 60.0
-
-        # 10 daqiqa va undan kam (shu jumladan 10 daqiqa) bepul
-        if duration_minutes <= FREE_MINUTES:
-            return 0
-
-        # 10 daqiqadan 1 soatgacha (60 minutgacha): 4000 so'm
-        if duration_minutes <= 60:
-            return HOUR_PRICE  # 4000 so'm
-
-        # 1 soatdan 2 soatgacha: har 15 minutga 1000 so'm qo'shiladi
-        TWO_HOURS_MINUTES = 120  # 2 soat
-        if duration_minutes <= TWO_HOURS_MINUTES:
-            minutes_after_first_hour = duration_minutes - 60
-            # 15 minutlik bloklar soni (yuqoriga yaxlitlab)
-            quarter_hour_blocks = int(minutes_after_first_hour / QUARTER_HOUR_MINUTES)
-            if minutes_after_first_hour % QUARTER_HOUR_MINUTES > 0:
-                quarter_hour_blocks += 1
-            # 1 soat uchun 4000 + har 15 minut uchun 1000
-            return HOUR_PRICE + (quarter_hour_blocks * QUARTER_HOUR_PRICE)
-
-        # 2 soatdan 5 soatgacha: har soat uchun 4000 so'm (1 sekund o'tsa ham yangi soat boshlangan deb hisoblanadi)
-        # 2 soat uchun: 4000 (1 soat) + 4000 (1 soatdan 2 soatgacha 4*15min*1000) = 8000
-        two_hours_amount = HOUR_PRICE + (4 * QUARTER_HOUR_PRICE)  # 4000 + 4000 = 8000
-
-        # 2 soatdan keyingi qism: har soat uchun 4000 so'm (1 sekund o'tsa ham yangi soat boshlangan)
-        hours_after_two_hours = (duration_minutes - TWO_HOURS_MINUTES) / 60.0
-        # Har soat uchun 4000 so'm, lekin 1 sekund o'tsa ham yangi soat boshlangan deb hisoblanadi (ceil)
-        import math
-
-        additional_hours = math.ceil(
-            hours_after_two_hours
-        )  # 1 sekund o'tsa ham yangi soat
-
-        total_amount = two_hours_amount + (additional_hours * HOUR_PRICE)
-
-        # 5 soatgacha (20000 so'mgacha) limit
-        if total_amount > DAILY_LIMIT:
-            total_amount = DAILY_LIMIT
-
-        # 5 soatdan keyin: 24 soatgacha faqat 5 soat uchun pul (20000 so'm)
-        # 24 soatdan 1 sekund o'tsa ham har 24 soat uchun 20000 qo'shiladi
-        seconds_in_day = 24 * 60 * 60
-        if duration_seconds > 5 * 60 * 60:  # 5 soatdan oshsa
-            # 5 soatdan 24 soatgacha: 20000 so'm (faqat 5 soat uchun)
-            if duration_seconds < seconds_in_day:
-                return DAILY_LIMIT  # 20000 so'm
-            else:
-                # 24 soatdan 1 sekund o'tsa ham: 20000 + 20000 = 40000
-                # 48 soatdan 1 sekund o'tsa ham: 20000 + 20000 + 20000 = 60000
-                full_days = int(
-                    duration_seconds // seconds_in_day
-                )  # necha marta 24 soat to'ldi (floor)
-                return DAILY_LIMIT + (
-                    full_days * DAILY_LIMIT
-                )  # 20000 + (full_days * 20000)
-
-        return total_amount
+        return (exit - entry).total_seconds()
 
     def mark_as_paid(self):
         """Mark this entry as paid"""
@@ -260,6 +137,30 @@ class VehicleEntry(models.Model):
         db_table = "vehicle_entries"
         verbose_name = "Vehicle Entry"
         verbose_name_plural = "Vehicle Entries"
+        indexes = [
+            # receive_entry/receive_exit: raqam bo'yicha ochiq (chiqmagan) yozuv
+            models.Index(
+                fields=["number_plate", "entry_time"],
+                condition=models.Q(exit_time__isnull=True),
+                name="ve_open_plate_idx",
+            ),
+            # Raqam bo'yicha oxirgi yozuv va bugungi kirishlar soni
+            models.Index(fields=["number_plate", "-entry_time"], name="ve_plate_entry_idx"),
+            # Kunlik oraliq + statistika: exit_time/is_paid indeksning o'zida (index-only scan)
+            models.Index(
+                fields=["entry_time", "exit_time", "is_paid"], name="ve_entry_cover_idx"
+            ),
+            # To'lanmagan chiqishlar, exit_time bo'yicha eng oxirgisi birinchi
+            models.Index(
+                fields=["-exit_time"],
+                condition=models.Q(is_paid=False, exit_time__isnull=False),
+                name="ve_unpaid_exit_idx",
+            ),
+            # Batafsil ro'yxat keyset sahifalash tartibi (teskari o'qiladi: DESC NULLS FIRST)
+            models.Index(
+                fields=["exit_time", "entry_time", "id"], name="ve_activity_idx"
+            ),
+        ]
 
 
 class Cars(models.Model):
@@ -292,7 +193,131 @@ class Cars(models.Model):
         status_str = f" ({', '.join(status)})" if status else ""
         return f"{self.number_plate}{status_str}"
 
+    @property
+    def tariff_category(self):
+        if self.is_free:
+            return TariffCategory.FREE
+        if self.is_special_taxi:
+            return TariffCategory.SPECIAL_TAXI
+        return TariffCategory.REGULAR
+
     class Meta:
         db_table = "cars"
         verbose_name = "Car"
         verbose_name_plural = "Cars"
+        indexes = [models.Index(fields=["number_plate"], name="cars_plate_idx")]
+
+
+class TariffPlan(models.Model):
+    """Tarif rejasi: narxlar va amal qilish muddati, avtomobil toifasi bo'yicha"""
+
+    name = models.CharField(max_length=100)
+    category = models.CharField(
+        max_length=20, choices=TariffCategory.choices, default=TariffCategory.REGULAR
+    )
+    hour_price = models.PositiveIntegerField(default=4000)
+    free_minutes = models.PositiveIntegerField(default=10)
+    quarter_price = models.PositiveIntegerField(
+        default=1000, help_text="1-2 soat oralig'ida har blok uchun narx"
+    )
+    quarter_minutes = models.PositiveIntegerField(default=15)
+    daily_hours = models.PositiveIntegerField(
+        default=5, help_text="Kunlik limit necha soatlik narxga teng"
+    )
+    valid_from = models.DateTimeField(default=timezone.now)
+    valid_to = models.DateTimeField(blank=True, null=True)
+    is_active = models.BooleanField(default=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.get_category_display()})"
+
+    def schedule(self):
+        return TariffSchedule(
+            hour_price=self.hour_price,
+            free_minutes=self.free_minutes,
+            quarter_price=self.quarter_price,
+            quarter_minutes=self.quarter_minutes,
+            daily_hours=self.daily_hours,
+        )
+
+    class Meta:
+        db_table = "tariff_plans"
+        verbose_name = "Tariff Plan"
+        verbose_name_plural = "Tariff Plans"
+        ordering = ["category", "-valid_from"]
+
+
+class DailyParkingStats(models.Model):
+    """Kunlik yig'ma statistika: uzoq muddatli hisobotlar xom yozuvlarni o'qimasligi uchun"""
+
+    day = models.DateField(unique=True)
+    entries = models.IntegerField(default=0)
+    exits = models.IntegerField(default=0)
+    open_entries = models.IntegerField(
+        default=0, help_text="Shu kuni kirib, hali chiqmagan mashinalar"
+    )
+    paid_count = models.IntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)
+    free_exits = models.IntegerField(
+        default=0, help_text="To'langan deb belgilangan, 0 so'mlik chiqishlar"
+    )
+    peak_occupancy = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.day}: {self.entries} kirish, {self.revenue} so'm"
+
+    class Meta:
+        db_table = "daily_parking_stats"
+        verbose_name = "Daily Parking Stats"
+        verbose_name_plural = "Daily Parking Stats"
+        ordering = ["-day"]
+
+
+class SchedulerLease(models.Model):
+    """Rejalashtiruvchi yetakchisi: vazifalarni faqat shu qatorni ushlab turgan worker bajaradi"""
+
+    name = models.CharField(max_length=50, unique=True)
+    owner = models.CharField(max_length=100)
+    expires_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.owner} ({self.expires_at:%H:%M:%S} gacha)"
+
+    class Meta:
+        db_table = "scheduler_leases"
+        verbose_name = "Scheduler Lease"
+        verbose_name_plural = "Scheduler Leases"
+
+
+class FiscalOutbox(models.Model):
+    """Unikassa ga yuborilishi kerak bo'lgan savdo: so'rov darhol qabul qilinadi, fon yuboradi"""
+
+    entry = models.ForeignKey(
+        VehicleEntry,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="fiscal_sales",
+    )
+    payload = models.JSONField()
+    status = models.CharField(
+        max_length=10, choices=FiscalStatus.choices, default=FiscalStatus.PENDING
+    )
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, default="")
+    response = models.JSONField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"#{self.id} {self.get_status_display()} ({self.attempts} urinish)"
+
+    class Meta:
+        db_table = "fiscal_outbox"
+        verbose_name = "Fiscal Outbox"
+        verbose_name_plural = "Fiscal Outbox"
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
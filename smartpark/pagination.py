@@ -0,0 +1,96 @@
+"""Keyset (cursor) pagination for the detailed entries list.
+
+Rows are ordered by ``(exit_time DESC NULLS FIRST, entry_time DESC,
+id DESC)``: cars still inside first, then by most recent activity. A
+cursor is the sort key of the last row on a page, so the next page is a
+``WHERE key < cursor`` seek instead of an ``OFFSET`` that reads and
+throws away every earlier row.
+
+The total count is optional; it is cached per filter set for
+``DETAILED_COUNT_CACHE_SECONDS`` so scrolling does not recount the table
+on every page.
+"""
+
+import base64
+import hashlib
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Q
+
+DEFAULT_COUNT_CACHE_SECONDS = 60
+
+KEYSET_ORDERING = (
+    F("exit_time").desc(nulls_first=True),
+    F("entry_time").desc(),
+    F("id").desc(),
+)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(entry):
+    """Opaque cursor pointing just after ``entry``."""
+    key = [
+        entry.exit_time.isoformat() if entry.exit_time else None,
+        entry.entry_time.isoformat(),
+        entry.id,
+    ]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(exit_time, entry_time, id) from ``encode_cursor``; raises InvalidCursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        exit_time, entry_time, entry_id = json.loads(base64.urlsafe_b64decode(padded))
+        return (
+            datetime.fromisoformat(exit_time) if exit_time else None,
+            datetime.fromisoformat(entry_time),
+            int(entry_id),
+        )
+    except (TypeError, ValueError) as e:
+        raise InvalidCursor(f"Noto'g'ri cursor: {cursor}") from e
+
+
+def after_cursor(exit_time, entry_time, entry_id):
+    """Rows that come after the key in ``KEYSET_ORDERING``."""
+    same_entry = Q(entry_time__lt=entry_time) | Q(
+        entry_time=entry_time, id__lt=entry_id
+    )
+    if exit_time is None:
+        # Hali ichkaridagilar tugamagan; ulardan keyin barcha chiqqanlar keladi
+        return (Q(exit_time__isnull=True) & same_entry) | Q(exit_time__isnull=False)
+    # exit_time__lte indeks bo'yicha qidiruv chegarasini beradi
+    return Q(exit_time__lte=exit_time) & (
+        Q(exit_time__lt=exit_time) | (Q(exit_time=exit_time) & same_entry)
+    )
+
+
+def keyset_page(queryset, per_page, cursor=None):
+    """(rows, next_cursor) for one page; ``next_cursor`` is None on the last page."""
+    if cursor:
+        queryset = queryset.filter(after_cursor(*decode_cursor(cursor)))
+    rows = list(queryset.order_by(*KEYSET_ORDERING)[: per_page + 1])
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+
+def cached_count(queryset, filters, refresh=False):
+    """``queryset.count()`` cached under a key built from the request ``filters``."""
+    signature = json.dumps(sorted(filters.items()), default=str)
+    key = "smartpark:detailed_count:" + hashlib.md5(signature.encode()).hexdigest()
+    total = None if refresh else cache.get(key)
+    if total is None:
+        total = queryset.count()
+        timeout = getattr(
+            settings, "DETAILED_COUNT_CACHE_SECONDS", DEFAULT_COUNT_CACHE_SECONDS
+        )
+        cache.set(key, total, timeout)
+    return total
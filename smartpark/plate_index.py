@@ -0,0 +1,271 @@
+"""In-memory index of plates with an open entry, for fuzzy exit matching.
+
+The exit camera sometimes misreads one character (0/O, 8/B, ...), and an
+exact lookup then finds no open entry. ``open_plates.best_match(plate)``
+proposes the open plate the read most likely belongs to, with a
+confidence score.
+
+How it works:
+
+- plates are keyed after folding look-alike characters (``O``, ``D``,
+  ``Q`` -> ``0``, ``B`` -> ``8``, ...), so confusable misreads share a key;
+- every key is stored with all its variants of up to ``max_edits``
+  deleted characters (a symmetric-delete index), so a read with one
+  missing, extra or wrong character finds its candidates with a handful
+  of dict lookups instead of a scan;
+- candidates are ranked by a weighted edit distance where a confusable
+  substitution costs ``CONFUSABLE_COST`` and any other edit costs 1;
+  ``confidence = 1 - cost / len``. A tie between two plates is ambiguous
+  and gives no match.
+
+Only a match whose every difference is a look-alike pair (same folded
+key) is ``auto`` - safe to close that entry without asking. Any other
+match, e.g. one plain wrong character, is only a proposal for the
+operator: ``01A123BC`` and ``01A124BC`` are different cars. Placeholder
+plates (``TEMP...``, used when the camera read nothing) are never
+fuzzy-matched, neither as the read nor as a candidate.
+
+The index follows VehicleEntry saves and deletes through the signals
+(like ``stats.occupancy``) and is re-read from the database every
+``PLATE_INDEX_RECONCILE_SECONDS`` and after ``invalidate()``. A stale
+index only affects which plate is proposed - the exit still locks and
+checks the open entry in the database.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+DEFAULT_MAX_EDITS = 1
+DEFAULT_MIN_CONFIDENCE = 0.8
+DEFAULT_RECONCILE_SECONDS = 300
+CONFUSABLE_COST = 0.25
+
+# ANPR ko'p adashtiradigan belgilar raqamga keltiriladi
+CONFUSABLES = str.maketrans(
+    {
+        "O": "0",
+        "Q": "0",
+        "D": "0",
+        "I": "1",
+        "L": "1",
+        "Z": "2",
+        "S": "5",
+        "G": "6",
+        "T": "7",
+        "B": "8",
+    }
+)
+
+PLACEHOLDER_PREFIX = "TEMP"  # raqam o'qilmaganda views.py shu prefiks bilan vaqt yozadi
+
+PlateMatch = namedtuple("PlateMatch", "plate confidence cost auto")
+
+
+def normalize_plate(plate):
+    """Upper-case alphanumerics only: ``"01 a-123 bc"`` -> ``"01A123BC"``."""
+    return "".join(ch for ch in (plate or "").upper() if ch.isalnum())
+
+
+def is_placeholder(plate):
+    return normalize_plate(plate).startswith(PLACEHOLDER_PREFIX)
+
+
+def plate_key(plate):
+    """``normalize_plate`` with look-alike characters folded together."""
+    return normalize_plate(plate).translate(CONFUSABLES)
+
+
+def deletion_variants(key, depth):
+    """``key`` and every string made by deleting up to ``depth`` characters."""
+    variants = {key}
+    frontier = {key}
+    for _ in range(depth):
+        frontier = {
+            word[:i] + word[i + 1 :] for word in frontier for i in range(len(word))
+        }
+        variants |= frontier
+    return variants
+
+
+def match_cost(read, plate):
+    """Weighted edit distance; confusable substitutions are cheap."""
+    read, plate = normalize_plate(read), normalize_plate(plate)
+    previous = [float(i) for i in range(len(plate) + 1)]
+    for i, a in enumerate(read, 1):
+        current = [float(i)]
+        for j, b in enumerate(plate, 1):
+            if a == b:
+                substitution = 0.0
+            elif a.translate(CONFUSABLES) == b.translate(CONFUSABLES):
+                substitution = CONFUSABLE_COST
+            else:
+                substitution = 1.0
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + substitution,
+                )
+            )
+        previous = current
+    return previous[-1]
+
+
+def confidence_for(read, plate, cost=None):
+    if cost is None:
+        cost = match_cost(read, plate)
+    length = max(len(normalize_plate(read)), len(normalize_plate(plate)), 1)
+    return max(0.0, 1 - cost / length)
+
+
+def open_plate(entry):
+    """Plate an entry keeps open in the index, or None."""
+    if entry.exit_time is None and entry.number_plate:
+        return entry.number_plate
+    return None
+
+
+class OpenPlateIndex:
+    """Plates of open VehicleEntry rows, searchable by near-miss reads."""
+
+    def __init__(self, max_edits=None, reconcile_seconds=None):
+        self._max_edits = max_edits
+        self._reconcile_seconds = reconcile_seconds
+        self._lock = threading.RLock()
+        self._counts = {}
+        self._variants = {}
+        self._loaded = False
+        self._reconciled_at = 0.0
+
+    @property
+    def max_edits(self):
+        if self._max_edits is not None:
+            return self._max_edits
+        return getattr(settings, "PLATE_MATCH_MAX_EDITS", DEFAULT_MAX_EDITS)
+
+    @property
+    def reconcile_seconds(self):
+        if self._reconcile_seconds is not None:
+            return self._reconcile_seconds
+        return getattr(
+            settings, "PLATE_INDEX_RECONCILE_SECONDS", DEFAULT_RECONCILE_SECONDS
+        )
+
+    def __len__(self):
+        return len(self._counts)
+
+    def __contains__(self, plate):
+        return plate in self._counts
+
+    def invalidate(self):
+        """Force a DB reconcile on the next search."""
+        with self._lock:
+            self._loaded = False
+
+    def reconcile(self):
+        """Rebuild the index from the open entries in the database."""
+        from .models import VehicleEntry
+
+        plates = VehicleEntry.objects.filter(exit_time__isnull=True).values_list(
+            "number_plate", flat=True
+        )
+        with self._lock:
+            self._counts = {}
+            self._variants = {}
+            for plate in plates:
+                if plate:
+                    self._add(plate)
+            self._loaded = True
+            self._reconciled_at = time.monotonic()
+
+    def _add(self, plate):
+        count = self._counts.get(plate, 0)
+        self._counts[plate] = count + 1
+        if count:
+            return
+        for variant in deletion_variants(plate_key(plate), self.max_edits):
+            self._variants.setdefault(variant, set()).add(plate)
+
+    def _discard(self, plate):
+        count = self._counts.get(plate, 0)
+        if count > 1:
+            self._counts[plate] = count - 1
+            return
+        if not count:
+            return
+        del self._counts[plate]
+        for variant in deletion_variants(plate_key(plate), self.max_edits):
+            plates = self._variants.get(variant)
+            if plates is not None:
+                plates.discard(plate)
+                if not plates:
+                    del self._variants[variant]
+
+    def apply(self, old_plate, new_plate):
+        """Move one open entry from ``old_plate`` to ``new_plate`` (either may be None)."""
+        if old_plate == new_plate:
+            return
+        with self._lock:
+            if not self._loaded:
+                return
+            if old_plate:
+                self._discard(old_plate)
+            if new_plate:
+                self._add(new_plate)
+
+    def _ensure_loaded(self):
+        if (
+            not self._loaded
+            or time.monotonic() - self._reconciled_at >= self.reconcile_seconds
+        ):
+            self.reconcile()
+
+    def search(self, plate, limit=5):
+        """Open plates within reach of ``plate``, best first."""
+        self._ensure_loaded()
+        key = plate_key(plate)
+        if not key or is_placeholder(plate):
+            return []
+        with self._lock:
+            candidates = set()
+            for variant in deletion_variants(key, self.max_edits):
+                candidates.update(self._variants.get(variant, ()))
+        matches = []
+        for candidate in candidates:
+            if is_placeholder(candidate):
+                continue
+            cost = match_cost(plate, candidate)
+            matches.append(
+                PlateMatch(
+                    candidate,
+                    confidence_for(plate, candidate, cost),
+                    cost,
+                    plate_key(candidate) == key,
+                )
+            )
+        matches.sort(key=lambda match: (match.cost, match.plate))
+        return matches[:limit]
+
+    def best_match(self, plate, min_confidence=None):
+        """The single best open plate for a misread, or None if weak or ambiguous.
+
+        Check ``match.auto`` before closing the entry: otherwise it is only
+        a suggestion.
+        """
+        if min_confidence is None:
+            min_confidence = getattr(
+                settings, "PLATE_MATCH_MIN_CONFIDENCE", DEFAULT_MIN_CONFIDENCE
+            )
+        matches = [match for match in self.search(plate) if match.plate != plate]
+        if not matches or matches[0].confidence < min_confidence:
+            return None
+        if len(matches) > 1 and matches[1].cost == matches[0].cost:
+            # Ikki raqam bir xil yaqin - qaysi biri ekanini bilib bo'lmaydi
+            return None
+        return matches[0]
+
+
+open_plates = OpenPlateIndex()
@@ -0,0 +1,191 @@
+"""In-process cache of the blocked / free / special-taxi plates.
+
+Gate decisions used to query ``Cars`` on every camera event. The plates
+that have any flag set are few, so each process keeps them in three
+frozensets and answers ``plate_policies.get(plate)`` without a database
+round-trip.
+
+The sets are reloaded after a change:
+
+- ``car_updated``/``car_deleted`` signals call ``invalidate()`` once
+  the transaction commits;
+- ``invalidate()`` also sends a ``plate_policy.invalidate`` message to
+  the ``plate_policy`` channel-layer group, and every other worker
+  process (listening in a background thread) drops its copy;
+- as a safety net for changes that bypass signals (``update()``, raw
+  SQL) the sets are reloaded at most ``PLATE_POLICY_MAX_AGE`` seconds
+  after loading.
+
+If one plate has several ``Cars`` rows their flags are combined.
+"""
+
+import asyncio
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Cars, TariffCategory
+
+GROUP_NAME = "plate_policy"
+DEFAULT_MAX_AGE = 300
+GROUP_REFRESH_SECONDS = 600  # guruh a'zoligi muddati tugamasligi uchun qayta qo'shiladi
+
+
+class PlatePolicy(namedtuple("PlatePolicy", "is_free is_special_taxi is_blocked")):
+    """Flags of one plate; mirrors ``Cars.tariff_category``."""
+
+    __slots__ = ()
+
+    @property
+    def tariff_category(self):
+        if self.is_free:
+            return TariffCategory.FREE
+        if self.is_special_taxi:
+            return TariffCategory.SPECIAL_TAXI
+        return TariffCategory.REGULAR
+
+
+# 8 ta mumkin bo'lgan holat oldindan yaratiladi - get() yangi obyekt yasamaydi
+POLICIES = {
+    (free, taxi, blocked): PlatePolicy(free, taxi, blocked)
+    for free in (False, True)
+    for taxi in (False, True)
+    for blocked in (False, True)
+}
+REGULAR = POLICIES[False, False, False]
+
+PolicyTable = namedtuple("PolicyTable", "free special_taxi blocked loaded_at")
+
+
+class PlatePolicyCache:
+    def __init__(self, max_age=None):
+        self._max_age = max_age
+        self._table = None
+        self._lock = threading.Lock()
+        self._listener = None
+        self._generation = 0
+        self.origin = uuid.uuid4().hex
+        self.loads = 0
+
+    @property
+    def max_age(self):
+        if self._max_age is not None:
+            return self._max_age
+        return getattr(settings, "PLATE_POLICY_MAX_AGE", DEFAULT_MAX_AGE)
+
+    def get(self, number_plate):
+        """PlatePolicy of ``number_plate`` (REGULAR for unknown plates)."""
+        table = self._table
+        if table is None or time.monotonic() - table.loaded_at > self.max_age:
+            table = self._load()
+        return POLICIES[
+            number_plate in table.free,
+            number_plate in table.special_taxi,
+            number_plate in table.blocked,
+        ]
+
+    def is_blocked(self, number_plate):
+        return self.get(number_plate).is_blocked
+
+    def _load(self):
+        self._ensure_listener()
+        with self._lock:
+            generation = self._generation
+            free, special_taxi, blocked = set(), set(), set()
+            rows = Cars.objects.filter(
+                Q(is_free=True) | Q(is_special_taxi=True) | Q(is_blocked=True)
+            ).values_list("number_plate", "is_free", "is_special_taxi", "is_blocked")
+            for number_plate, is_free, is_special_taxi, is_blocked in rows:
+                if is_free:
+                    free.add(number_plate)
+                if is_special_taxi:
+                    special_taxi.add(number_plate)
+                if is_blocked:
+                    blocked.add(number_plate)
+            table = PolicyTable(
+                frozenset(free),
+                frozenset(special_taxi),
+                frozenset(blocked),
+                time.monotonic(),
+            )
+            # Yuklash paytida invalidate kelgan bo'lsa, jadval saqlanmaydi
+            if generation == self._generation:
+                self._table = table
+            self.loads += 1
+        return table
+
+    def invalidate(self, broadcast=True):
+        """Drop the sets here and (by default) in every other worker process."""
+        self._drop()
+        if not broadcast:
+            return
+        try:
+            layer = get_channel_layer()
+            if layer is not None and not isinstance(layer, InMemoryChannelLayer):
+                async_to_sync(layer.group_send)(
+                    GROUP_NAME,
+                    {"type": "plate_policy.invalidate", "origin": self.origin},
+                )
+        except Exception as e:
+            print("[PLATE POLICY ERROR]:", e)
+
+    def on_message(self, message):
+        if (
+            message.get("type") == "plate_policy.invalidate"
+            and message.get("origin") != self.origin
+        ):
+            self._drop()
+
+    def _drop(self):
+        self._generation += 1
+        self._table = None
+
+    def _ensure_listener(self):
+        """Listen for other workers' invalidations (only with a cross-process channel layer)."""
+        if self._listener is not None:
+            return
+        with self._lock:
+            # Ikki thread bir vaqtda yuklasa ham faqat bitta tinglovchi ishga tushadi
+            if self._listener is not None:
+                return
+            layer = get_channel_layer()
+            if layer is None or isinstance(layer, InMemoryChannelLayer):
+                # Bitta jarayon: signal o'zi yetarli
+                self._listener = False
+                return
+            self._listener = threading.Thread(
+                target=lambda: asyncio.run(self._listen(layer)),
+                name="plate-policy-listener",
+                daemon=True,
+            )
+            self._listener.start()
+
+    async def _listen(self, layer):
+        while True:
+            try:
+                channel = await layer.new_channel()
+                await layer.group_add(GROUP_NAME, channel)
+                # Tinglash boshlanguncha o'tkazib yuborilgan xabarlar bo'lishi mumkin
+                self._drop()
+                while True:
+                    try:
+                        message = await asyncio.wait_for(
+                            layer.receive(channel), GROUP_REFRESH_SECONDS
+                        )
+                    except asyncio.TimeoutError:
+                        await layer.group_add(GROUP_NAME, channel)
+                        continue
+                    self.on_message(message)
+            except Exception as e:
+                print("[PLATE POLICY ERROR]:", e)
+                self._drop()
+                await asyncio.sleep(5)
+
+
+plate_policies = PlatePolicyCache()
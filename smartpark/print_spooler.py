@@ -0,0 +1,231 @@
+"""Background spooler for thermal receipt printing.
+
+Receipts are rendered to ESC/POS bytes in the caller (no database work
+happens in the worker) and put on a bounded queue. One worker thread
+sends them to the printer in order, so a slow or offline printer never
+holds up a payment response or a WebSocket handler.
+
+A failed job is retried ``PRINT_MAX_ATTEMPTS`` times with a doubling
+delay, looking the printer up again each time. After that it goes to
+the dead-letter list, where ``retry()`` can resubmit it. When the queue
+is full, ``submit()`` raises ``PrintQueueFull`` instead of waiting.
+
+Every status change (queued, printing, retrying, done, failed) is sent
+to the ``home_updates`` group as a ``print_job_update`` message.
+"""
+
+import asyncio
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils import timezone
+
+from .broadcast import GROUP_NAME
+
+DEFAULT_QUEUE_SIZE = 50
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_DELAY = 2  # s, har urinishda ikki baravar
+DEAD_LETTER_LIMIT = 100
+
+
+class PrintQueueFull(Exception):
+    pass
+
+
+class PrintJob:
+    """One document waiting for the printer."""
+
+    __slots__ = (
+        "id",
+        "data",
+        "doc_name",
+        "printer_name",
+        "entry_id",
+        "label",
+        "attempts",
+        "status",
+        "error",
+        "created_at",
+    )
+
+    def __init__(
+        self, data, doc_name="Chek", printer_name=None, entry_id=None, label=""
+    ):
+        self.id = uuid.uuid4().hex[:12]
+        self.data = data
+        self.doc_name = doc_name
+        self.printer_name = printer_name
+        self.entry_id = entry_id
+        self.label = label
+        self.attempts = 0
+        self.status = "queued"
+        self.error = None
+        self.created_at = timezone.now()
+
+    def as_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "entry_id": self.entry_id,
+            "label": self.label,
+            "attempts": self.attempts,
+            "error": self.error,
+        }
+
+
+class PrintSpooler:
+    """Bounded print queue served by a single worker thread."""
+
+    def __init__(self, sender=None, maxsize=None, max_attempts=None, retry_delay=None):
+        self._sender = sender
+        self._maxsize = maxsize
+        self._max_attempts = max_attempts
+        self._retry_delay = retry_delay
+        self._queue = None
+        self._lock = threading.Lock()
+        self._worker = None
+        self._loop = None
+        self._dead = OrderedDict()
+
+    @property
+    def max_attempts(self):
+        if self._max_attempts is not None:
+            return self._max_attempts
+        return getattr(settings, "PRINT_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)
+
+    @property
+    def retry_delay(self):
+        if self._retry_delay is not None:
+            return self._retry_delay
+        return getattr(settings, "PRINT_RETRY_DELAY", DEFAULT_RETRY_DELAY)
+
+    def bind_loop(self, loop):
+        """Event loop of the WebSocket consumers (see ``ChangeEventScheduler``)."""
+        self._loop = loop
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._queue is None:
+                maxsize = self._maxsize or getattr(
+                    settings, "PRINT_QUEUE_SIZE", DEFAULT_QUEUE_SIZE
+                )
+                self._queue = queue.Queue(maxsize=maxsize)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="print-spooler", daemon=True
+                )
+                self._worker.start()
+
+    def submit(self, data, doc_name="Chek", printer_name=None, entry_id=None, label=""):
+        """Queue ready ESC/POS bytes; returns the job. Raises PrintQueueFull."""
+        return self._put(PrintJob(data, doc_name, printer_name, entry_id, label))
+
+    def submit_entry(self, entry, printer_name=None):
+        """Queue the payment receipt of a VehicleEntry."""
+        from .utils import build_receipt, entry_receipt_fields
+
+        return self.submit(
+            build_receipt(**entry_receipt_fields(entry)),
+            printer_name=printer_name,
+            entry_id=entry.id,
+            label=entry.number_plate,
+        )
+
+    def _put(self, job):
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise PrintQueueFull("Printer navbati to'la, chek chiqarilmadi") from None
+        self._report(job)
+        return job
+
+    def pending(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def dead_letters(self):
+        return list(self._dead.values())
+
+    def retry(self, job_id):
+        """Resubmit a dead-lettered job; returns it, or None if it is unknown."""
+        job = self._dead.pop(job_id, None)
+        if job is None:
+            return None
+        job.attempts = 0
+        job.status = "queued"
+        job.error = None
+        return self._put(job)
+
+    def join(self):
+        """Wait until every queued job is printed or dead-lettered."""
+        if self._queue is not None:
+            self._queue.join()
+
+    def _send(self, job):
+        sender = self._sender
+        if sender is None:
+            from .utils import send_raw as sender
+        sender(job.data, job.doc_name, job.printer_name)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._process(job)
+            except Exception as e:
+                print("[PRINT SPOOLER ERROR]:", e)
+            finally:
+                self._queue.task_done()
+
+    def _process(self, job):
+        while True:
+            job.attempts += 1
+            job.status = "printing"
+            self._report(job)
+            try:
+                self._send(job)
+            except Exception as e:
+                job.error = str(e)
+                if job.attempts >= self.max_attempts:
+                    job.status = "failed"
+                    self._dead[job.id] = job
+                    while len(self._dead) > DEAD_LETTER_LIMIT:
+                        self._dead.popitem(last=False)
+                    print(f"[PRINT ERROR]: {job.label or job.id}: {e}")
+                    self._report(job)
+                    return
+                job.status = "retrying"
+                self._report(job)
+                time.sleep(self.retry_delay * 2 ** (job.attempts - 1))
+                continue
+            job.status = "done"
+            job.error = None
+            self._report(job)
+            return
+
+    def _report(self, job):
+        """Send the job status to home page clients; never raises."""
+        event = {"type": "print_job_status", "data": job.as_dict()}
+        try:
+            layer = get_channel_layer()
+            if layer is None:
+                return
+            loop = self._loop
+            if loop is not None and not loop.is_closed():
+                # In-memory layer consumerlarni faqat o'z loopidan uyg'otadi
+                asyncio.run_coroutine_threadsafe(
+                    layer.group_send(GROUP_NAME, event), loop
+                )
+            else:
+                async_to_sync(layer.group_send)(GROUP_NAME, event)
+        except Exception as e:
+            print("[PRINT STATUS ERROR]:", e)
+
+
+print_spooler = PrintSpooler()
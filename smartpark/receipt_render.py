@@ -0,0 +1,280 @@
+"""Renderer for Unikassa fiscal receipts (80 mm, 576 px wide).
+
+Everything that does not change between receipts is prepared once and
+reused: TrueType fonts are loaded once per size, the company header
+(name, address, STIR) and the blank footer are pre-rendered bands, and
+rasterised text (labels, rules, serial and FM numbers...) is kept in a
+small LRU of 1-bit masks. A receipt is laid out first, so its height is
+known before drawing; then the bands, the text masks and the QR code go
+onto a single 1-bit canvas of exactly that height - the thermal printer
+only prints black and white anyway.
+
+The bands are rebuilt when the ``COMPANY_*`` settings or
+``RECEIPT_FONT`` change. Without the optional ``qrcode`` package the
+receipt is printed without the QR code.
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from PIL import Image, ImageDraw, ImageFont
+
+try:
+    import qrcode
+except ImportError:  # qrcode ixtiyoriy: bo'lmasa chek QR kodsiz chiqadi
+    qrcode = None
+
+WIDTH = 576  # 80mm, 203 DPI
+MARGIN = 40
+QR_SIZE = 320
+# Har qanday niqob standartga mos; 8 tasini sinab eng yaxshisini tanlash
+# (qrcode standarti) chekni chizishning ko'p qismini olardi
+QR_MASK_PATTERN = 0
+FONT_LARGE, FONT_MEDIUM, FONT_SMALL, FONT_TINY = 40, 28, 22, 18
+DOUBLE_RULE = "=" * 48
+SINGLE_RULE = "-" * 48
+WHITE, BLACK = 1, 0
+STAMP_CACHE_SIZE = 256  # eslab qolinadigan matn rasmlari
+
+
+class ReceiptLayout:
+    """Positions lines top to bottom; ``draw`` puts them on an image.
+
+    ``stamp(text, font)`` returns ``(bbox, mask)`` for a line of text.
+    """
+
+    def __init__(self, stamp, width=WIDTH, y=0):
+        self.stamp = stamp
+        self.width = width
+        self.y = y
+        self.ops = []
+
+    def space(self, pixels):
+        self.y += pixels
+
+    def centered(self, text, font):
+        (left, top, right, bottom), mask = self.stamp(text, font)
+        self.ops.append(((self.width - (right - left)) // 2, self.y, mask))
+        self.y += bottom - top + 15
+
+    def label_value(self, label, value, font):
+        _, label_mask = self.stamp(label, font)
+        (left, top, right, bottom), mask = self.stamp(value, font)
+        self.ops.append((MARGIN, self.y, label_mask))
+        self.ops.append((self.width - (right - left) - MARGIN, self.y, mask))
+        self.y += bottom - top + 18
+
+    def draw(self, image, top=0):
+        for x, y, mask in self.ops:
+            if mask is not None:
+                image.paste(BLACK, (x, top + y), mask)
+
+    def render(self):
+        image = Image.new("1", (self.width, self.y), WHITE)
+        self.draw(image)
+        return image
+
+
+def _short_date(date_str):
+    try:
+        return datetime.strptime(date_str, "%Y-%m-%d").strftime("%d/%m/%y")
+    except ValueError:
+        return date_str
+
+
+class ReceiptRenderer:
+    """Renders ``/send/sale`` answers to 1-bit receipt images, caching the static parts."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fonts = {}
+        self._stamps = OrderedDict()
+        self._stamps_lock = (
+            threading.Lock()
+        )  # bands() _lock ichida stamp() ni chaqiradi
+        self._bands = None
+        self._bands_key = None
+
+    def font(self, size):
+        path = getattr(settings, "RECEIPT_FONT", "arial.ttf")
+        key = (path, size)
+        font = self._fonts.get(key)
+        if font is None:
+            try:
+                font = ImageFont.truetype(path, size)
+            except OSError:
+                font = ImageFont.load_default()
+            self._fonts[key] = font
+        return font
+
+    def stamp(self, text, font):
+        """``(bbox, mask)`` of ``text``; ``mask`` is None for blank text."""
+        key = (text, id(font))
+        with self._stamps_lock:
+            found = self._stamps.get(key)
+            if found is not None:
+                self._stamps.move_to_end(key)
+                return found
+        bbox = font.getbbox(text)
+        mask = None
+        if bbox[2] > 0 and bbox[3] > 0:
+            # draw.text((x, y)) bilan bir xil joylashuv: rasm (0, 0) dan boshlanadi
+            mask = Image.new("1", (bbox[2], bbox[3]), 0)
+            ImageDraw.Draw(mask).text((0, 0), text, font=font, fill=1)
+        with self._stamps_lock:
+            self._stamps[key] = (bbox, mask)
+            if len(self._stamps) > STAMP_CACHE_SIZE:
+                self._stamps.popitem(last=False)
+        return bbox, mask
+
+    def company(self):
+        return (
+            getattr(settings, "COMPANY_NAME", "SMART AUTO PARK"),
+            getattr(settings, "COMPANY_TYPE", "MAS'ULIYATI CHEKLANGAN JAMIYAT"),
+            getattr(settings, "COMPANY_REGION", "XORAZM VILOYATI"),
+            getattr(settings, "COMPANY_DISTRICT", "QO'SHKO'PIR TUMANI"),
+            getattr(
+                settings,
+                "COMPANY_ADDRESS",
+                "KO'SHKO'PIR G., UL. SHAROF RASHIDOV, DOM 175",
+            ),
+            getattr(settings, "COMPANY_STIR", "310510032"),
+        )
+
+    def bands(self):
+        """(header, rule, footer) images, rebuilt only when settings change."""
+        key = (getattr(settings, "RECEIPT_FONT", "arial.ttf"), self.company())
+        with self._lock:
+            if self._bands_key != key:
+                self._bands = self._build_bands(*key[1])
+                self._bands_key = key
+            return self._bands
+
+    def _build_bands(self, name, kind, region, district, address, stir):
+        large, medium = self.font(FONT_LARGE), self.font(FONT_MEDIUM)
+        small, tiny = self.font(FONT_SMALL), self.font(FONT_TINY)
+
+        header = ReceiptLayout(self.stamp, y=30)
+        header.centered(DOUBLE_RULE, small)
+        header.centered(name, large)
+        header.space(10)
+        header.centered(kind, tiny)
+        header.space(15)
+        for line in (region, district, address):
+            header.centered(line, tiny)
+        header.space(15)
+        header.centered(DOUBLE_RULE, small)
+        header.space(20)
+        header.label_value("STIR:", stir, medium)
+
+        # Fiskal blok va QR oldidagi chiziq
+        rule = ReceiptLayout(self.stamp)
+        rule.space(20)
+        rule.centered(DOUBLE_RULE, small)
+        rule.space(20)
+
+        footer = ReceiptLayout(self.stamp)
+        footer.space(120)
+        footer.centered(".", small)
+        footer.space(300)
+        return header.render(), rule.render(), footer.render()
+
+    def qr_image(self, data):
+        """QR code scaled to ``QR_SIZE``, or None (no data / no ``qrcode``)."""
+        data = str(data or "").strip()
+        if qrcode is None or not data or data == "None":
+            return None
+        qr = qrcode.QRCode(
+            version=1,
+            error_correction=qrcode.constants.ERROR_CORRECT_M,
+            box_size=1,
+            border=2,
+            mask_pattern=QR_MASK_PATTERN,
+        )
+        qr.add_data(data)
+        qr.make(fit=True)
+        matrix = qr.get_matrix()
+        modules = Image.new("1", (len(matrix), len(matrix)), WHITE)
+        modules.putdata([BLACK if cell else WHITE for row in matrix for cell in row])
+        return modules.resize((QR_SIZE, QR_SIZE), Image.NEAREST)
+
+    def body(self, response_data):
+        """Layout of the per-sale lines between the header and the QR code."""
+        medium, small = self.font(FONT_MEDIUM), self.font(FONT_SMALL)
+        receipt_seq = str(response_data.get("ReceiptSeq", ""))
+        date_time = str(response_data.get("DateTime", ""))
+        fiscal_sign = str(response_data.get("FiscalSign", ""))
+        serial_number = str(response_data.get("SerialNumber", ""))
+        fm_number = str(response_data.get("FMNumber", ""))
+        rs_version = str(response_data.get("RSVersion", "SMARTONE 1.0.84"))
+
+        layout = ReceiptLayout(self.stamp)
+        date_parts = date_time.split(" ")
+        if len(date_parts) == 2:
+            date_short, time_short = _short_date(date_parts[0]), date_parts[1][:5]
+            layout.label_value("Sana:", date_short, medium)
+            layout.label_value("Vaqt:", time_short, medium)
+        else:
+            layout.label_value("Sana va vaqt:", date_time, medium)
+        receipt_display = f"№{receipt_seq.zfill(4)}" if receipt_seq else ""
+        layout.label_value("Chek raqami:", receipt_display, medium)
+
+        layout.space(20)
+        layout.centered(SINGLE_RULE, small)
+        layout.space(20)
+        layout.centered(DOUBLE_RULE, small)
+        layout.space(20)
+
+        if serial_number:
+            layout.label_value("S/N:", serial_number, small)
+        if fm_number:
+            layout.label_value("FM raqami:", fm_number, small)
+        if receipt_seq:
+            layout.label_value("Chek raqami:", receipt_seq, small)
+        if len(date_parts) == 2:
+            layout.centered(date_short, small)
+            layout.centered(time_short, small)
+        if fiscal_sign.strip() and fiscal_sign != "None":
+            layout.label_value("Fiskal belgi:", fiscal_sign, small)
+        if rs_version:
+            layout.label_value("RS:", rs_version, small)
+        return layout
+
+    def render(self, response_data):
+        """1-bit receipt image for one ``/send/sale`` answer."""
+        header, rule, footer = self.bands()
+        body = self.body(response_data)
+        qr = self.qr_image(response_data.get("QRCodeURL"))
+
+        heights = [
+            header.height,
+            body.y,
+            rule.height,
+            qr.height if qr else 0,
+            footer.height,
+        ]
+        image = Image.new("1", (WIDTH, sum(heights)), WHITE)
+        y = 0
+        image.paste(header, (0, y))
+        y += header.height
+        body.draw(image, top=y)
+        y += body.y
+        image.paste(rule, (0, y))
+        y += rule.height
+        if qr:
+            image.paste(qr, ((WIDTH - QR_SIZE) // 2, y))
+            y += qr.height
+        image.paste(footer, (0, y))
+        return image
+
+    def clear(self):
+        with self._lock:
+            self._fonts.clear()
+            self._bands = self._bands_key = None
+        with self._stamps_lock:
+            self._stamps.clear()
+
+
+receipt_renderer = ReceiptRenderer()
@@ -0,0 +1,342 @@
+"""Retention: delete old VehicleEntry rows together with their images.
+
+Rows are deleted in bounded batches by ``RetentionJob`` (see there), so
+a purge never holds one huge transaction or fires a signal per row.
+
+Camera images are stored per day (``entries/2026/10/17/...``, see
+``images``), so purging a day removes each of its directories
+(originals and thumbnails) with one ``rmtree`` instead of deleting files
+one by one. Files are only touched after the row deletion has committed,
+so a rolled back batch never leaves rows pointing at missing images.
+
+Images outside the dropped day directories whose rows are deleted
+(exit photos taken after the cutoff, files from the old flat
+``entries/`` layout) are deleted individually.
+"""
+
+import os
+import posixpath
+import shutil
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+
+from .change_events import change_events
+from .images import THUMBS_DIR, day_directory, thumbnail_name
+from .rollups import apply_deleted_open
+from .stats import day_bounds, local_date, local_today
+
+DEFAULT_RETENTION_DAYS = 20
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_BATCH_PAUSE = 0.05  # s, partiyalar orasida
+IMAGE_PREFIXES = ("entries", "exits")
+
+
+class RetentionResult:
+    """Counts of a purge; ``files`` grows as each batch commits."""
+
+    __slots__ = ("rows", "batches", "directories", "files")
+
+    def __init__(self):
+        self.rows = 0
+        self.batches = 0
+        self.directories = 0
+        self.files = 0
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def media_prefixes():
+    """Every directory tree that is sharded by day: originals and thumbnails."""
+    return IMAGE_PREFIXES + tuple(
+        posixpath.join(THUMBS_DIR, prefix) for prefix in IMAGE_PREFIXES
+    )
+
+
+def sharded_day(name):
+    """Day of a ``prefix/YYYY/MM/DD/file`` name, or None for the old flat layout."""
+    parts = (name or "").split("/")
+    if len(parts) < 5:
+        return None
+    try:
+        return date(int(parts[-4]), int(parts[-3]), int(parts[-2]))
+    except ValueError:
+        return None
+
+
+def media_days(prefix, storage=None):
+    """Days that have a directory under ``prefix``."""
+    storage = storage or default_storage
+    root = storage.path(prefix)
+    days = []
+    for year in _numeric_dirs(root):
+        for month in _numeric_dirs(os.path.join(root, year)):
+            for day in _numeric_dirs(os.path.join(root, year, month)):
+                try:
+                    days.append(date(int(year), int(month), int(day)))
+                except ValueError:
+                    continue
+    return sorted(days)
+
+
+def _numeric_dirs(path):
+    try:
+        with os.scandir(path) as entries:
+            return [e.name for e in entries if e.is_dir() and e.name.isdigit()]
+    except FileNotFoundError:
+        return []
+
+
+def drop_media_days(before_day, storage=None):
+    """Remove every day directory older than ``before_day``; returns how many."""
+    storage = storage or default_storage
+    dropped = 0
+    for prefix in media_prefixes():
+        for day in media_days(prefix, storage):
+            if day >= before_day:
+                break
+            path = storage.path(day_directory(prefix, day))
+            # Avval nomini o'zgartiramiz: kun bir zumda yo'qoladi, o'chirish keyin
+            trash = f"{path}.purge"
+            try:
+                os.rename(path, trash)
+            except FileNotFoundError:
+                continue
+            shutil.rmtree(trash, ignore_errors=True)
+            dropped += 1
+            _remove_empty_parents(os.path.dirname(path), storage.path(prefix))
+    return dropped
+
+
+def _remove_empty_parents(path, root):
+    while os.path.normpath(path) != os.path.normpath(root):
+        try:
+            os.rmdir(path)
+        except OSError:
+            return
+        path = os.path.dirname(path)
+
+
+def delete_media_files(names, storage=None):
+    """Delete single images and their thumbnails; returns how many originals went."""
+    storage = storage or default_storage
+    deleted = 0
+    for name in names:
+        for path in (name, thumbnail_name(name)):
+            try:
+                if storage.exists(path):
+                    storage.delete(path)
+                    deleted += path == name
+            except Exception as e:
+                print("[RETENTION ERROR]:", path, e)
+    return deleted
+
+
+def _still_referenced(names):
+    """Names another remaining row still points at (equal bytes share a file)."""
+    from .models import VehicleEntry
+
+    if not names:
+        return set()
+    rows = VehicleEntry.objects.filter(
+        Q(entry_image__in=names) | Q(exit_image__in=names)
+    ).values_list("entry_image", "exit_image")
+    return {name for pair in rows for name in pair if name in names}
+
+
+class RetentionJob:
+    """Deletes the rows matching ``condition`` in id-ordered batches.
+
+    Every batch is one short transaction: the rows are locked, removed
+    with a single ``DELETE ... WHERE id IN`` (no per-row ``post_delete``
+    signals) and the derived state is updated once for the whole batch -
+    open-entry counters of finished days, the occupancy/plate caches and
+    one coalesced WebSocket delta. Between batches the job sleeps
+    ``pause`` seconds so the gates never wait long on the table.
+
+    With ``drop_days_before`` the image directories of older days are
+    removed at the end; other images of deleted rows go one by one after
+    their batch commits.
+    """
+
+    def __init__(
+        self,
+        condition,
+        drop_days_before=None,
+        batch_size=None,
+        pause=None,
+        storage=None,
+        progress=None,
+    ):
+        self.condition = condition
+        self.drop_days_before = drop_days_before
+        self.batch_size = batch_size or getattr(
+            settings, "RETENTION_BATCH_SIZE", DEFAULT_BATCH_SIZE
+        )
+        self.pause = (
+            pause
+            if pause is not None
+            else getattr(settings, "RETENTION_BATCH_PAUSE", DEFAULT_BATCH_PAUSE)
+        )
+        self.storage = storage
+        self.progress = progress
+        self.result = RetentionResult()
+
+    def run(self):
+        last_id = 0
+        while True:
+            last_id = self._delete_batch(last_id)
+            if last_id is None:
+                break
+            if self.progress is not None:
+                self.progress(self.result)
+            if self.pause:
+                time.sleep(self.pause)
+        if self.drop_days_before is not None:
+            self.result.directories = drop_media_days(
+                self.drop_days_before, self.storage
+            )
+        return self.result
+
+    def _delete_batch(self, after_id):
+        """Delete the next batch after ``after_id``; returns its last id or None when done."""
+        from .models import FiscalOutbox, VehicleEntry
+
+        with change_events.batch(), transaction.atomic():
+            rows = list(
+                VehicleEntry.objects.select_for_update()
+                .filter(self.condition, id__gt=after_id)
+                .order_by("id")
+                .values_list(
+                    "id", "entry_time", "exit_time", "entry_image", "exit_image"
+                )[: self.batch_size]
+            )
+            if not rows:
+                return None
+            ids = [row[0] for row in rows]
+            open_days = Counter()
+            names = set()
+            for _, entry_time, exit_time, entry_image, exit_image in rows:
+                if exit_time is None:
+                    open_days[local_date(entry_time)] += 1
+                for name in (entry_image, exit_image):
+                    if name and not self._in_dropped_day(name):
+                        names.add(name)
+
+            # _raw_delete on_delete=SET_NULL ni bajarmaydi: soliq savdolari qoladi, bog'lanish uziladi
+            FiscalOutbox.objects.filter(entry_id__in=ids).update(entry=None)
+            batch = VehicleEntry.objects.filter(id__in=ids)
+            # Signalsiz bitta DELETE (Django "fast delete" ham shu yo'l bilan o'chiradi)
+            deleted = batch._raw_delete(batch.db)
+            apply_deleted_open(open_days)
+            change_events.report_deleted(ids)
+            names -= _still_referenced(names)
+            transaction.on_commit(lambda: self._delete_files(names))
+
+        self.result.rows += deleted
+        self.result.batches += 1
+        return ids[-1]
+
+    def _in_dropped_day(self, name):
+        day = sharded_day(name)
+        return (
+            self.drop_days_before is not None
+            and day is not None
+            and day < self.drop_days_before
+        )
+
+    def _delete_files(self, names):
+        self.result.files += delete_media_files(names, self.storage)
+
+
+def delete_entries(queryset, storage=None, **options):
+    """Delete the rows of ``queryset`` in batches, with the images only they used."""
+    return (
+        RetentionJob(Q(pk__in=queryset.values("pk")), storage=storage, **options)
+        .run()
+        .rows
+    )
+
+
+def purge_before(cutoff_day, storage=None, **options):
+    """Delete entries that came in before ``cutoff_day`` and every older day of images."""
+    start, _ = day_bounds(cutoff_day)
+    return RetentionJob(
+        Q(entry_time__lt=start), drop_days_before=cutoff_day, storage=storage, **options
+    ).run()
+
+
+def retention_cutoff(days=None):
+    """First day that is kept under ``RETENTION_DAYS``."""
+    if days is None:
+        days = getattr(settings, "RETENTION_DAYS", DEFAULT_RETENTION_DAYS)
+    return local_today() - timedelta(days=days)
+
+
+class RetentionRunner:
+    """Runs one purge at a time in a background thread (for the home page button)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self.cutoff_day = None
+        self.result = None
+        self.error = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, cutoff_day=None):
+        """Start purging before ``cutoff_day``; False if a purge is already running."""
+        with self._lock:
+            if self.running:
+                return False
+            self.cutoff_day = cutoff_day or retention_cutoff()
+            self.result = RetentionResult()
+            self.error = None
+            self._thread = threading.Thread(
+                target=self._run, name="retention", daemon=True
+            )
+            self._thread.start()
+        return True
+
+    def join(self, timeout=None):
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _progress(self, result):
+        self.result = result
+
+    def _run(self):
+        close_old_connections()
+        try:
+            self.result = purge_before(self.cutoff_day, progress=self._progress)
+            print(
+                f"[RETENTION] {self.result.rows} yozuv, "
+                f"{self.result.directories} kunlik papka o'chirildi"
+            )
+        except Exception as e:
+            self.error = str(e)
+            print("[RETENTION ERROR]:", e)
+        finally:
+            close_old_connections()
+
+    def status(self):
+        return {
+            "running": self.running,
+            "cutoff_day": self.cutoff_day.isoformat() if self.cutoff_day else None,
+            "error": self.error,
+            **(self.result.as_dict() if self.result else {}),
+        }
+
+
+retention_runner = RetentionRunner()
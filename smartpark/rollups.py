@@ -0,0 +1,264 @@
+"""Daily roll-ups of VehicleEntry traffic and revenue.
+
+One ``DailyParkingStats`` row per finished day keeps what range reports
+need (entries, exits, paid count, revenue, free exits, peak occupancy),
+so summaries over weeks or months read a few hundred small rows instead
+of every raw entry. Today is never rolled up; it is read from
+``VehicleEntry`` directly.
+
+Rows are written when a day is finished (``close_finished_days()``, run
+by the background worker) or by ``manage.py backfill_daily_stats``.
+After that, saves that touch a finished day (a late payment, a car
+exiting after midnight) move the row by deltas from the signals, and
+bulk ``update()`` calls recompute the affected days.
+
+Deleting raw rows does not rewrite history: the 20-day retention may
+purge old entries while their days keep their numbers. Only
+``open_entries`` follows deletes, since a purged car is no longer inside.
+A recompute (bulk updates, ``backfill_daily_stats --force``) reads only
+the rows that are still there.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Count, F, Max, Min, Q, Sum
+
+from .stats import day_bounds, local_date, local_today
+
+# Yig'ma hisoblash uchun kerakli VehicleEntry fieldlari
+ROLLUP_FIELDS = frozenset({"entry_time", "exit_time", "is_paid", "total_amount"})
+
+SUMMARY_FIELDS = {
+    "paid_count": "paid_count",
+    "paid_sum": "revenue",
+    "unpaid_zero_count": "free_exits",
+    "exited_count": "exits",
+    "inside_count": "open_entries",
+}
+
+
+def rollup_state(entry):
+    """(entry_day, exit_day, is_paid, total_amount) - what an entry adds to the roll-ups."""
+    if entry.entry_time is None:
+        return None
+    return (
+        local_date(entry.entry_time),
+        local_date(entry.exit_time) if entry.exit_time is not None else None,
+        entry.is_paid,
+        entry.total_amount,
+    )
+
+
+def contributions(state):
+    """Yield (day, field, delta) for one entry state."""
+    if state is None:
+        return
+    entry_day, exit_day, is_paid, amount = state
+    yield entry_day, "entries", 1
+    if exit_day is None:
+        yield entry_day, "open_entries", 1
+        return
+    yield exit_day, "exits", 1
+    if is_paid and amount is not None:
+        if amount > 0:
+            yield exit_day, "paid_count", 1
+            yield exit_day, "revenue", amount
+        elif amount == 0:
+            yield exit_day, "free_exits", 1
+
+
+def exit_summary(queryset):
+    """Exit-based report numbers for ``queryset`` (already limited to the window) in one query."""
+    paid = Q(is_paid=True, total_amount__gt=0)
+    counts = queryset.filter(exit_time__isnull=False).aggregate(
+        exited_count=Count("id"),
+        paid_count=Count("id", filter=paid),
+        paid_sum=Sum("total_amount", filter=paid),
+        unpaid_zero_count=Count("id", filter=Q(is_paid=True, total_amount=0)),
+    )
+    counts["paid_sum"] = counts["paid_sum"] or 0
+    return counts
+
+
+def compute_day(day):
+    """Roll-up values for ``day`` computed from VehicleEntry rows."""
+    from .models import VehicleEntry
+
+    start, end = day_bounds(day)
+    entered = Q(entry_time__gte=start, entry_time__lte=end)
+    exited = Q(exit_time__gte=start, exit_time__lte=end)
+    paid = exited & Q(is_paid=True, total_amount__gt=0)
+
+    touched = VehicleEntry.objects.filter(entered | exited)
+    values = touched.aggregate(
+        entries=Count("id", filter=entered),
+        open_entries=Count("id", filter=entered & Q(exit_time__isnull=True)),
+        exits=Count("id", filter=exited),
+        paid_count=Count("id", filter=paid),
+        revenue=Sum("total_amount", filter=paid),
+        free_exits=Count("id", filter=exited & Q(is_paid=True, total_amount=0)),
+    )
+    values["revenue"] = values["revenue"] or 0
+
+    # Eng ko'p band bo'lgan payt: kun boshidagi mashinalar + kirish/chiqish hodisalari
+    inside = VehicleEntry.objects.filter(
+        Q(exit_time__isnull=True) | Q(exit_time__gte=start), entry_time__lt=start
+    ).count()
+    events = []
+    for entry_time, exit_time in touched.values_list("entry_time", "exit_time"):
+        if start <= entry_time <= end:
+            events.append((entry_time, 1))
+        if exit_time is not None and start <= exit_time <= end:
+            events.append((exit_time, -1))
+    peak = inside
+    for _, delta in sorted(events):
+        inside += delta
+        peak = max(peak, inside)
+    values["peak_occupancy"] = peak
+    return values
+
+
+def refresh_day(day):
+    """Recompute and store the roll-up row of ``day``."""
+    from .models import DailyParkingStats
+
+    return DailyParkingStats.objects.update_or_create(
+        day=day, defaults=compute_day(day)
+    )[0]
+
+
+def close_finished_days(today=None):
+    """Roll up every finished day after the newest existing row (yesterday if there is none)."""
+    from .models import DailyParkingStats
+
+    today = today or local_today()
+    last = DailyParkingStats.objects.aggregate(last=Max("day"))["last"]
+    day = last + timedelta(days=1) if last else today - timedelta(days=1)
+    closed = 0
+    while day < today:
+        refresh_day(day)
+        closed += 1
+        day += timedelta(days=1)
+    return closed
+
+
+def apply_change(old_state, new_state):
+    """Move finished-day rows from ``old_state`` to ``new_state`` (either may be None)."""
+    from .models import DailyParkingStats
+
+    if old_state == new_state:
+        return
+    deltas = defaultdict(lambda: defaultdict(int))
+    for day, field, delta in contributions(old_state):
+        deltas[day][field] -= delta
+    for day, field, delta in contributions(new_state):
+        deltas[day][field] += delta
+
+    # Bugungi kun hali yig'ilmagan - odatdagi saqlashlarda so'rov yo'q
+    today = local_today()
+    for day, fields in deltas.items():
+        changed = {field: F(field) + delta for field, delta in fields.items() if delta}
+        if day < today and changed:
+            DailyParkingStats.objects.filter(day=day).update(**changed)
+
+
+def apply_delete(state):
+    """A deleted car is no longer inside; its traffic stays in the history."""
+    from .models import DailyParkingStats
+
+    if state is None or state[1] is not None or state[0] >= local_today():
+        return
+    DailyParkingStats.objects.filter(day=state[0]).update(
+        open_entries=F("open_entries") - 1
+    )
+
+
+def apply_deleted_open(open_days):
+    """Bulk ``apply_delete``: ``{day: count}`` of deleted entries that had not exited."""
+    from .models import DailyParkingStats
+
+    today = local_today()
+    for day, count in open_days.items():
+        if day < today:
+            DailyParkingStats.objects.filter(day=day).update(
+                open_entries=F("open_entries") - count
+            )
+
+
+def refresh_days(days):
+    """Recompute the finished days among ``days`` that already have a row."""
+    from .models import DailyParkingStats
+
+    today = local_today()
+    existing = DailyParkingStats.objects.filter(
+        day__in=[day for day in days if day < today]
+    ).values_list("day", flat=True)
+    for day in existing:
+        refresh_day(day)
+
+
+def refresh_entries(entry_ids):
+    """Recompute the finished days touched by entries changed with ``update()``."""
+    from .models import VehicleEntry
+
+    days = set()
+    for entry_time, exit_time in VehicleEntry.objects.filter(
+        id__in=list(entry_ids)
+    ).values_list("entry_time", "exit_time"):
+        days.add(local_date(entry_time))
+        if exit_time is not None:
+            days.add(local_date(exit_time))
+    refresh_days(days)
+
+
+def raw_summary(first_day, last_day):
+    """Report numbers for whole days ``first_day``..``last_day`` from VehicleEntry rows."""
+    from .models import VehicleEntry
+
+    start, end = day_bounds(first_day)[0], day_bounds(last_day)[1]
+    summary = exit_summary(
+        VehicleEntry.objects.filter(exit_time__gte=start, exit_time__lte=end)
+    )
+    summary["inside_count"] = VehicleEntry.objects.filter(
+        exit_time__isnull=True, entry_time__gte=start, entry_time__lte=end
+    ).count()
+    return summary
+
+
+def range_summary(first_day, last_day):
+    """Report numbers for ``first_day``..``last_day``: roll-ups for finished days, raw rows for today.
+
+    Falls back to raw rows if any finished day in the range has no roll-up
+    yet (run ``backfill_daily_stats``).
+    """
+    from .models import DailyParkingStats
+
+    today = local_today()
+    closed_last = min(last_day, today - timedelta(days=1))
+    summary = dict.fromkeys(SUMMARY_FIELDS, 0)
+
+    if first_day <= closed_last:
+        totals = DailyParkingStats.objects.filter(
+            day__gte=first_day, day__lte=closed_last
+        ).aggregate(
+            days=Count("id"),
+            **{key: Sum(field) for key, field in SUMMARY_FIELDS.items()},
+        )
+        if totals["days"] != (closed_last - first_day).days + 1:
+            return raw_summary(first_day, last_day)
+        for key in SUMMARY_FIELDS:
+            summary[key] = totals[key] or 0
+
+    if last_day >= today:
+        live = raw_summary(max(first_day, today), last_day)
+        for key in SUMMARY_FIELDS:
+            summary[key] += live[key]
+    return summary
+
+
+def first_entry_day():
+    from .models import VehicleEntry
+
+    first = VehicleEntry.objects.aggregate(first=Min("entry_time"))["first"]
+    return local_date(first) if first else None
@@ -0,0 +1,284 @@
+"""Small in-process job scheduler with leader election.
+
+Jobs are registered with ``@scheduler.job(...)`` (see ``jobs``) and only
+run in the process that holds the ``SchedulerLease`` row, so several
+workers never clean up or roll up the same data twice:
+
+- a heartbeat thread takes or renews the lease every ``lease / 3``
+  seconds; when the leader dies its lease expires and another worker
+  takes over;
+- a runner thread runs the due jobs one after another while this
+  process is the leader.
+
+A job runs ``every`` N seconds (``align=True`` snaps to wall-clock
+multiples, e.g. every 3600 -> at the top of the hour) or daily ``at``
+"HH:MM"; ``jitter`` adds a random delay so jobs do not all fire at once.
+Each job keeps run/failure counts and timings for ``status()``.
+
+The scheduler is started by the ASGI/WSGI entry points (``start()``), so
+manage.py commands and test runs never run jobs.
+"""
+
+import random
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+DEFAULT_LEASE_SECONDS = 60
+LEASE_NAME = "smartpark-scheduler"
+IDLE_SECONDS = 30  # yetakchi bo'lmaganda ham shuncha vaqtda bir tekshiradi
+
+
+class Job:
+    """One scheduled function and its metrics."""
+
+    def __init__(self, name, func, every=None, at=None, jitter=0, align=False):
+        if (every is None) == (at is None):
+            raise ValueError(f"Job {name}: 'every' yoki 'at' dan bittasi kerak")
+        self.name = name
+        self.func = func
+        self.every = every
+        self.at = datetime.strptime(at, "%H:%M").time() if at else None
+        self.jitter = jitter
+        self.align = align
+        self.next_run = None
+        self.runs = 0
+        self.failures = 0
+        self.last_started = None
+        self.last_duration = None
+        self.last_error = None
+        self.running = False
+
+    def next_after(self, now):
+        """Next run time (epoch seconds) after ``now``."""
+        delay = random.uniform(0, self.jitter) if self.jitter else 0
+        if self.at is not None:
+            wall = datetime.fromtimestamp(now)
+            target = datetime.combine(wall.date(), self.at)
+            if target <= wall:
+                target += timedelta(days=1)
+            return target.timestamp() + delay
+        if self.align:
+            # Mahalliy soat bo'yicha tekislanadi (masalan har soat boshida)
+            offset = (
+                datetime.fromtimestamp(now).astimezone().utcoffset().total_seconds()
+            )
+            local = now + offset
+            return local - local % self.every + self.every - offset + delay
+        return now + self.every + delay
+
+    def first_run(self, now):
+        """Interval jobs run soon after a worker becomes leader; daily ones wait."""
+        if self.at is not None or self.align:
+            return self.next_after(now)
+        return now + (random.uniform(0, self.jitter) if self.jitter else 0)
+
+    def run(self):
+        self.running = True
+        self.last_started = time.time()
+        try:
+            self.func()
+        except Exception as e:
+            self.failures += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"[SCHEDULER ERROR]: {self.name}: {e}")
+        else:
+            self.last_error = None
+        finally:
+            self.runs += 1
+            self.last_duration = time.time() - self.last_started
+            self.running = False
+
+    def as_dict(self):
+        def stamp(value):
+            return (
+                datetime.fromtimestamp(value).isoformat(timespec="seconds")
+                if value
+                else None
+            )
+
+        return {
+            "name": self.name,
+            "every": self.every,
+            "at": self.at.strftime("%H:%M") if self.at else None,
+            "runs": self.runs,
+            "failures": self.failures,
+            "running": self.running,
+            "last_started": stamp(self.last_started),
+            "last_duration": round(self.last_duration, 3)
+            if self.last_duration is not None
+            else None,
+            "last_error": self.last_error,
+            "next_run": stamp(self.next_run),
+        }
+
+
+class Scheduler:
+    def __init__(self, lease_name=LEASE_NAME, lease_seconds=None):
+        self.lease_name = lease_name
+        self._lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{uuid.uuid4().hex[:8]}"
+        self.jobs = {}
+        self.is_leader = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._threads = []
+
+    @property
+    def lease_seconds(self):
+        if self._lease_seconds is not None:
+            return self._lease_seconds
+        return getattr(settings, "SCHEDULER_LEASE_SECONDS", DEFAULT_LEASE_SECONDS)
+
+    def job(self, name, every=None, at=None, jitter=0, align=False):
+        """Decorator registering ``func`` as a job."""
+
+        def register(func):
+            self.add(Job(name, func, every=every, at=at, jitter=jitter, align=align))
+            return func
+
+        return register
+
+    def add(self, job):
+        with self._lock:
+            if job.name in self.jobs:
+                raise ValueError(f"Job {job.name} takrorlangan")
+            self.jobs[job.name] = job
+
+    # Yetakchilik
+
+    def elect(self):
+        """Take or renew the lease; returns True while this process leads."""
+        from .models import SchedulerLease
+
+        now = timezone.now()
+        until = now + timedelta(seconds=self.lease_seconds)
+        taken = (
+            SchedulerLease.objects.filter(name=self.lease_name)
+            .filter(Q(owner=self.owner) | Q(expires_at__lt=now))
+            .update(owner=self.owner, expires_at=until)
+        )
+        if not taken:
+            try:
+                with transaction.atomic():
+                    SchedulerLease.objects.create(
+                        name=self.lease_name, owner=self.owner, expires_at=until
+                    )
+                taken = 1
+            except IntegrityError:
+                taken = 0
+        was_leader, self.is_leader = self.is_leader, bool(taken)
+        if self.is_leader and not was_leader:
+            print(f"[SCHEDULER] {self.owner} yetakchi bo'ldi")
+            now_ts = time.time()
+            for job in self.jobs.values():
+                job.next_run = job.first_run(now_ts)
+            self._wake.set()
+        return self.is_leader
+
+    def resign(self):
+        from .models import SchedulerLease
+
+        if self.is_leader:
+            SchedulerLease.objects.filter(
+                name=self.lease_name, owner=self.owner
+            ).update(expires_at=timezone.now())
+        self.is_leader = False
+
+    # Bajarish
+
+    def run_pending(self, now=None):
+        """Run every due job once (only on the leader); returns how many ran."""
+        if not self.is_leader:
+            return 0
+        now = now if now is not None else time.time()
+        ran = 0
+        for job in list(self.jobs.values()):
+            if self._stop.is_set() or not self.is_leader:
+                break
+            if job.next_run is None or job.next_run > now:
+                continue
+            job.run()
+            ran += 1
+            job.next_run = job.next_after(time.time())
+        return ran
+
+    def seconds_until_next(self):
+        upcoming = [
+            job.next_run for job in self.jobs.values() if job.next_run is not None
+        ]
+        if not self.is_leader or not upcoming:
+            return IDLE_SECONDS
+        return max(0.0, min(min(upcoming) - time.time(), IDLE_SECONDS))
+
+    def _heartbeat(self):
+        while not self._stop.is_set():
+            close_old_connections()
+            try:
+                self.elect()
+            except Exception as e:
+                # DB yo'q: yetakchilikni ushlab turmaymiz, boshqasi olsin
+                self.is_leader = False
+                print("[SCHEDULER ERROR]: lease:", e)
+            self._stop.wait(self.lease_seconds / 3)
+
+    def _runner(self):
+        while not self._stop.is_set():
+            # Bu thread so'rov siklidan tashqarida: eskirgan ulanishlarni o'zimiz yopamiz
+            close_old_connections()
+            try:
+                self.run_pending()
+            finally:
+                close_old_connections()
+            self._wake.wait(self.seconds_until_next())
+            self._wake.clear()
+
+    def start(self):
+        """Start the heartbeat and runner threads (idempotent; off when SCHEDULER_ENABLED=False)."""
+        if not getattr(settings, "SCHEDULER_ENABLED", True):
+            return False
+        from . import jobs  # noqa: F401 - vazifalarni ro'yxatga oladi
+
+        with self._lock:
+            if self._threads:
+                return False
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(
+                    target=self._heartbeat, name="scheduler-lease", daemon=True
+                ),
+                threading.Thread(target=self._runner, name="scheduler", daemon=True),
+            ]
+            for thread in self._threads:
+                thread.start()
+        return True
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
+        try:
+            self.resign()
+        except Exception as e:
+            print("[SCHEDULER ERROR]:", e)
+
+    def status(self):
+        return {
+            "owner": self.owner,
+            "leader": self.is_leader,
+            "jobs": [job.as_dict() for job in self.jobs.values()],
+        }
+
+
+scheduler = Scheduler()
@@ -1,10 +1,34 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_init, post_save, post_delete
 from django.dispatch import receiver
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
-from .models import VehicleEntry, Cars
-from django.utils import timezone
-from datetime import datetime, timedelta
+from .models import VehicleEntry, Cars, TariffPlan
+from .change_events import change_events
+from .images import thumbnail_url
+from .stats import STATS_FIELDS, day_bounds, entry_state, local_today, occupancy
+from .rollups import (
+    ROLLUP_FIELDS,
+    apply_change,
+    apply_delete,
+    refresh_days,
+    rollup_state,
+)
+from .tariff import tariffs
+from .plate_policy import plate_policies
+from .plate_index import open_plate, open_plates
+from django.db import transaction
+
+
+@receiver(post_init, sender=VehicleEntry)
+def remember_vehicle_entry_state(sender, instance, **kwargs):
+    """Remember what this entry contributes to the counters, to diff on save"""
+    deferred = instance.get_deferred_fields()
+    if STATS_FIELDS.isdisjoint(deferred):
+        instance._stats_state = entry_state(instance)
+    if ROLLUP_FIELDS.isdisjoint(deferred):
+        instance._rollup_state = rollup_state(instance)
+    if {"number_plate", "exit_time"}.isdisjoint(deferred):
+        instance._open_plate = open_plate(instance)
 
 
 @receiver(post_save, sender=VehicleEntry)
@@ -12,102 +36,50 @@ def vehicle_entry_updated(sender, instance, created, **kwargs):
     """Send WebSocket update when VehicleEntry is created or updated"""
     channel_layer = get_channel_layer()
 
-    # Get statistics for today using timezone-aware datetime range
-    today = timezone.now().date()
-    start_datetime = timezone.make_aware(datetime.combine(today, datetime.min.time()))
-    end_datetime = timezone.make_aware(datetime.combine(today, datetime.max.time()))
-
-    today_entries = VehicleEntry.objects.filter(
-        entry_time__gte=start_datetime, entry_time__lte=end_datetime
-    )
-    total_entries = today_entries.count()
-    total_exits = today_entries.filter(exit_time__isnull=False).count()
-    total_inside = total_entries - total_exits
-    unpaid_entries = today_entries.filter(
-        is_paid=False, exit_time__isnull=False
-    ).count()
-
-    # Prepare statistics data
-    stats_data = {
-        "total_entries": total_entries,
-        "total_exits": total_exits,
-        "total_inside": total_inside,
-        "unpaid_entries": unpaid_entries,
-    }
-
-    # Get entries that either:
-    # 1. Entered today (normal case)
-    # 2. Entered yesterday but exited today (overnight parking)
-    today_entries = VehicleEntry.objects.filter(
-        entry_time__gte=start_datetime, entry_time__lte=end_datetime
-    )
-
-    # Also include vehicles that entered yesterday but exited today
-    yesterday_start = timezone.make_aware(
-        datetime.combine(today - timedelta(days=1), datetime.min.time())
-    )
-    yesterday_end = timezone.make_aware(
-        datetime.combine(today - timedelta(days=1), datetime.max.time())
-    )
-
-    overnight_entries = VehicleEntry.objects.filter(
-        entry_time__gte=yesterday_start,
-        entry_time__lte=yesterday_end,
-        exit_time__gte=start_datetime,
-        exit_time__lte=end_datetime,
-    )
-
-    # Get all entry IDs from both querysets
-    today_ids = list(today_entries.values_list("id", flat=True))
-    overnight_ids = list(overnight_entries.values_list("id", flat=True))
-    all_ids = today_ids + overnight_ids
+    # Statistikani COUNT so'rovlarsiz, faqat o'zgarish (delta) bilan yangilaymiz.
+    # Hisoblagichlar commitdan keyin yangilanadi: rollback bo'lsa delta qo'llanmaydi
+    new_state = entry_state(instance)
+    new_rollup = rollup_state(instance)
+    new_open_plate = open_plate(instance)
+    unknown = object()
+    old_state = None if created else getattr(instance, "_stats_state", unknown)
+    old_rollup = None if created else getattr(instance, "_rollup_state", unknown)
+    old_open_plate = None if created else getattr(instance, "_open_plate", unknown)
+    instance._stats_state = new_state
+    instance._rollup_state = new_rollup
+    instance._open_plate = new_open_plate
+
+    def apply_deltas():
+        if old_state is unknown:
+            # Oldingi holat noma'lum (masalan, deferred fieldlar bilan yuklangan)
+            occupancy.invalidate()
+        else:
+            occupancy.apply(old_state, new_state)
 
-    # Get all entries by IDs and order by entry_time
-    entries = VehicleEntry.objects.filter(id__in=all_ids).order_by("-entry_time")
-    entries_data = []
+        # Tugagan kunlar yig'masi (bugungi saqlashlarda so'rov yubormaydi)
+        if old_rollup is not unknown:
+            apply_change(old_rollup, new_rollup)
+        elif new_rollup is not None:
+            refresh_days({new_rollup[0], new_rollup[1]} - {None})
 
-    for entry in entries:
-        # Calculate duration in hours if exit time exists
-        duration_hours = None
-        if entry.exit_time and entry.entry_time:
-            duration_hours = (entry.exit_time - entry.entry_time).total_seconds() / 3600
+        # Ochiq raqamlar indeksi (chiqishda noto'g'ri o'qilgan raqamni moslashtirish uchun)
+        if old_open_plate is unknown:
+            open_plates.invalidate()
+        else:
+            open_plates.apply(old_open_plate, new_open_plate)
 
-        entries_data.append(
-            {
-                "id": entry.id,
-                "number_plate": entry.number_plate,
-                "entry_time": entry.entry_time.strftime("%H:%M"),
-                "exit_time": entry.exit_time.strftime("%H:%M")
-                if entry.exit_time
-                else None,
-                "total_amount": entry.total_amount or 0,
-                "is_paid": entry.is_paid,
-                "entry_image": entry.entry_image.url if entry.entry_image else None,
-                "exit_image": entry.exit_image.url if entry.exit_image else None,
-                "status": "inside"
-                if not entry.exit_time
-                else ("paid" if entry.is_paid else "unpaid"),
-                "duration_hours": duration_hours,
-            }
-        )
+        # Broadcast only the changed entry (coalesced with other changes in the window)
+        change_events.entry_changed(instance, action)
 
     # Determine action type
     action = "created" if created else "updated"
     if not created and instance.is_paid:
         action = "payment_completed"
 
-    # Broadcast update to all connected clients
-    async_to_sync(channel_layer.group_send)(
-        "home_updates",
-        {
-            "type": "broadcast_update",
-            "statistics": stats_data,
-            "vehicle_entries": entries_data,
-            "action": action,
-            "entry_id": instance.id,
-            "number_plate": instance.number_plate,
-        },
-    )
+    transaction.on_commit(apply_deltas)
+
+    # USE_TZ sozlamasiga mos bugungi kun chegaralari
+    start_datetime, end_datetime = day_bounds(local_today())
 
     # Send latest unpaid entry update for unpaid entries page
     if instance.exit_time and not instance.is_paid:
@@ -140,6 +112,8 @@ def vehicle_entry_updated(sender, instance, created, **kwargs):
                 "exit_image": latest_unpaid.exit_image.url
                 if latest_unpaid.exit_image
                 else None,
+                "entry_thumb": thumbnail_url(latest_unpaid.entry_image),
+                "exit_thumb": thumbnail_url(latest_unpaid.exit_image),
             }
         else:
             latest_unpaid_data = None
@@ -183,6 +157,8 @@ def vehicle_entry_updated(sender, instance, created, **kwargs):
                 "exit_image": latest_unpaid.exit_image.url
                 if latest_unpaid.exit_image
                 else None,
+                "entry_thumb": thumbnail_url(latest_unpaid.entry_image),
+                "exit_thumb": thumbnail_url(latest_unpaid.exit_image),
             }
         else:
             latest_unpaid_data = None
@@ -199,104 +175,32 @@ def vehicle_entry_updated(sender, instance, created, **kwargs):
 @receiver(post_delete, sender=VehicleEntry)
 def vehicle_entry_deleted(sender, instance, **kwargs):
     """Send WebSocket update when VehicleEntry is deleted"""
-    channel_layer = get_channel_layer()
+    old_state = getattr(instance, "_stats_state", entry_state(instance))
+    old_rollup = getattr(instance, "_rollup_state", rollup_state(instance))
+    old_open_plate = getattr(instance, "_open_plate", open_plate(instance))
 
-    # Get updated statistics for today using timezone-aware datetime range
-    today = timezone.now().date()
-    start_datetime = timezone.make_aware(datetime.combine(today, datetime.min.time()))
-    end_datetime = timezone.make_aware(datetime.combine(today, datetime.max.time()))
+    def apply_deltas():
+        occupancy.apply(old_state, None)
+        apply_delete(old_rollup)
+        open_plates.apply(old_open_plate, None)
 
-    today_entries = VehicleEntry.objects.filter(
-        entry_time__gte=start_datetime, entry_time__lte=end_datetime
-    )
-    total_entries = today_entries.count()
-    total_exits = today_entries.filter(exit_time__isnull=False).count()
-    total_inside = total_entries - total_exits
-    unpaid_entries = today_entries.filter(
-        is_paid=False, exit_time__isnull=False
-    ).count()
-
-    # Prepare statistics data
-    stats_data = {
-        "total_entries": total_entries,
-        "total_exits": total_exits,
-        "total_inside": total_inside,
-        "unpaid_entries": unpaid_entries,
-    }
-
-    # Get entries that either:
-    # 1. Entered today (normal case)
-    # 2. Entered yesterday but exited today (overnight parking)
-    today_entries = VehicleEntry.objects.filter(
-        entry_time__gte=start_datetime, entry_time__lte=end_datetime
-    )
-
-    # Also include vehicles that entered yesterday but exited today
-    yesterday_start = timezone.make_aware(
-        datetime.combine(today - timedelta(days=1), datetime.min.time())
-    )
-    yesterday_end = timezone.make_aware(
-        datetime.combine(today - timedelta(days=1), datetime.max.time())
-    )
-
-    overnight_entries = VehicleEntry.objects.filter(
-        entry_time__gte=yesterday_start,
-        entry_time__lte=yesterday_end,
-        exit_time__gte=start_datetime,
-        exit_time__lte=end_datetime,
-    )
+        # Faqat o'chirilgan yozuv haqida delta yuboramiz
+        change_events.entry_changed(instance, "deleted", deleted=True)
 
-    # Get all entry IDs from both querysets
-    today_ids = list(today_entries.values_list("id", flat=True))
-    overnight_ids = list(overnight_entries.values_list("id", flat=True))
-    all_ids = today_ids + overnight_ids
+    transaction.on_commit(apply_deltas)
 
-    # Get all entries by IDs and order by entry_time
-    entries = VehicleEntry.objects.filter(id__in=all_ids).order_by("-entry_time")
-    entries_data = []
-
-    for entry in entries:
-        # Calculate duration in hours if exit time exists
-        duration_hours = None
-        if entry.exit_time and entry.entry_time:
-            duration_hours = (entry.exit_time - entry.entry_time).total_seconds() / 3600
-
-        entries_data.append(
-            {
-                "id": entry.id,
-                "number_plate": entry.number_plate,
-                "entry_time": entry.entry_time.strftime("%H:%M"),
-                "exit_time": entry.exit_time.strftime("%H:%M")
-                if entry.exit_time
-                else None,
-                "total_amount": entry.total_amount or 0,
-                "is_paid": entry.is_paid,
-                "entry_image": entry.entry_image.url if entry.entry_image else None,
-                "exit_image": entry.exit_image.url if entry.exit_image else None,
-                "status": "inside"
-                if not entry.exit_time
-                else ("paid" if entry.is_paid else "unpaid"),
-                "duration_hours": duration_hours,
-            }
-        )
 
-    # Send updates to all connected clients
-    async_to_sync(channel_layer.group_send)(
-        "home_updates",
-        {
-            "type": "broadcast_update",
-            "statistics": stats_data,
-            "vehicle_entries": entries_data,
-            "action": "deleted",
-            "entry_id": instance.id,
-            "number_plate": instance.number_plate,
-        },
-    )
+def plate_policy_changed():
+    """Drop cached gate policies now and, after commit, here and in other workers"""
+    # Commitdan oldin boshqa thread eski qiymatni qayta yuklashi mumkin - shuning uchun ikki marta
+    plate_policies.invalidate(broadcast=False)
+    transaction.on_commit(plate_policies.invalidate)
 
 
 @receiver(post_save, sender=Cars)
 def car_updated(sender, instance, created, **kwargs):
     """Send WebSocket update when Cars is created or updated"""
+    plate_policy_changed()
     channel_layer = get_channel_layer()
 
     # Prepare car data
@@ -322,6 +226,7 @@ def car_updated(sender, instance, created, **kwargs):
 @receiver(post_delete, sender=Cars)
 def car_deleted(sender, instance, **kwargs):
     """Send WebSocket update when Cars is deleted"""
+    plate_policy_changed()
     channel_layer = get_channel_layer()
 
     # Send updates to all connected clients
@@ -338,3 +243,10 @@ def car_deleted(sender, instance, **kwargs):
             "action": "deleted",
         },
     )
+
+
+@receiver(post_save, sender=TariffPlan)
+@receiver(post_delete, sender=TariffPlan)
+def tariff_plan_changed(sender, instance, **kwargs):
+    """Recompile tariff tables on next lookup"""
+    tariffs.invalidate()
@@ -0,0 +1,190 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+
+# Agar hech narsa bo'lmasa ham har 5 daqiqada DB bilan solishtiriladi
+DEFAULT_RECONCILE_SECONDS = 300
+
+# VehicleEntry fieldlari, ulardan statistikaga ta'sir qiladiganlari
+STATS_FIELDS = frozenset({"entry_time", "exit_time", "is_paid"})
+
+
+def day_bounds(day):
+    """Return (start, end) datetimes covering ``day`` in the project timezone."""
+    start = datetime.combine(day, datetime.min.time())
+    end = datetime.combine(day, datetime.max.time())
+    if settings.USE_TZ:
+        start = timezone.make_aware(start)
+        end = timezone.make_aware(end)
+    return start, end
+
+
+def local_date(value):
+    """Date of a (naive or aware) datetime in the project timezone."""
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.date()
+
+
+def local_today():
+    return local_date(timezone.now())
+
+
+def parse_day(date_str):
+    """``YYYY-MM-DD`` from a request, or today if it is missing or malformed."""
+    try:
+        return datetime.strptime(date_str, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return local_today()
+
+
+def listed_entries_filter(day):
+    """Entries shown for ``day``: entered that day, or entered the day before and exited on it."""
+    start, end = day_bounds(day)
+    yesterday_start, yesterday_end = day_bounds(day - timedelta(days=1))
+    return Q(entry_time__gte=start, entry_time__lte=end) | Q(
+        entry_time__gte=yesterday_start,
+        entry_time__lte=yesterday_end,
+        exit_time__gte=start,
+        exit_time__lte=end,
+    )
+
+
+def entry_state(entry):
+    """(entry_day, exit_day, is_unpaid_exit) - what a VehicleEntry adds to the counters."""
+    if entry.entry_time is None:
+        return None
+    exit_day = local_date(entry.exit_time) if entry.exit_time is not None else None
+    return (
+        local_date(entry.entry_time),
+        exit_day,
+        exit_day is not None and not entry.is_paid,
+    )
+
+
+def state_counts_for(state, day):
+    """Python-side twin of ``listed_entries_filter`` for an ``entry_state``."""
+    if state is None:
+        return False
+    entry_day, exit_day, _ = state
+    return entry_day == day or (
+        entry_day == day - timedelta(days=1) and exit_day == day
+    )
+
+
+def day_statistics(day):
+    """Counters for ``day`` with a single conditional-aggregation query."""
+    from .models import VehicleEntry
+
+    counts = VehicleEntry.objects.filter(listed_entries_filter(day)).aggregate(
+        total_entries=Count("id"),
+        total_exits=Count("id", filter=Q(exit_time__isnull=False)),
+        unpaid_entries=Count("id", filter=Q(exit_time__isnull=False, is_paid=False)),
+    )
+    return {
+        "total_entries": counts["total_entries"],
+        "total_exits": counts["total_exits"],
+        "total_inside": counts["total_entries"] - counts["total_exits"],
+        "unpaid_entries": counts["unpaid_entries"],
+    }
+
+
+def statistics_for(day=None):
+    """Statistics shown on the home page; today's come from ``occupancy`` without a query."""
+    if day is None or day == local_today():
+        return occupancy.snapshot()
+    return day_statistics(day)
+
+
+class OccupancyCounter:
+    """Today's entry/exit/inside/unpaid counters, maintained by deltas.
+
+    Counted like the home page list: entries of today plus yesterday's
+    entries that exited today (``listed_entries_filter``).
+
+    Each VehicleEntry save or delete moves the counters by the difference
+    between the entry's old and new state, so the signals no longer run
+    COUNT queries. The counters are re-read from the database when the day
+    changes, after ``invalidate()`` (bulk ``update()``/``delete()`` bypass
+    signals) and every ``STATS_RECONCILE_SECONDS`` as a safety net.
+
+    The state lives in process memory; with several workers each one
+    reconciles on its own.
+    """
+
+    def __init__(self, reconcile_seconds=None):
+        self._lock = threading.Lock()
+        self._reconcile_seconds = reconcile_seconds
+        self.day = None
+        self.total_entries = 0
+        self.total_exits = 0
+        self.unpaid_entries = 0
+        self._reconciled_at = 0.0
+
+    @property
+    def reconcile_seconds(self):
+        if self._reconcile_seconds is not None:
+            return self._reconcile_seconds
+        return getattr(settings, "STATS_RECONCILE_SECONDS", DEFAULT_RECONCILE_SECONDS)
+
+    def invalidate(self):
+        """Force a DB reconcile on the next read."""
+        with self._lock:
+            self.day = None
+
+    def _needs_reconcile(self, today):
+        return (
+            self.day != today
+            or time.monotonic() - self._reconciled_at >= self.reconcile_seconds
+        )
+
+    def reconcile(self, today=None):
+        """Recount today's numbers from the database in one query."""
+        today = today or local_today()
+        counts = day_statistics(today)
+        with self._lock:
+            self.day = today
+            self.total_entries = counts["total_entries"]
+            self.total_exits = counts["total_exits"]
+            self.unpaid_entries = counts["unpaid_entries"]
+            self._reconciled_at = time.monotonic()
+
+    def _add(self, state, sign):
+        if not state_counts_for(state, self.day):
+            return
+        _, exit_day, unpaid = state
+        self.total_entries += sign
+        if exit_day is not None:
+            self.total_exits += sign
+        if unpaid:
+            self.unpaid_entries += sign
+
+    def apply(self, old_state, new_state):
+        """Move the counters from ``old_state`` to ``new_state`` (either may be None)."""
+        if old_state == new_state:
+            return
+        with self._lock:
+            if self.day is None:
+                return
+            self._add(old_state, -1)
+            self._add(new_state, +1)
+
+    def snapshot(self):
+        """Current counters in the ``stats_data`` shape used by the WebSocket."""
+        today = local_today()
+        if self._needs_reconcile(today):
+            self.reconcile(today)
+        with self._lock:
+            return {
+                "total_entries": self.total_entries,
+                "total_exits": self.total_exits,
+                "total_inside": self.total_entries - self.total_exits,
+                "unpaid_entries": self.unpaid_entries,
+            }
+
+
+occupancy = OccupancyCounter()
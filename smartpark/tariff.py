@@ -0,0 +1,309 @@
+"""Parking tariff engine.
+
+Prices a stay from its duration in seconds. ``TariffSchedule.amount`` is the
+closed form of the rules that used to live in
+``VehicleEntry.calculate_amount``; ``TariffSchedule.amounts`` prices many
+durations at once with NumPy, falling back to a plain loop when NumPy is
+not installed. Both give exactly the same integers as the old method,
+including its float rounding at block boundaries.
+
+Tariff plans are stored in ``TariffPlan`` rows. ``tariffs`` compiles the
+active plans into minute-resolution lookup tables (``CompiledTariff``) and
+picks one per car category and date.
+"""
+
+import math
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+try:
+    import numpy as np
+except ImportError:  # numpy ixtiyoriy: faqat batch hisoblash tezlashadi
+    np = None
+
+SECONDS_IN_DAY = 24 * 60 * 60
+
+
+class TariffSchedule:
+    """Piecewise parking price schedule.
+
+    - ``free_minutes`` va undan kam: bepul
+    - 1 soatgacha: ``hour_price``
+    - 1-2 soat: har ``quarter_minutes`` uchun ``quarter_price`` qo'shiladi
+    - 2 soatdan keyin: har boshlangan soat uchun ``hour_price``,
+      ``daily_hours`` soatlik narxdan oshmaydi
+    - ``daily_hours`` soatdan 24 soatgacha: kunlik limit
+    - har to'liq 24 soat uchun yana kunlik limit qo'shiladi
+    """
+
+    __slots__ = (
+        "hour_price",
+        "free_minutes",
+        "quarter_price",
+        "quarter_minutes",
+        "daily_hours",
+        "daily_limit",
+        "two_hours_amount",
+    )
+
+    def __init__(
+        self,
+        hour_price,
+        free_minutes,
+        quarter_price=1000,
+        quarter_minutes=15,
+        daily_hours=5,
+    ):
+        self.hour_price = hour_price
+        self.free_minutes = free_minutes
+        self.quarter_price = quarter_price
+        self.quarter_minutes = quarter_minutes
+        self.daily_hours = daily_hours
+        self.daily_limit = daily_hours * hour_price
+        self.two_hours_amount = hour_price + (60 // quarter_minutes) * quarter_price
+
+    def __eq__(self, other):
+        if not isinstance(other, TariffSchedule):
+            return NotImplemented
+        return self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return (
+            f"TariffSchedule(hour_price={self.hour_price}, "
+            f"free_minutes={self.free_minutes}, quarter_price={self.quarter_price}, "
+            f"quarter_minutes={self.quarter_minutes}, daily_hours={self.daily_hours})"
+        )
+
+    def key(self):
+        return (
+            self.hour_price,
+            self.free_minutes,
+            self.quarter_price,
+            self.quarter_minutes,
+            self.daily_hours,
+        )
+
+    def amount(self, duration_seconds):
+        """Fee in so'm for a stay of ``duration_seconds``."""
+        minutes = duration_seconds / 60.0
+        if minutes <= self.free_minutes:
+            return 0
+        if minutes <= 60:
+            return self.hour_price
+        if minutes <= 120:
+            after_first_hour = minutes - 60
+            blocks = int(after_first_hour / self.quarter_minutes)
+            if after_first_hour % self.quarter_minutes > 0:
+                blocks += 1
+            return self.hour_price + blocks * self.quarter_price
+        if duration_seconds > self.daily_hours * 3600:
+            if duration_seconds < SECONDS_IN_DAY:
+                return self.daily_limit
+            return (
+                self.daily_limit
+                + int(duration_seconds // SECONDS_IN_DAY) * self.daily_limit
+            )
+        extra_hours = math.ceil((minutes - 120) / 60.0)
+        return min(
+            self.two_hours_amount + extra_hours * self.hour_price, self.daily_limit
+        )
+
+    def amounts(self, durations):
+        """Fees for many durations (seconds). Returns an int64 array, or a list without NumPy."""
+        if np is None:
+            return [self.amount(duration) for duration in durations]
+
+        seconds = np.asarray(durations, dtype=np.float64)
+        minutes = seconds / 60.0
+
+        after_first_hour = minutes - 60
+        blocks = np.floor(after_first_hour / self.quarter_minutes) + (
+            np.fmod(after_first_hour, self.quarter_minutes) > 0
+        )
+        quarter_amount = self.hour_price + blocks * self.quarter_price
+
+        hourly_amount = np.minimum(
+            self.two_hours_amount + np.ceil((minutes - 120) / 60.0) * self.hour_price,
+            self.daily_limit,
+        )
+        long_amount = self.daily_limit + np.where(
+            seconds < SECONDS_IN_DAY,
+            0,
+            np.floor_divide(seconds, SECONDS_IN_DAY) * self.daily_limit,
+        )
+
+        result = np.select(
+            [
+                minutes <= self.free_minutes,
+                minutes <= 60,
+                minutes <= 120,
+                seconds > self.daily_hours * 3600,
+            ],
+            [0, self.hour_price, quarter_amount, long_amount],
+            default=hourly_amount,
+        )
+        return result.astype(np.int64)
+
+
+_default_schedule = None
+
+
+def default_schedule():
+    """Schedule built from ``HOUR_PRICE``/``FREE_MINUTES`` settings (cached)."""
+    global _default_schedule
+    schedule = _default_schedule
+    if (
+        schedule is None
+        or schedule.hour_price != settings.HOUR_PRICE
+        or schedule.free_minutes != settings.FREE_MINUTES
+    ):
+        schedule = _default_schedule = TariffSchedule(
+            settings.HOUR_PRICE, settings.FREE_MINUTES
+        )
+    return schedule
+
+
+# Bepul avtomobillar uchun: har qanday davomiylik 0 so'm
+FREE_SCHEDULE = TariffSchedule(hour_price=0, free_minutes=0, quarter_price=0)
+
+
+class CompiledTariff:
+    """A TariffSchedule flattened into a per-minute price table.
+
+    Every rule boundary falls on a whole minute, so the price is constant on
+    each (k-1, k] minute interval and ``table[ceil(minutes)]`` is the fee.
+    Only stays past the daily cap (which grow per 24 h) use arithmetic.
+    """
+
+    __slots__ = ("schedule", "table", "array", "long_after")
+
+    def __init__(self, schedule):
+        self.schedule = schedule
+        self.long_after = schedule.daily_hours * 3600
+        size = max(120, schedule.daily_hours * 60) + 1
+        self.table = [schedule.amount(minute * 60) for minute in range(size)]
+        self.array = np.array(self.table, dtype=np.int64) if np is not None else None
+
+    def amount(self, duration_seconds):
+        minutes = duration_seconds / 60.0
+        if minutes > 120 and duration_seconds > self.long_after:
+            daily_limit = self.schedule.daily_limit
+            if duration_seconds < SECONDS_IN_DAY:
+                return daily_limit
+            return daily_limit + int(duration_seconds // SECONDS_IN_DAY) * daily_limit
+        if minutes <= 0:
+            return self.table[0]
+        return self.table[math.ceil(minutes)]
+
+    def amounts(self, durations):
+        if np is None:
+            return [self.amount(duration) for duration in durations]
+
+        seconds = np.asarray(durations, dtype=np.float64)
+        minutes = seconds / 60.0
+        is_long = (minutes > 120) & (seconds > self.long_after)
+
+        index = np.clip(np.ceil(minutes), 0, len(self.table) - 1).astype(np.intp)
+        daily_limit = self.schedule.daily_limit
+        long_amount = daily_limit + np.where(
+            seconds < SECONDS_IN_DAY,
+            0,
+            np.floor_divide(seconds, SECONDS_IN_DAY) * daily_limit,
+        ).astype(np.int64)
+        return np.where(is_long, long_amount, self.array[index])
+
+
+class TariffRegistry:
+    """Compiled tariff plans, looked up by car category and date.
+
+    Active ``TariffPlan`` rows are compiled once and kept in memory. Saving
+    or deleting a plan bumps a version number in the Django cache
+    (``invalidate()``), and every process reloads on its next lookup.
+    Without any plan the ``HOUR_PRICE``/``FREE_MINUTES`` settings are used;
+    free cars default to 0 and special taxis to the regular tariff.
+    """
+
+    VERSION_CACHE_KEY = "smartpark:tariff:version"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._plans = None
+        self._version = None
+        self._compiled = {}
+
+    def invalidate(self):
+        cache.add(self.VERSION_CACHE_KEY, 0, timeout=None)
+        cache.incr(self.VERSION_CACHE_KEY)
+        with self._lock:
+            self._plans = None
+
+    def compile(self, schedule):
+        """Compiled table for ``schedule``; identical schedules share one table."""
+        compiled = self._compiled.get(schedule)
+        if compiled is None:
+            compiled = self._compiled[schedule] = CompiledTariff(schedule)
+        return compiled
+
+    def _load(self):
+        from .models import TariffPlan
+
+        plans = []
+        for plan in TariffPlan.objects.filter(is_active=True).order_by("-valid_from"):
+            plans.append(
+                (
+                    plan.category,
+                    plan.valid_from,
+                    plan.valid_to,
+                    self.compile(plan.schedule()),
+                )
+            )
+        return plans
+
+    def plans(self):
+        version = cache.get(self.VERSION_CACHE_KEY, 0)
+        with self._lock:
+            if self._plans is not None and self._version == version:
+                return self._plans
+        plans = self._load()
+        with self._lock:
+            self._plans, self._version = plans, version
+        return plans
+
+    def get(self, category, at):
+        """Tariff for ``category`` in effect at ``at`` (newest ``valid_from`` wins)."""
+        from .models import TariffCategory
+
+        # Reja vaqtlari bilan solishtirish uchun USE_TZ ga moslaymiz
+        if settings.USE_TZ and timezone.is_naive(at):
+            at = timezone.make_aware(at)
+        elif not settings.USE_TZ and timezone.is_aware(at):
+            at = timezone.make_naive(at)
+
+        for plan_category, valid_from, valid_to, compiled in self.plans():
+            if plan_category != category or valid_from > at:
+                continue
+            if valid_to is None or at < valid_to:
+                return compiled
+
+        if category == TariffCategory.FREE:
+            return self.compile(FREE_SCHEDULE)
+        if category == TariffCategory.SPECIAL_TAXI:
+            return self.get(TariffCategory.REGULAR, at)
+        return self.compile(default_schedule())
+
+
+tariffs = TariffRegistry()
+
+
+def calculate_fee(duration_seconds):
+    return default_schedule().amount(duration_seconds)
+
+
+def calculate_fees(durations):
+    return default_schedule().amounts(durations)
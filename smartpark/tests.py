@@ -461,3 +461,1846 @@ class TestVehicleEntryModel(TestCase):
 
         expected_str = f"{TEST_NUMBER_PLATE} - 2025-08-30 08:00"
         self.assertEqual(str(entry), expected_str)
+
+
+class TestCameraParser(TestCase):
+    """Kamera multipart parser testlari"""
+
+    def test_plate_and_image_are_extracted(self):
+        from .management.commands.bench_camera_parser import (
+            CONTENT_TYPE,
+            build_payload,
+            legacy_parse,
+        )
+        from .camera_parser import parse_camera_buffer
+
+        payload = build_payload(4096)
+        upload = parse_camera_buffer(payload, CONTENT_TYPE)
+        plate, image = legacy_parse(payload, CONTENT_TYPE)
+
+        self.assertTrue(upload.has_boundary)
+        self.assertEqual(upload.number_plate, plate)
+        self.assertEqual(bytes(upload.image), image)
+        self.assertIsInstance(upload.image, memoryview)
+
+    def test_image_file_chunks_are_bytes(self):
+        from .camera_parser import CameraUpload
+
+        data = b"\xff\xd8\xff" + b"x" * 200_000
+        image_file = CameraUpload("01A777AA", memoryview(data)).image_file("a.jpg")
+
+        self.assertEqual(image_file.size, len(data))
+        self.assertEqual(b"".join(image_file.chunks(65536)), data)
+
+    def test_raw_jpeg_without_boundary(self):
+        from .camera_parser import parse_camera_buffer
+
+        body = b"<licensePlate>01A777AA</licensePlate>Content-Type: image/jpeg\xff\xd8\xffDATA"
+        upload = parse_camera_buffer(body, "application/octet-stream")
+
+        self.assertFalse(upload.has_boundary)
+        self.assertTrue(upload.declares_jpeg)
+        self.assertEqual(bytes(upload.image), b"\xff\xd8\xffDATA")
+
+
+class TestOccupancyCounter(TestCase):
+    """Statistika hisoblagichi delta bilan yangilanishi testlari"""
+
+    def setUp(self):
+        from .stats import OccupancyCounter, local_today
+
+        self.today = local_today()
+        self.counter = OccupancyCounter(reconcile_seconds=3600)
+        self.counter.reconcile(self.today)
+
+    def test_entry_exit_and_payment_deltas(self):
+        inside = (self.today, None, False)
+        unpaid = (self.today, self.today, True)
+        paid = (self.today, self.today, False)
+
+        self.counter.apply(None, inside)
+        self.counter.apply(None, inside)
+        self.counter.apply(inside, unpaid)
+        self.assertEqual(
+            self.counter.snapshot(),
+            {
+                "total_entries": 2,
+                "total_exits": 1,
+                "total_inside": 1,
+                "unpaid_entries": 1,
+            },
+        )
+
+        self.counter.apply(unpaid, paid)
+        self.counter.apply(inside, None)
+        self.assertEqual(
+            self.counter.snapshot(),
+            {
+                "total_entries": 1,
+                "total_exits": 1,
+                "total_inside": 0,
+                "unpaid_entries": 0,
+            },
+        )
+
+    def test_other_days_are_ignored(self):
+        from datetime import timedelta
+
+        yesterday = self.today - timedelta(days=1)
+        self.counter.apply(None, (yesterday, yesterday, True))
+        self.counter.apply(None, (yesterday, None, False))
+        self.assertEqual(self.counter.snapshot()["total_entries"], 0)
+
+    def test_overnight_exit_is_counted(self):
+        from datetime import timedelta
+
+        yesterday = self.today - timedelta(days=1)
+        self.counter.apply((yesterday, None, False), (yesterday, self.today, True))
+        self.assertEqual(
+            self.counter.snapshot(),
+            {
+                "total_entries": 1,
+                "total_exits": 1,
+                "total_inside": 0,
+                "unpaid_entries": 1,
+            },
+        )
+
+    def test_invalidate_recounts_from_db(self):
+        self.counter.apply(None, (self.today, None, False))
+        self.counter.invalidate()
+        self.assertEqual(self.counter.snapshot()["total_entries"], 0)
+
+
+class TestDayStatistics(TestCase):
+    """Kunlik statistika xizmati testlari"""
+
+    def test_single_query_matches_listed_entries(self):
+        from datetime import timedelta
+
+        from .stats import day_statistics, local_today, parse_day
+
+        now = timezone.now()
+        yesterday = now - timedelta(days=1)
+        VehicleEntry.objects.bulk_create(
+            [
+                VehicleEntry(number_plate="01A001AA", entry_time=now),
+                VehicleEntry(
+                    number_plate="01A002AA", entry_time=now, exit_time=now, is_paid=True
+                ),
+                VehicleEntry(
+                    number_plate="01A003AA",
+                    entry_time=yesterday.replace(hour=23),
+                    exit_time=now,
+                ),
+                # Kecha kirib kecha chiqqan - hisobga kirmaydi
+                VehicleEntry(
+                    number_plate="01A004AA", entry_time=yesterday, exit_time=yesterday
+                ),
+            ]
+        )
+
+        with self.assertNumQueries(1):
+            stats = day_statistics(local_today())
+        self.assertEqual(
+            stats,
+            {
+                "total_entries": 3,
+                "total_exits": 2,
+                "total_inside": 1,
+                "unpaid_entries": 1,
+            },
+        )
+        self.assertEqual(parse_day("not-a-date"), local_today())
+
+
+class TestDailyRollups(TestCase):
+    """DailyParkingStats yig'masi testlari"""
+
+    def setUp(self):
+        from datetime import timedelta
+
+        from .stats import day_bounds, local_today
+
+        self.today = local_today()
+        self.yesterday = self.today - timedelta(days=1)
+        start, _ = day_bounds(self.yesterday)
+
+        def at(hours):
+            return start + timedelta(hours=hours)
+
+        VehicleEntry.objects.bulk_create(
+            [
+                VehicleEntry(
+                    number_plate="01A001AA",
+                    entry_time=at(8),
+                    exit_time=at(10),
+                    is_paid=True,
+                    total_amount=8000,
+                ),
+                VehicleEntry(
+                    number_plate="01A002AA",
+                    entry_time=at(9),
+                    exit_time=at(9.1),
+                    is_paid=True,
+                    total_amount=0,
+                ),
+                VehicleEntry(
+                    number_plate="01A003AA",
+                    entry_time=at(9.5),
+                    exit_time=at(12),
+                    total_amount=12000,
+                ),
+                VehicleEntry(number_plate="01A004AA", entry_time=at(11)),
+            ]
+        )
+
+    def test_refresh_day_and_range_summary(self):
+        from .models import DailyParkingStats
+        from .rollups import close_finished_days, range_summary, raw_summary
+
+        self.assertEqual(close_finished_days(self.today), 1)
+        row = DailyParkingStats.objects.get(day=self.yesterday)
+        self.assertEqual(
+            (
+                row.entries,
+                row.exits,
+                row.open_entries,
+                row.paid_count,
+                row.revenue,
+                row.free_exits,
+                row.peak_occupancy,
+            ),
+            (4, 3, 1, 1, 8000, 1, 2),
+        )
+
+        expected = raw_summary(self.yesterday, self.today)
+        with self.assertNumQueries(3):
+            self.assertEqual(range_summary(self.yesterday, self.today), expected)
+
+        # Xom yozuvlar o'chirilsa ham tarix saqlanadi
+        VehicleEntry.objects.filter(is_paid=True)._raw_delete("default")
+        self.assertEqual(
+            range_summary(self.yesterday, self.yesterday)["paid_sum"], 8000
+        )
+
+    def test_late_payment_moves_finished_day(self):
+        from .models import DailyParkingStats
+        from .rollups import refresh_day
+
+        refresh_day(self.yesterday)
+        entry = VehicleEntry.objects.get(number_plate="01A003AA")
+        entry.is_paid = True
+        entry.save()
+
+        row = DailyParkingStats.objects.get(day=self.yesterday)
+        self.assertEqual((row.paid_count, row.revenue), (2, 20000))
+
+        VehicleEntry.objects.get(number_plate="01A004AA").delete()
+        row.refresh_from_db()
+        self.assertEqual((row.entries, row.open_entries), (4, 0))
+
+
+class TestKeysetPagination(TestCase):
+    """Batafsil ro'yxat cursor sahifalash testlari"""
+
+    def test_pages_cover_ordering_without_gaps(self):
+        from datetime import timedelta
+
+        from .pagination import KEYSET_ORDERING, InvalidCursor, keyset_page
+
+        now = timezone.now().replace(microsecond=0)
+        rows = []
+        for i in range(23):
+            entry_time = now - timedelta(hours=i % 5)
+            # Bir xil vaqtlar va ichkaridagi mashinalar: tartib id bilan hal qilinadi
+            exit_time = None if i % 4 == 0 else now + timedelta(minutes=i % 3)
+            rows.append(
+                VehicleEntry(
+                    number_plate=f"01A{i:03d}AA",
+                    entry_time=entry_time,
+                    exit_time=exit_time,
+                )
+            )
+        VehicleEntry.objects.bulk_create(rows)
+        expected = list(
+            VehicleEntry.objects.order_by(*KEYSET_ORDERING).values_list("id", flat=True)
+        )
+
+        seen, cursor = [], None
+        while True:
+            page, cursor = keyset_page(VehicleEntry.objects.all(), 5, cursor)
+            seen.extend(entry.id for entry in page)
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+        # Ichkaridagilar birinchi (PostgreSQL DESC tartibi kabi)
+        self.assertIsNone(VehicleEntry.objects.get(id=expected[0]).exit_time)
+
+        with self.assertRaises(InvalidCursor):
+            keyset_page(VehicleEntry.objects.all(), 5, "not-a-cursor")
+
+
+class TestStreamingExport(TestCase):
+    """Batafsil yozuvlar eksporti testlari"""
+
+    def setUp(self):
+        from datetime import timedelta
+
+        now = timezone.now()
+        VehicleEntry.objects.bulk_create(
+            [
+                VehicleEntry(number_plate="01A001AA", entry_time=now),
+                VehicleEntry(
+                    number_plate="01A002AA",
+                    entry_time=now - timedelta(hours=2),
+                    exit_time=now,
+                    total_amount=8000,
+                    is_paid=True,
+                ),
+                VehicleEntry(
+                    number_plate="01A003AA",
+                    entry_time=now - timedelta(minutes=5),
+                    exit_time=now,
+                    total_amount=0,
+                    is_paid=True,
+                ),
+            ]
+        )
+
+    def test_csv_rows_and_summary_in_one_pass(self):
+        import csv
+
+        from .exports import csv_response
+
+        response = csv_response(VehicleEntry.objects.order_by("id"), "test.csv")
+        with self.assertNumQueries(1):
+            content = b"".join(response.streaming_content).decode("utf-8-sig")
+        rows = list(csv.reader(content.splitlines()))
+        self.assertEqual(rows[0][0], "Avtomobil raqami")
+        self.assertEqual(
+            [row[0] for row in rows[1:4]], ["01A001AA", "01A002AA", "01A003AA"]
+        )
+        summary = dict(row for row in rows[5:])
+        self.assertEqual(summary["Jami kirishlar:"], "3")
+        self.assertEqual(summary["Bepul chiqishlar (0 so'm):"], "1")
+        self.assertEqual(summary["Jami tushum:"], "8,000 so'm")
+        self.assertEqual(summary["Ichkarida qolganlar:"], "1")
+
+    def test_xlsx_has_statistics_and_rows(self):
+        from io import BytesIO
+
+        from openpyxl import load_workbook
+
+        from .exports import xlsx_response
+
+        response = xlsx_response(VehicleEntry.objects.all(), "test.xlsx", "Test")
+        wb = load_workbook(BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(wb.sheetnames, ["Statistika", "Batafsil yozuvlar"])
+        self.assertEqual(wb["Batafsil yozuvlar"].max_row, 4)
+        stats = {row[0]: row[1] for row in wb["Statistika"].values if row and row[0]}
+        self.assertEqual(stats["To'lovli chiqishlar:"], 1)
+        self.assertEqual(stats["Chiqib ketganlar:"], 2)
+
+
+class TestDailyExportCache(TestCase):
+    """Kunlik eksport va tugagan kunlar fayl keshi testlari"""
+
+    def setUp(self):
+        import tempfile
+        from datetime import datetime, time, timedelta
+
+        from django.conf import settings
+        from django.contrib.auth import get_user_model
+
+        from .stats import local_today
+
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        self.yesterday = local_today() - timedelta(days=1)
+        noon = datetime.combine(self.yesterday, time(12, 0))
+        if settings.USE_TZ:
+            noon = timezone.make_aware(noon)
+        VehicleEntry.objects.bulk_create(
+            [
+                VehicleEntry(number_plate="01B001BB", entry_time=noon),
+                VehicleEntry(
+                    number_plate="01B002BB",
+                    entry_time=noon - timedelta(hours=1),
+                    exit_time=noon,
+                    total_amount=4000,
+                    is_paid=True,
+                ),
+            ]
+        )
+        user = get_user_model().objects.create_user(username="export", password="x")
+        self.client.force_login(user)
+
+    def export(self, **params):
+        from django.test import override_settings
+
+        params.setdefault("date", self.yesterday.isoformat())
+        with override_settings(EXPORT_CACHE_DIR=self.cache_dir.name):
+            return self.client.get("/export/xls/", params)
+
+    def test_xlsx_is_real_workbook(self):
+        from io import BytesIO
+
+        from openpyxl import load_workbook
+
+        response = self.export()
+        self.assertEqual(response.status_code, 200)
+        wb = load_workbook(BytesIO(b"".join(response.streaming_content)))
+        rows = list(wb["Batafsil yozuvlar"].values)
+        self.assertEqual(rows[0][-1], "Holati")
+        self.assertEqual(
+            sorted(row[-1] for row in rows[1:]), ["Ichkarida", "To'langan"]
+        )
+
+    def test_closed_day_served_from_disk_until_data_changes(self):
+        from django.db.models import F
+
+        first = self.export(format="csv")
+        self.assertEqual(first["X-Export-Cache"], "miss")
+        content = b"".join(first.streaming_content).decode("utf-8-sig")
+        self.assertIn("01B002BB", content)
+
+        second = self.export(format="csv")
+        self.assertEqual(second["X-Export-Cache"], "hit")
+        self.assertEqual(
+            b"".join(second.streaming_content).decode("utf-8-sig"), content
+        )
+
+        VehicleEntry.objects.filter(number_plate="01B001BB").update(
+            exit_time=F("entry_time"), is_paid=True
+        )
+        third = self.export(format="csv")
+        self.assertEqual(third["X-Export-Cache"], "miss")
+
+    def test_filters_get_their_own_file(self):
+        self.export(format="csv")
+        response = self.export(format="csv", status="inside")
+        self.assertEqual(response["X-Export-Cache"], "miss")
+        content = b"".join(response.streaming_content).decode("utf-8-sig")
+        self.assertNotIn("01B002BB", content)
+
+
+class TestEntryDeltaBroadcast(TestCase):
+    """WebSocket delta protokoli testlari"""
+
+    def setUp(self):
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        from django.core.cache import cache
+
+        from .broadcast import GROUP_NAME
+        from .stats import occupancy
+
+        cache.clear()
+        occupancy.invalidate()
+        self.layer = get_channel_layer()
+        self.channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(GROUP_NAME, self.channel)
+        self.addCleanup(
+            async_to_sync(self.layer.group_discard), GROUP_NAME, self.channel
+        )
+
+    def receive(self):
+        import json
+
+        from asgiref.sync import async_to_sync
+
+        event = async_to_sync(self.layer.receive)(self.channel)
+        self.assertEqual(event["type"], "entry_delta")
+        return json.loads(event["text"])
+
+    def test_save_and_delete_send_sequenced_deltas(self):
+        from .broadcast import build_snapshot
+
+        entry = VehicleEntry.objects.create(number_plate=TEST_NUMBER_PLATE)
+        created = self.receive()
+        self.assertEqual(len(created["changes"]), 1)
+        change = created["changes"][0]
+        self.assertEqual(change["op"], "upsert")
+        self.assertEqual(change["action"], "created")
+        self.assertEqual(change["entry"]["id"], entry.id)
+        self.assertEqual(created["statistics"]["total_inside"], 1)
+
+        snapshot = build_snapshot()
+        self.assertEqual(snapshot["seq"], created["seq"])
+        self.assertEqual([e["id"] for e in snapshot["vehicle_entries"]], [entry.id])
+
+        entry_id = entry.id
+        entry.delete()
+        deleted = self.receive()
+        self.assertEqual(deleted["seq"], created["seq"] + 1)
+        change = deleted["changes"][0]
+        self.assertEqual(change["op"], "remove")
+        self.assertEqual(change["entry_id"], entry_id)
+        self.assertIsNone(change["entry"])
+        self.assertEqual(deleted["statistics"]["total_entries"], 0)
+
+    def test_batch_publishes_one_delta(self):
+        from .change_events import change_events
+
+        with change_events.batch():
+            first = VehicleEntry.objects.create(
+                number_plate="01A111AA", entry_image="a.jpg"
+            )
+            second = VehicleEntry.objects.create(
+                number_plate="01A222AA", entry_image="b.jpg"
+            )
+            second.is_paid = True
+            second.save()
+
+        delta = self.receive()
+        self.assertEqual(
+            [(c["entry_id"], c["action"]) for c in delta["changes"]],
+            [(first.id, "created"), (second.id, "created")],
+        )
+        self.assertTrue(delta["changes"][1]["entry"]["is_paid"])
+        self.assertEqual(delta["statistics"]["total_entries"], 2)
+
+    def test_report_updated_rereads_rows(self):
+        from .change_events import change_events
+
+        entry = VehicleEntry.objects.create(number_plate=TEST_NUMBER_PLATE)
+        self.receive()
+
+        VehicleEntry.objects.filter(id=entry.id).update(is_paid=True)
+        change_events.report_updated([entry.id])
+
+        change = self.receive()["changes"][0]
+        self.assertEqual(change["action"], "updated")
+        self.assertTrue(change["entry"]["is_paid"])
+
+
+class TestTariffSchedule(TestCase):
+    """Tarif dvigateli: skalyar va batch hisob bir xil bo'lishi"""
+
+    def setUp(self):
+        from .tariff import default_schedule
+
+        self.schedule = default_schedule()
+
+    def test_boundaries(self):
+        cases = {
+            0: 0,
+            600: 0,
+            601: 4000,
+            3600: 4000,
+            3601: 5000,
+            3600 + 900: 5000,
+            3600 + 901: 6000,
+            7200: 8000,
+            7201: 12000,
+            14400: 16000,
+            18000: 20000,
+            18001: 20000,
+            86399: 20000,
+            86400: 40000,
+            172801: 60000,
+        }
+        for seconds, expected in cases.items():
+            self.assertEqual(self.schedule.amount(seconds), expected, seconds)
+
+    def test_batch_matches_scalar(self):
+        durations = [s * 7.3 for s in range(0, 40000)] + [3600.000001, 7199.999999, -5]
+        expected = [self.schedule.amount(d) for d in durations]
+        self.assertEqual([int(a) for a in self.schedule.amounts(durations)], expected)
+
+    def test_batch_without_numpy(self):
+        from unittest import mock
+
+        from . import tariff
+
+        with mock.patch.object(tariff, "np", None):
+            self.assertEqual(self.schedule.amounts([0, 3601, 86400]), [0, 5000, 40000])
+
+
+class TestTariffPlans(TestCase):
+    """Tarif rejalari va kompilyatsiya qilingan jadvallar testlari"""
+
+    def setUp(self):
+        from .tariff import tariffs
+
+        tariffs.invalidate()
+
+    def test_compiled_table_matches_schedule(self):
+        from .tariff import CompiledTariff, TariffSchedule
+
+        for schedule in (
+            TariffSchedule(4000, 10),
+            TariffSchedule(
+                5000, 15, quarter_price=500, quarter_minutes=10, daily_hours=6
+            ),
+        ):
+            compiled = CompiledTariff(schedule)
+            durations = [s * 3.7 for s in range(0, 60000)] + [-1, 3600.000001, 86400]
+            expected = [schedule.amount(d) for d in durations]
+            self.assertEqual([compiled.amount(d) for d in durations], expected)
+            self.assertEqual([int(a) for a in compiled.amounts(durations)], expected)
+
+    def test_plan_lookup_by_category_and_date(self):
+        from .models import TariffCategory, TariffPlan
+
+        TariffPlan.objects.create(
+            name="Yangi narx",
+            hour_price=5000,
+            valid_from=datetime(2025, 9, 1),
+        )
+        TariffPlan.objects.create(
+            name="Taksi",
+            category=TariffCategory.SPECIAL_TAXI,
+            hour_price=2000,
+            valid_from=datetime(2025, 1, 1),
+        )
+
+        old_entry = VehicleEntry(
+            number_plate=TEST_NUMBER_PLATE,
+            entry_time=datetime(2025, 8, 30, 8),
+            exit_time=datetime(2025, 8, 30, 9),
+        )
+        new_entry = VehicleEntry(
+            number_plate=TEST_NUMBER_PLATE,
+            entry_time=make_aware(datetime(2025, 9, 2, 8)),
+            exit_time=make_aware(datetime(2025, 9, 2, 9)),
+        )
+        self.assertEqual(old_entry.calculate_amount(), HOUR_PRICE)
+        self.assertEqual(new_entry.calculate_amount(), 5000)
+        self.assertEqual(new_entry.calculate_amount(TariffCategory.SPECIAL_TAXI), 2000)
+        self.assertEqual(new_entry.calculate_amount(TariffCategory.FREE), 0)
+
+    def test_saving_plan_invalidates_cache(self):
+        from .models import TariffPlan
+
+        entry = VehicleEntry(
+            number_plate=TEST_NUMBER_PLATE,
+            entry_time=datetime(2025, 9, 2, 8),
+            exit_time=datetime(2025, 9, 2, 9),
+        )
+        self.assertEqual(entry.calculate_amount(), HOUR_PRICE)
+
+        plan = TariffPlan.objects.create(
+            name="Qimmat", hour_price=6000, valid_from=datetime(2025, 1, 1)
+        )
+        self.assertEqual(entry.calculate_amount(), 6000)
+
+        plan.is_active = False
+        plan.save()
+        self.assertEqual(entry.calculate_amount(), HOUR_PRICE)
+
+
+class TestPrintSpooler(TestCase):
+    """Fon rejimidagi chek navbati testlari"""
+
+    def make_spooler(self, sender, **kwargs):
+        from .print_spooler import PrintSpooler
+
+        statuses = []
+
+        class RecordingSpooler(PrintSpooler):
+            def _report(self, job):
+                statuses.append((job.id, job.status))
+
+        kwargs.setdefault("retry_delay", 0)
+        return RecordingSpooler(sender=sender, **kwargs), statuses
+
+    def test_retries_then_prints(self):
+        calls = []
+
+        def flaky(data, doc_name, printer_name):
+            calls.append(data)
+            if len(calls) < 3:
+                raise OSError("printer offline")
+
+        spooler, statuses = self.make_spooler(flaky, max_attempts=3)
+        job = spooler.submit(b"chek")
+        spooler.join()
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(
+            [status for job_id, status in statuses if job_id == job.id],
+            [
+                "queued",
+                "printing",
+                "retrying",
+                "printing",
+                "retrying",
+                "printing",
+                "done",
+            ],
+        )
+        self.assertEqual(spooler.dead_letters(), [])
+
+    def test_dead_letter_and_retry(self):
+        broken = [True]
+
+        def sender(data, doc_name, printer_name):
+            if broken[0]:
+                raise OSError("printer offline")
+
+        spooler, statuses = self.make_spooler(sender, max_attempts=2)
+        job = spooler.submit(b"chek", label="01A001AA")
+        spooler.join()
+        self.assertEqual([dead.id for dead in spooler.dead_letters()], [job.id])
+        self.assertEqual(job.status, "failed")
+        self.assertEqual(job.error, "printer offline")
+
+        broken[0] = False
+        self.assertIs(spooler.retry(job.id), job)
+        spooler.join()
+        self.assertEqual(job.status, "done")
+        self.assertEqual(spooler.dead_letters(), [])
+        self.assertIsNone(spooler.retry(job.id))
+
+    def test_full_queue_rejects_instead_of_blocking(self):
+        import threading
+
+        from .print_spooler import PrintQueueFull
+
+        started, release = threading.Event(), threading.Event()
+
+        def slow(data, doc_name, printer_name):
+            started.set()
+            release.wait(5)
+
+        spooler, _ = self.make_spooler(slow, maxsize=1)
+        spooler.submit(b"1")
+        self.assertTrue(started.wait(5))
+        spooler.submit(b"2")
+        with self.assertRaises(PrintQueueFull):
+            spooler.submit(b"3")
+        release.set()
+        spooler.join()
+
+    def test_payment_does_not_wait_for_printer(self):
+        import json
+        import threading
+        from datetime import timedelta
+        from unittest import mock
+
+        from django.contrib.auth import get_user_model
+
+        release = threading.Event()
+        printed = []
+
+        def slow(data, doc_name, printer_name):
+            release.wait(5)
+            printed.append(data)
+
+        spooler, _ = self.make_spooler(slow)
+        entry = VehicleEntry.objects.create(number_plate="01A777AA")
+        VehicleEntry.objects.filter(id=entry.id).update(
+            entry_time=timezone.now() - timedelta(hours=1)
+        )
+        entry.refresh_from_db()
+        self.client.force_login(
+            get_user_model().objects.create_user(username="kassa", password="x")
+        )
+
+        with mock.patch("smartpark.views.print_spooler", spooler):
+            response = self.client.post(
+                "/api/uuid-payment/",
+                json.dumps({"uuid": entry.uuid}),
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["print_job"]["status"], "queued")
+        self.assertEqual(printed, [])
+
+        release.set()
+        spooler.join()
+        self.assertEqual(len(printed), 1)
+        self.assertIn(b"01A777AA", printed[0])
+
+
+class TestBarrierController(TestCase):
+    """Shlakbaum controller testlari (pty orqali soxta qurilma)"""
+
+    def setUp(self):
+        import os
+        import unittest
+
+        if not hasattr(os, "openpty"):
+            raise unittest.SkipTest("pty yo'q")
+
+    def fake_device(self):
+        import os
+        import tty
+
+        master, slave = os.openpty()
+        tty.setraw(master)
+        path = os.ttyname(slave)
+        self.addCleanup(lambda: [self.close_fd(fd) for fd in (master, slave)])
+        return master, slave, path
+
+    def close_fd(self, fd):
+        import os
+
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+    def read(self, fd, timeout=2):
+        import os
+        import select
+
+        ready, _, _ = select.select([fd], [], [], timeout)
+        return os.read(fd, 16) if ready else b""
+
+    def make_controller(self, ports):
+        from .barier_control import BarrierController
+
+        controller = BarrierController(
+            ports=ports, settle_seconds=0, reconnect_seconds=0.05
+        )
+        self.addCleanup(controller.stop)
+        return controller
+
+    def test_open_is_fast_once_connected(self):
+        import time
+
+        master, _, path = self.fake_device()
+        controller = self.make_controller([path])
+        controller.close().result(2)
+        self.assertEqual(self.read(master), b"C")
+
+        started = time.monotonic()
+        controller.open().result(2)
+        self.assertEqual(self.read(master), b"O")
+        self.assertLess(time.monotonic() - started, 0.1)
+
+    def test_auto_close_timer_restarts_on_open(self):
+        import time
+
+        master, _, path = self.fake_device()
+        controller = self.make_controller([path])
+        controller.open(auto_close=0.2).result(2)
+        self.assertEqual(self.read(master), b"O")
+        time.sleep(0.1)
+        controller.open(auto_close=0.2).result(2)
+        self.assertEqual(self.read(master), b"O")
+        # Birinchi taymer bekor qilingan: 0.15 s ichida yopilmaydi
+        self.assertEqual(self.read(master, timeout=0.15), b"")
+        self.assertEqual(self.read(master), b"C")
+
+    def test_reconnects_to_next_port(self):
+        first_master, first_slave, first = self.fake_device()
+        second_master, _, second = self.fake_device()
+        controller = self.make_controller([first, second])
+        controller.open().result(2)
+        self.assertEqual(self.read(first_master), b"O")
+
+        # Birinchi qurilma uzildi
+        self.close_fd(first_master)
+        self.close_fd(first_slave)
+        self.assertEqual(controller.close().result(5), second)
+        self.assertEqual(self.read(second_master), b"C")
+
+
+class TestGateLanes(TestCase):
+    """Ko'p yo'lakli kirish/chiqish testlari"""
+
+    LANES = [
+        {"name": "kirish-1", "direction": "entry", "cameras": ["10.0.0.1"]},
+        {"name": "kirish-2", "direction": "entry", "cameras": ["10.0.0.2"]},
+        {"name": "chiqish-1", "direction": "exit", "cameras": ["10.0.0.3"]},
+    ]
+
+    def test_resolve_by_name_camera_and_default(self):
+        from .lanes import LaneRegistry, UnknownLane
+
+        registry = LaneRegistry(self.LANES)
+        self.assertEqual(registry.resolve("entry", name="kirish-2").name, "kirish-2")
+        self.assertEqual(registry.resolve("entry", camera="10.0.0.2").name, "kirish-2")
+        self.assertEqual(registry.resolve("entry", camera="10.9.9.9").name, "kirish-1")
+        with self.assertRaises(UnknownLane):
+            registry.resolve("exit", name="kirish-1")
+
+    def test_lane_order_and_plate_exclusion(self):
+        import threading
+        import time
+
+        from .lanes import Lane
+
+        first, second = Lane("a", "entry"), Lane("b", "exit")
+        self.addCleanup(first.stop)
+        self.addCleanup(second.stop)
+        log = []
+        inside = {}
+        overlaps = []
+        lock = threading.Lock()
+
+        def event(lane, plate, n):
+            with lock:
+                if inside.get(plate):
+                    overlaps.append(plate)
+                inside[plate] = True
+            time.sleep(0.002)
+            log.append((lane, plate, n))
+            with lock:
+                inside[plate] = False
+
+        futures = []
+        for n in range(20):
+            plate = f"01A{n % 3}00AA"
+            futures.append(first.submit(plate, event, "a", plate, n))
+            futures.append(second.submit(plate, event, "b", plate, n))
+        for future in futures:
+            future.result(5)
+
+        self.assertEqual(overlaps, [])
+        for lane in ("a", "b"):
+            self.assertEqual([n for name, _, n in log if name == lane], list(range(20)))
+        self.assertEqual(first.status()["processed"], 20)
+
+    def test_entry_and_exit_pair_across_lanes(self):
+        import tempfile
+        from unittest import mock
+
+        from django.test import override_settings
+
+        from .lanes import LaneRegistry
+        from .management.commands.bench_camera_parser import CONTENT_TYPE, build_payload
+
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        registry = LaneRegistry(self.LANES)
+        payload = build_payload(1024).replace(b"01A777AA", b"01L123AA")
+
+        def post(url, camera):
+            return self.client.post(
+                url, payload, content_type=CONTENT_TYPE, REMOTE_ADDR=camera
+            ).json()
+
+        with (
+            override_settings(
+                GATE_LANE_WORKERS=False, IMAGE_WRITE_ASYNC=False, MEDIA_ROOT=media.name
+            ),
+            mock.patch("smartpark.views.gate_lanes", registry),
+        ):
+            first = post("/receive-entry/", "10.0.0.1")
+            # Ikkinchi kamera ham o'qidi - ochiq yozuv bitta bo'lib qoladi
+            post("/receive-entry/kirish-2/", "10.0.0.9")
+            exited = post("/receive-exit/", "10.0.0.3")
+            again = post("/receive-exit/", "10.0.0.3")
+
+        self.assertEqual(first["lane"], "kirish-1")
+        entries = VehicleEntry.objects.filter(number_plate="01L123AA")
+        self.assertEqual(entries.count(), 1)
+        self.assertEqual(exited["entry_id"], entries.get().id)
+        self.assertEqual(exited["lane"], "chiqish-1")
+        self.assertEqual(again["status"], "error")
+
+    def test_ingest_notifications_are_sent_after_the_event(self):
+        from unittest import mock
+
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        from django.test import override_settings
+
+        from .lanes import LaneRegistry
+        from .management.commands.bench_camera_parser import CONTENT_TYPE, build_payload
+        from .models import Cars
+        from .plate_policy import plate_policies
+
+        Cars.objects.create(number_plate="01B404BB", is_blocked=True)
+        plate_policies.invalidate(broadcast=False)
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)("home_updates", channel)
+        self.addCleanup(async_to_sync(layer.group_discard), "home_updates", channel)
+        payload = build_payload(1024).replace(b"01A777AA", b"01B404BB")
+
+        with (
+            override_settings(GATE_LANE_WORKERS=False),
+            mock.patch("smartpark.views.gate_lanes", LaneRegistry(self.LANES)),
+        ):
+            response = self.client.post(
+                "/receive-entry/", payload, content_type=CONTENT_TYPE
+            ).json()
+
+        self.assertEqual(response["status"], "error")
+        message = async_to_sync(layer.receive)(channel)
+        self.assertEqual(message["type"], "broadcast_notification")
+        self.assertIn("01B404BB", message["message"])
+
+    def test_slow_event_is_accepted_and_still_runs(self):
+        import threading
+        from unittest import mock
+
+        from django.test import override_settings
+
+        from .lanes import LaneRegistry
+        from .management.commands.bench_camera_parser import CONTENT_TYPE, build_payload
+
+        registry = LaneRegistry(self.LANES)
+        self.addCleanup(registry.reset)
+        release, done = threading.Event(), threading.Event()
+
+        def slow_entry(lane, upload, number_plate, received_at, notices):
+            release.wait(5)
+            done.set()
+
+        with (
+            override_settings(GATE_EVENT_TIMEOUT=0.05),
+            mock.patch("smartpark.views.gate_lanes", registry),
+            mock.patch("smartpark.views._handle_entry", slow_entry),
+        ):
+            response = self.client.post(
+                "/receive-entry/", build_payload(1024), content_type=CONTENT_TYPE
+            )
+        self.assertEqual(response.status_code, 202)
+        # Kutish to'xtadi, lekin hodisa navbatdan olib tashlanmadi
+        release.set()
+        self.assertTrue(done.wait(5))
+
+
+class TestPlatePolicyCache(TestCase):
+    """Bloklangan/bepul/taksi raqamlar keshi testlari"""
+
+    def setUp(self):
+        from .plate_policy import plate_policies
+
+        plate_policies.invalidate(broadcast=False)
+
+    def test_lookups_after_load_hit_no_database(self):
+        from .models import Cars, TariffCategory
+        from .plate_policy import REGULAR, PlatePolicyCache
+
+        Cars.objects.create(number_plate="01A111AA", is_blocked=True)
+        Cars.objects.create(number_plate="01A222AA", is_free=True)
+        Cars.objects.create(number_plate="01A333AA", is_special_taxi=True)
+        Cars.objects.create(number_plate="01A444AA")
+        cache = PlatePolicyCache()
+        cache.get("01A111AA")
+
+        with self.assertNumQueries(0):
+            self.assertTrue(cache.is_blocked("01A111AA"))
+            self.assertEqual(cache.get("01A222AA").tariff_category, TariffCategory.FREE)
+            self.assertEqual(
+                cache.get("01A333AA").tariff_category, TariffCategory.SPECIAL_TAXI
+            )
+            self.assertIs(cache.get("01A444AA"), REGULAR)
+            self.assertIs(cache.get("99Z999ZZ"), REGULAR)
+        self.assertEqual(cache.loads, 1)
+
+    def test_car_signals_invalidate(self):
+        from .models import Cars
+        from .plate_policy import plate_policies
+
+        self.assertFalse(plate_policies.is_blocked("01B123BB"))
+        with self.captureOnCommitCallbacks(execute=True):
+            car = Cars.objects.create(number_plate="01B123BB", is_blocked=True)
+        self.assertTrue(plate_policies.is_blocked("01B123BB"))
+
+        car.is_blocked = False
+        car.is_free = True
+        car.save()
+        self.assertFalse(plate_policies.is_blocked("01B123BB"))
+        self.assertTrue(plate_policies.get("01B123BB").is_free)
+
+        car.delete()
+        self.assertFalse(plate_policies.get("01B123BB").is_free)
+
+    def test_other_worker_message_invalidates(self):
+        from .models import Cars
+        from .plate_policy import PlatePolicyCache
+
+        cache = PlatePolicyCache()
+        self.assertFalse(cache.is_blocked("01C123CC"))
+        # Signal faqat shu jarayondagi plate_policies ni tozalaydi; bu kesh boshqa worker kabi
+        Cars.objects.create(number_plate="01C123CC", is_blocked=True)
+        self.assertFalse(cache.is_blocked("01C123CC"))
+
+        cache.on_message({"type": "plate_policy.invalidate", "origin": cache.origin})
+        self.assertFalse(cache.is_blocked("01C123CC"))
+        cache.on_message({"type": "plate_policy.invalidate", "origin": "boshqa-worker"})
+        self.assertTrue(cache.is_blocked("01C123CC"))
+
+    def test_one_listener_for_concurrent_loads(self):
+        import threading
+        from unittest import mock
+
+        from .plate_policy import PlatePolicyCache
+
+        cache = PlatePolicyCache()
+        started = []
+        barrier = threading.Barrier(8)
+
+        async def listen(layer):
+            started.append(layer)
+
+        def load():
+            barrier.wait()
+            cache._ensure_listener()
+
+        with (
+            mock.patch(
+                "smartpark.plate_policy.get_channel_layer", return_value=object()
+            ),
+            mock.patch.object(cache, "_listen", listen),
+        ):
+            threads = [threading.Thread(target=load) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            cache._listener.join()
+        self.assertEqual(len(started), 1)
+
+
+class TestOpenPlateIndex(TestCase):
+    """Chiqishda noto'g'ri o'qilgan raqamni ochiq yozuvlarga moslashtirish testlari"""
+
+    def setUp(self):
+        from .plate_index import open_plates
+
+        open_plates.invalidate()
+
+    def make_open(self, *plates):
+        for plate in plates:
+            VehicleEntry.objects.create(number_plate=plate, entry_time=timezone.now())
+
+    def test_confusable_and_single_edit_matches(self):
+        from .plate_index import OpenPlateIndex
+
+        self.make_open("01A808AA", "10B123CD", "01X555XX")
+        index = OpenPlateIndex(reconcile_seconds=3600)
+
+        confusable = index.best_match("01AB08AA")
+        self.assertEqual(confusable.plate, "01A808AA")
+        self.assertGreater(confusable.confidence, 0.95)
+        self.assertTrue(confusable.auto)
+        # Oddiy bitta belgi farqi - boshqa avtomobil bo'lishi mumkin: faqat taklif
+        edit = index.best_match("10B123CE")
+        self.assertEqual(edit.plate, "10B123CD")
+        self.assertLess(edit.confidence, confusable.confidence)
+        self.assertFalse(edit.auto)
+        missing = index.best_match("10B12CD")
+        self.assertEqual(missing.plate, "10B123CD")
+        self.assertFalse(missing.auto)
+        self.assertIsNone(index.best_match("95Z999ZZ"))
+        # Aniq mos raqam taxmin emas
+        self.assertIsNone(index.best_match("01A808AA"))
+
+    def test_ambiguous_reads_and_closed_entries(self):
+        from .plate_index import OpenPlateIndex
+
+        self.make_open("01A123AA", "01A123AC")
+        index = OpenPlateIndex(reconcile_seconds=3600)
+        index.reconcile()
+        self.assertIsNone(index.best_match("01A123AB"))
+
+        index.apply("01A123AC", None)
+        self.assertEqual(index.best_match("01A123AB").plate, "01A123AA")
+        self.assertNotIn("01A123AC", index)
+
+    def test_placeholder_plates_are_never_matched(self):
+        from .plate_index import OpenPlateIndex
+
+        self.make_open("TEMP101512", "01A124BC")
+        index = OpenPlateIndex(reconcile_seconds=3600)
+        self.assertEqual(index.search("TEMP101513"), [])
+        self.assertIsNone(index.best_match("TEMP101513"))
+        self.assertIsNone(index.best_match("TEMP1O1512"))
+        self.assertFalse(index.best_match("01A123BC").auto)
+
+    def test_index_follows_signals(self):
+        from .plate_index import open_plates
+
+        self.assertEqual(len(open_plates.search("01K777KK")), 0)
+        self.make_open("01K777KK")
+        with self.assertNumQueries(0):
+            self.assertEqual(open_plates.best_match("01K777XK").plate, "01K777KK")
+        entry = VehicleEntry.objects.get(number_plate="01K777KK")
+        entry.exit_time = timezone.now()
+        entry.save()
+        self.assertIsNone(open_plates.best_match("01K777XK"))
+
+    def test_exit_uses_best_open_match(self):
+        import tempfile
+        from unittest import mock
+
+        from django.test import override_settings
+
+        from .lanes import LaneRegistry
+        from .management.commands.bench_camera_parser import CONTENT_TYPE, build_payload
+
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.make_open("01A808AA")
+
+        with (
+            override_settings(
+                GATE_LANE_WORKERS=False, IMAGE_WRITE_ASYNC=False, MEDIA_ROOT=media.name
+            ),
+            mock.patch("smartpark.views.gate_lanes", LaneRegistry()),
+        ):
+            exited = self.client.post(
+                "/receive-exit/",
+                build_payload(1024).replace(b"01A777AA", b"01AB08AA"),
+                content_type=CONTENT_TYPE,
+            ).json()
+
+        entry = VehicleEntry.objects.get(number_plate="01A808AA")
+        self.assertIsNotNone(entry.exit_time)
+        self.assertEqual(exited["entry_id"], entry.id)
+        self.assertEqual(exited["number_plate"], "01A808AA")
+        self.assertEqual(exited["read_plate"], "01AB08AA")
+        self.assertGreater(exited["match_confidence"], 0.9)
+
+    def test_exit_only_suggests_a_plain_one_character_match(self):
+        import tempfile
+        from unittest import mock
+
+        from django.test import override_settings
+
+        from .lanes import LaneRegistry
+        from .management.commands.bench_camera_parser import CONTENT_TYPE, build_payload
+
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.make_open("01A124BC")
+
+        with (
+            override_settings(
+                GATE_LANE_WORKERS=False, IMAGE_WRITE_ASYNC=False, MEDIA_ROOT=media.name
+            ),
+            mock.patch("smartpark.views.gate_lanes", LaneRegistry()),
+        ):
+            exited = self.client.post(
+                "/receive-exit/",
+                build_payload(1024).replace(b"01A777AA", b"01A123BC"),
+                content_type=CONTENT_TYPE,
+            ).json()
+
+        self.assertIsNone(VehicleEntry.objects.get(number_plate="01A124BC").exit_time)
+        self.assertEqual(exited["number_plate"], "01A123BC")
+        self.assertEqual(exited["suggested_plate"], "01A124BC")
+        self.assertNotIn("entry_id", exited)
+
+
+class TestImageStore(TestCase):
+    """Kamera rasmlari: fon yozuvi, hash nomlar va kichik nusxalar testlari"""
+
+    def setUp(self):
+        import tempfile
+
+        from django.core.files.storage import FileSystemStorage
+
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.storage = FileSystemStorage(location=media.name)
+
+    def jpeg(self, color="red", size=(1920, 1080)):
+        import io
+
+        from PIL import Image
+
+        output = io.BytesIO()
+        Image.new("RGB", size, color).save(output, "JPEG", quality=95)
+        return output.getvalue()
+
+    def test_async_write_dedup_and_thumbnail(self):
+        from django.test import override_settings
+
+        from .images import ImageStore, thumbnail_name
+
+        store = ImageStore(storage=self.storage)
+        data = self.jpeg()
+        day = datetime(2026, 10, 17).date()
+        with override_settings(IMAGE_WRITE_ASYNC=True):
+            name = store.save("entries", "01A 123 BC", data, day)
+            again = store.save("entries", "01A 123 BC", data, day)
+            # Yozilmaguncha ham o'qiladi
+            self.assertEqual(store.read(name), data)
+            store.join()
+            other = store.save("entries", "01A 123 BC", self.jpeg("blue"), day)
+            store.join()
+
+        self.assertEqual(name, again)
+        self.assertNotEqual(name, other)
+        self.assertTrue(name.startswith("entries/2026/10/17/01A123BC_"))
+        self.assertEqual(store.written, 2)
+        self.assertTrue(self.storage.exists(name))
+        thumb = thumbnail_name(name)
+        self.assertTrue(self.storage.exists(thumb))
+        self.assertLess(self.storage.size(thumb) * 10, self.storage.size(name))
+
+    def test_thumbnail_view_builds_missing_thumbnails(self):
+        from unittest import mock
+
+        from django.contrib.auth import get_user_model
+        from django.core.files.base import ContentFile
+
+        from .images import THUMB_CONTENT_TYPE, ImageStore, thumbnail_name
+
+        store = ImageStore(storage=self.storage)
+        # Pipeline dan oldingi rasm: kichik nusxasi yo'q
+        name = self.storage.save(
+            "entries/old_20250717_135501.jpg", ContentFile(self.jpeg())
+        )
+        self.client.force_login(
+            get_user_model().objects.create_user(username="thumbs", password="x")
+        )
+
+        with mock.patch("smartpark.views.image_store", store):
+            response = self.client.get(f"/thumbs/{name}")
+            missing = self.client.get("/thumbs/entries/yoq.jpg")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], THUMB_CONTENT_TYPE)
+        self.assertTrue(self.storage.exists(thumbnail_name(name)))
+        self.assertEqual(missing.status_code, 404)
+
+    def test_entry_rows_reference_thumbnails(self):
+        from .broadcast import serialize_entry
+
+        entry = VehicleEntry.objects.create(
+            number_plate="01A123BC",
+            entry_time=timezone.now(),
+            entry_image="entries/01A123BC_0123456789abcdef.jpg",
+        )
+        row = serialize_entry(entry)
+        self.assertEqual(
+            row["entry_thumb"], "/thumbs/entries/01A123BC_0123456789abcdef.jpg"
+        )
+        self.assertIsNone(row["exit_thumb"])
+
+
+class TestRetention(TestCase):
+    """Eski yozuvlar va kunlik rasm papkalarini o'chirish testlari"""
+
+    def setUp(self):
+        import tempfile
+
+        from django.core.files.storage import FileSystemStorage
+
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.storage = FileSystemStorage(location=media.name)
+
+    def entry(self, plate, entered, exited=None):
+        from django.core.files.base import ContentFile
+
+        from .images import image_name, thumbnail_name
+        from .stats import local_date
+
+        def stored(prefix, when):
+            name = image_name(prefix, plate, plate.encode(), local_date(when))
+            self.storage.save(name, ContentFile(b"jpeg"))
+            self.storage.save(thumbnail_name(name), ContentFile(b"webp"))
+            return name
+
+        return VehicleEntry.objects.create(
+            number_plate=plate,
+            entry_time=entered,
+            exit_time=exited,
+            entry_image=stored("entries", entered),
+            exit_image=stored("exits", exited) if exited else None,
+        )
+
+    def test_purge_drops_old_day_directories_with_rows(self):
+        from datetime import timedelta
+
+        from .retention import media_days, purge_before
+        from .stats import local_date
+
+        now = timezone.now()
+        old = self.entry("01A111AA", now - timedelta(days=30))
+        # Chegaradan oldin kirgan, keyin chiqqan: chiqish rasmi alohida o'chiriladi
+        crossing = self.entry(
+            "01A222AA", now - timedelta(days=21), now - timedelta(days=5)
+        )
+        kept = self.entry("01A333AA", now - timedelta(days=2), now - timedelta(days=1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = purge_before(local_date(now - timedelta(days=20)), self.storage)
+
+        self.assertEqual(result.rows, 2)
+        self.assertEqual(
+            list(VehicleEntry.objects.values_list("id", flat=True)), [kept.id]
+        )
+        self.assertEqual(result.directories, 4)
+        self.assertEqual(result.files, 1)
+        for name in (
+            old.entry_image.name,
+            crossing.entry_image.name,
+            crossing.exit_image.name,
+        ):
+            self.assertFalse(self.storage.exists(name))
+        self.assertTrue(self.storage.exists(kept.entry_image.name))
+        self.assertTrue(self.storage.exists(kept.exit_image.name))
+        self.assertEqual(len(media_days("entries", self.storage)), 1)
+
+    def test_delete_entries_keeps_shared_files(self):
+        from datetime import timedelta
+
+        from .retention import delete_entries
+
+        when = timezone.now() - timedelta(days=8)
+        stale = self.entry("01B111BB", when)
+        # Xuddi shu kadr qayta kelgan - fayl umumiy
+        twin = self.entry("01B111BB", when + timedelta(minutes=1))
+        lonely = self.entry("01B222BB", when)
+        self.assertEqual(stale.entry_image.name, twin.entry_image.name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rows = delete_entries(
+                VehicleEntry.objects.filter(id__in=[stale.id, lonely.id]),
+                self.storage,
+            )
+
+        self.assertEqual(rows, 2)
+        self.assertTrue(self.storage.exists(twin.entry_image.name))
+        self.assertFalse(self.storage.exists(lonely.entry_image.name))
+
+    def test_batches_skip_per_row_signals(self):
+        from datetime import timedelta
+
+        from django.db.models.signals import post_delete
+
+        from .models import DailyParkingStats
+        from .retention import purge_before
+        from .stats import local_date
+
+        now = timezone.now()
+        old_day = local_date(now - timedelta(days=30))
+        for n in range(5):
+            VehicleEntry.objects.create(
+                number_plate=f"01D00{n}DD", entry_time=now - timedelta(days=30)
+            )
+        DailyParkingStats.objects.create(day=old_day, entries=5, open_entries=5)
+        signals = []
+
+        def receiver(**kwargs):
+            signals.append(kwargs["instance"])
+
+        post_delete.connect(receiver, sender=VehicleEntry)
+        self.addCleanup(post_delete.disconnect, receiver, sender=VehicleEntry)
+        progress = []
+
+        result = purge_before(
+            local_date(now - timedelta(days=20)),
+            self.storage,
+            batch_size=2,
+            pause=0,
+            progress=lambda r: progress.append(r.rows),
+        )
+
+        self.assertEqual((result.rows, result.batches), (5, 3))
+        self.assertEqual(progress, [2, 4, 5])
+        self.assertEqual(signals, [])
+        self.assertFalse(VehicleEntry.objects.exists())
+        # Kunlik yig'madagi "ichkarida" soni bir UPDATE bilan kamaydi, tarix qoladi
+        row = DailyParkingStats.objects.get(day=old_day)
+        self.assertEqual((row.entries, row.open_entries), (5, 0))
+
+    def test_purge_command(self):
+        import io
+        from datetime import timedelta
+
+        from django.core.management import call_command
+        from django.test import override_settings
+
+        now = timezone.now()
+        self.entry("01E111EE", now - timedelta(days=40))
+        self.entry("01E222EE", now - timedelta(days=1))
+        out = io.StringIO()
+
+        call_command("purge_entries", "--days", "20", "--dry-run", stdout=out)
+        self.assertIn(": 1 ta", out.getvalue())
+        self.assertEqual(VehicleEntry.objects.count(), 2)
+
+        with override_settings(MEDIA_ROOT=self.storage.location):
+            call_command("purge_entries", "--days", "20", "--sleep", "0", stdout=out)
+        self.assertEqual(
+            list(VehicleEntry.objects.values_list("number_plate", flat=True)),
+            ["01E222EE"],
+        )
+
+
+class TestScheduler(TestCase):
+    """Yetakchi saylash va vazifalarni rejalashtirish testlari"""
+
+    def make(self):
+        from .scheduler import Scheduler
+
+        return Scheduler(lease_name="test-lease", lease_seconds=60)
+
+    def test_only_one_worker_leads(self):
+        first, second = self.make(), self.make()
+        self.assertTrue(first.elect())
+        self.assertFalse(second.elect())
+        # Yangilash yetakchilikni saqlaydi
+        self.assertTrue(first.elect())
+        self.assertFalse(second.elect())
+
+        first.resign()
+        self.assertTrue(second.elect())
+        self.assertFalse(first.elect())
+
+    def test_expired_lease_is_taken_over(self):
+        from datetime import timedelta
+
+        from .models import SchedulerLease
+
+        first, second = self.make(), self.make()
+        first.elect()
+        SchedulerLease.objects.filter(name="test-lease").update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertTrue(second.elect())
+        self.assertEqual(
+            SchedulerLease.objects.get(name="test-lease").owner, second.owner
+        )
+
+    def test_run_pending_runs_due_jobs_on_leader_only(self):
+        import time
+
+        from .scheduler import Job
+
+        leader, follower = self.make(), self.make()
+        calls = []
+
+        def broken():
+            raise RuntimeError("disk")
+
+        for scheduler in (leader, follower):
+            scheduler.add(Job("count", lambda: calls.append(1), every=60))
+            scheduler.add(Job("broken", broken, every=60))
+            scheduler.add(Job("nightly", lambda: calls.append("night"), at="03:30"))
+        leader.elect()
+        follower.elect()
+
+        now = time.time()
+        self.assertEqual(follower.run_pending(now), 0)
+        self.assertEqual(leader.run_pending(now), 2)
+        self.assertEqual(calls, [1])
+        # Keyingi ishga tushish intervaldan keyin
+        self.assertEqual(leader.run_pending(now), 0)
+        self.assertGreaterEqual(leader.jobs["count"].next_run, now + 60)
+
+        status = {job["name"]: job for job in leader.status()["jobs"]}
+        self.assertEqual((status["count"]["runs"], status["count"]["failures"]), (1, 0))
+        self.assertEqual(
+            (status["broken"]["runs"], status["broken"]["failures"]), (1, 1)
+        )
+        self.assertIn("RuntimeError", status["broken"]["last_error"])
+        self.assertEqual(status["nightly"]["runs"], 0)
+
+    def test_next_run_times(self):
+        from datetime import datetime
+
+        from .scheduler import Job
+
+        noop = lambda: None  # noqa: E731
+        now = datetime(2026, 10, 17, 14, 20, 5).timestamp()
+
+        self.assertEqual(Job("a", noop, every=300).next_after(now), now + 300)
+        hourly = Job("b", noop, every=3600, align=True).next_after(now)
+        self.assertEqual(datetime.fromtimestamp(hourly), datetime(2026, 10, 17, 15, 0))
+        daily = Job("c", noop, at="03:30").next_after(now)
+        self.assertEqual(datetime.fromtimestamp(daily), datetime(2026, 10, 18, 3, 30))
+        jittered = Job("d", noop, every=300, jitter=10).next_after(now)
+        self.assertTrue(now + 300 <= jittered <= now + 310)
+
+        with self.assertRaises(ValueError):
+            Job("e", noop)
+
+
+class UnikassaStubMixin:
+    """Lokal Unikassa stub serverini ishga tushiradi"""
+
+    def start_stub(self, **options):
+        import threading
+
+        from .management.commands.unikassa_stub import make_stub_server
+
+        server = make_stub_server(**options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def client_for(self, server=None, port=None, **options):
+        from .unikassa import UnikassaClient
+
+        port = port or server.server_address[1]
+        options.setdefault("timeout", (1, 2))
+        client = UnikassaClient(
+            base_url=f"http://127.0.0.1:{port}", backoff=0, **options
+        )
+        self.addCleanup(client.close)
+        return client
+
+    def closed_port(self):
+        import socket
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+
+
+class TestUnikassaClient(UnikassaStubMixin, TestCase):
+    """Unikassa mijozi: keep-alive, qayta urinish, xatolar turlari"""
+
+    def test_sales_reuse_one_connection(self):
+        from .unikassa import build_sale_payload
+
+        server = self.start_stub()
+        client = self.client_for(server)
+        answers = [client.send_sale(build_sale_payload(4000)) for _ in range(3)]
+
+        self.assertEqual([a["ReceiptSeq"] for a in answers], [1, 2, 3])
+        self.assertEqual(len(server.connections), 1)
+        item = server.sales[0]["Receipt"]["Items"][0]
+        self.assertEqual((item["Price"], item["VAT"]), ("400000", 48000))
+
+    def test_unavailable_is_retried_and_rejected_is_not(self):
+        from .unikassa import FiscalRejected, FiscalUnavailable
+
+        server = self.start_stub()
+        client = self.client_for(server, retries=2)
+        server.fail_next = 2
+        self.assertEqual(client.sync(), {"status": "ok"})
+        self.assertEqual((server.requests, client.retried), (3, 2))
+
+        server.fail_next = 3
+        with self.assertRaises(FiscalUnavailable):
+            client.sync()
+
+        requests_before = server.requests
+        with self.assertRaises(FiscalRejected):
+            client.post("/no/such/method", {})
+        self.assertEqual(server.requests, requests_before + 1)
+
+        down = self.client_for(port=self.closed_port(), retries=1)
+        with self.assertRaises(FiscalUnavailable):
+            down.sync()
+        self.assertEqual(down.requests, 2)
+
+
+class TestFiscalOutbox(UnikassaStubMixin, TestCase):
+    """Soliq cheklari navbati: darhol qabul, fonda yuborish, qayta urinish"""
+
+    def setUp(self):
+        self.sent = []
+
+    def worker(self, client, **options):
+        from .fiscal_outbox import OutboxWorker
+
+        return OutboxWorker(
+            client=client,
+            retry_delay=60,
+            max_attempts=3,
+            on_sent=lambda row: self.sent.append(row.id),
+            **options,
+        )
+
+    def test_sale_is_accepted_without_calling_the_api(self):
+        from unittest import mock
+
+        from .models import FiscalOutbox, FiscalStatus
+
+        entry = VehicleEntry.objects.create(number_plate="01F111FF", total_amount=4000)
+        with mock.patch("smartpark.unikassa.requests.Session.post") as post:
+            response = self.client.post(
+                "/api/send/sale/",
+                {"price": 4000, "id": entry.id, "paytype": "card"},
+                content_type="application/json",
+            )
+        post.assert_not_called()
+        self.assertEqual(response.status_code, 202)
+        row = FiscalOutbox.objects.get(id=response.json()["outbox_id"])
+        self.assertEqual((row.entry_id, row.status), (entry.id, FiscalStatus.PENDING))
+        self.assertEqual(row.payload["Receipt"]["ReceivedCard"], "400000")
+
+        missing = self.client.post(
+            "/api/send/sale/",
+            {"price": 4000, "id": entry.id + 100},
+            content_type="application/json",
+        )
+        self.assertEqual(missing.status_code, 404)
+
+    def test_outbox_retries_until_the_api_is_back(self):
+        from datetime import timedelta
+
+        from .models import FiscalOutbox, FiscalStatus
+        from .unikassa import build_sale_payload
+
+        port = self.closed_port()
+        worker = self.worker(self.client_for(port=port, retries=0))
+        row = worker.enqueue(build_sale_payload(2000))
+
+        self.assertEqual(worker.flush(), 0)
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), (FiscalStatus.PENDING, 1))
+        self.assertIn("ulanib", row.last_error)
+        # Keyingi urinish hali vaqti kelmagan
+        self.assertEqual(worker.due_ids(), [])
+
+        server = self.start_stub(port=port)
+        FiscalOutbox.objects.filter(id=row.id).update(
+            next_attempt_at=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertEqual(worker.flush(), 1)
+        row.refresh_from_db()
+        self.assertEqual(row.status, FiscalStatus.SENT)
+        self.assertEqual(row.response["ReceiptSeq"], 1)
+        self.assertEqual(self.sent, [row.id])
+        self.assertEqual(len(server.sales), 1)
+
+    def test_rejected_sale_fails_and_can_be_retried(self):
+        from datetime import timedelta
+
+        from .fiscal_outbox import OutboxWorker
+        from .models import FiscalOutbox, FiscalStatus
+        from .unikassa import FiscalRejected
+
+        class Rejecting:
+            requests = retried = 0
+
+            def send_sale(self, payload):
+                raise FiscalRejected("Fiscal noto'g'ri")
+
+        entry = VehicleEntry.objects.create(number_plate="01F222FF", total_amount=4000)
+        worker = OutboxWorker(client=Rejecting())
+        row = worker.enqueue({"Fiscal": "XX"}, entry.id)
+        worker.flush()
+        row.refresh_from_db()
+        entry.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), (FiscalStatus.FAILED, 1))
+        self.assertEqual(entry.fiscal_status, FiscalStatus.FAILED)
+        self.assertEqual(worker.status()["counts"][FiscalStatus.FAILED], 1)
+
+        self.assertEqual(worker.retry_failed(), 1)
+        row.refresh_from_db()
+        entry.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), (FiscalStatus.PENDING, 0))
+        self.assertEqual(entry.fiscal_status, FiscalStatus.PENDING)
+
+        # Bitta savdoni faqat bittasi oladi; osilib qolgani qayta yuborilmaydi
+        self.assertTrue(worker.claim(row.id))
+        self.assertFalse(worker.claim(row.id))
+        FiscalOutbox.objects.filter(id=row.id).update(
+            claimed_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(worker.recover_stale(), 1)
+        row.refresh_from_db()
+        self.assertEqual(row.status, FiscalStatus.REVIEW)
+        self.assertEqual(worker.due_ids(), [])
+
+    def test_read_timeout_goes_to_review_not_to_the_queue(self):
+        from .models import FiscalStatus
+        from .unikassa import FiscalUncertain, build_sale_payload
+
+        server = self.start_stub(delay=0.5)
+        client = self.client_for(server, timeout=(1, 0.1))
+        with self.assertRaises(FiscalUncertain):
+            client.send_sale(build_sale_payload(4000))
+        self.assertEqual(server.requests, 1)
+
+        entry = VehicleEntry.objects.create(number_plate="01F333FF", total_amount=4000)
+        worker = self.worker(client)
+        row = worker.enqueue(build_sale_payload(4000), entry.id)
+        self.assertEqual(worker.flush(), 0)
+        self.assertEqual(worker.flush(), 0)
+        row.refresh_from_db()
+        entry.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), (FiscalStatus.REVIEW, 1))
+        self.assertEqual(entry.fiscal_status, FiscalStatus.REVIEW)
+        self.assertEqual(server.requests, 2)
+
+        # Faqat operator tanlagani qayta yuboriladi
+        self.assertEqual(worker.retry_failed(), 0)
+        self.assertEqual(worker.confirm_sent([row.id]), 1)
+        entry.refresh_from_db()
+        self.assertEqual(entry.fiscal_status, FiscalStatus.SENT)
+
+    def test_batch_is_sent_concurrently_and_reconciled(self):
+        from .models import FiscalStatus
+        from .unikassa import build_sale_payload
+
+        server = self.start_stub(delay=0.1)
+        worker = self.worker(
+            self.client_for(server, retries=0), batch_size=10, concurrency=3
+        )
+        entries = [
+            VehicleEntry.objects.create(number_plate=f"01B{n:03d}BB", total_amount=4000)
+            for n in range(6)
+        ]
+        for entry in entries:
+            worker.enqueue(build_sale_payload(4000), entry.id)
+        server.fail_next = 1
+
+        self.assertEqual(worker.flush(), 5)
+        self.assertEqual(server.peak_active, 3)
+
+        statuses = sorted(
+            VehicleEntry.objects.filter(id__in=[e.id for e in entries]).values_list(
+                "fiscal_status", flat=True
+            )
+        )
+        self.assertEqual(statuses, [FiscalStatus.PENDING] + [FiscalStatus.SENT] * 5)
+        sent = VehicleEntry.objects.filter(fiscal_status=FiscalStatus.SENT).first()
+        self.assertTrue(sent.fiscal_receipt and sent.fiscal_sign)
+
+        batches = worker.status()["batches"]
+        self.assertEqual(batches["totals"]["batches"], 1)
+        last = batches["last"]
+        self.assertEqual(
+            (last["size"], last["sent"], last["deferred"], last["failed"]), (6, 5, 1, 0)
+        )
+        self.assertGreaterEqual(last["sale_max_ms"], 100)
+        self.assertAlmostEqual(batches["recent_failure_rate"], 1 / 6, places=3)
+
+
+class TestReceiptRenderer(TestCase):
+    """Soliq cheki rasmi: shrift va sarlavha bir marta, chek 1-bitli"""
+
+    def response(self, seq):
+        return {
+            "ReceiptSeq": seq,
+            "DateTime": "2025-11-22 14:05:31",
+            "FiscalSign": f"{seq:012d}",
+            "SerialNumber": "UZ210317208541",
+            "FMNumber": "ZZ000000000000",
+        }
+
+    def test_static_parts_are_prepared_once(self):
+        from unittest import mock
+
+        from PIL import ImageChops, ImageFont
+
+        from .receipt_render import WIDTH, ReceiptRenderer
+
+        renderer = ReceiptRenderer()
+        first = renderer.render(self.response(1))
+        header = renderer.bands()[0]
+        with mock.patch(
+            "smartpark.receipt_render.ImageFont.truetype", wraps=ImageFont.truetype
+        ) as truetype:
+            second = renderer.render(self.response(2))
+        # Shriftlar birinchi chekda yuklangan
+        truetype.assert_not_called()
+        self.assertIs(renderer.bands()[0], header)
+
+        self.assertEqual((first.mode, first.width), ("1", WIDTH))
+        self.assertEqual(first.size, second.size)
+        top = (0, 0, WIDTH, header.height)
+        self.assertIsNone(ImageChops.difference(first.crop(top), header).getbbox())
+        # Chek raqami va fiskal belgi farq qiladi
+        self.assertIsNotNone(ImageChops.difference(first, second).getbbox())
+
+    def test_header_follows_company_settings(self):
+        from .receipt_render import ReceiptRenderer
+
+        renderer = ReceiptRenderer()
+        header = renderer.bands()[0]
+        with self.settings(COMPANY_NAME="BOSHQA AVTOTURARGOH"):
+            self.assertIsNot(renderer.bands()[0], header)
+            renamed = renderer.render(self.response(1))
+        self.assertEqual(renamed.mode, "1")
@@ -0,0 +1,225 @@
+"""HTTP client for the Unikassa fiscal API.
+
+One ``requests.Session`` per client keeps connections to the API alive
+(``UNIKASSA_POOL_SIZE`` of them), instead of a new TCP + TLS handshake
+for every sale.
+
+Errors are split in three:
+
+- ``FiscalUnavailable`` - the API could not be reached or answered
+  429/5xx, so the sale was not registered. Connection failures and
+  429/502/503/504 are retried in place ``UNIKASSA_RETRIES`` times with a
+  doubling, jittered delay;
+- ``FiscalUncertain`` - the request reached the API but no usable answer
+  came back (read timeout, a 2xx that is not JSON). The sale may already
+  be registered, so it must not be sent again automatically;
+- ``FiscalRejected`` - the API answered but refused the request (4xx or
+  an ``error`` field); sending it again would give the same answer.
+
+``UNIKASSA_BASE_URL`` can point at a local stub
+(``manage.py unikassa_stub``) for testing.
+"""
+
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+DEFAULT_BASE_URL = "https://api.unikassa.uz/api/v1/integrate"
+DEFAULT_FISCAL = "ZZ000000000000"
+DEFAULT_TIMEOUT = (3.05, 10)  # ulanish, javob (s)
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.5
+DEFAULT_POOL_SIZE = 4
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+
+class FiscalError(Exception):
+    pass
+
+
+class FiscalUnavailable(FiscalError):
+    pass
+
+
+class FiscalUncertain(FiscalError):
+    """The sale may or may not have been registered."""
+
+
+class FiscalRejected(FiscalError):
+    pass
+
+
+def build_sale_payload(price, paytype="cash", fiscal=None, now=None):
+    """``/send/sale`` body for one parking payment of ``price`` so'm."""
+    paytype = (paytype or "cash").lower()
+    tiyin = int(round(float(price) * 100))
+    price_str = str(tiyin)
+    time_str = (now or timezone.now()).strftime("%Y-%m-%d %H:%M:%S")
+    return {
+        "Fiscal": fiscal or getattr(settings, "UNIKASSA_FISCAL", DEFAULT_FISCAL),
+        "PayType": paytype,
+        "PayInfo": None,
+        "Receipt": {
+            "ExtraInfo": {
+                "CarNumber": "",
+                "CardNumber": "",
+                "CardType": 2,
+                "CashedOutFromCard": 0,
+                "PINFL": "",
+                "PPTID": "",
+                "PhoneNumber": "",
+                "QRPaymentID": "",
+                "QRPaymentProvider": 0,
+                "TIN": "",
+            },
+            "Items": [
+                {
+                    "Amount": price,
+                    "Barcode": "3637718744639",
+                    "CommissionInfo": None,
+                    "Discount": 0,
+                    "Label": "",
+                    "Name": "Avtoturargoh xizmatlari",
+                    "Other": 0,
+                    "OwnerType": 0,
+                    "PackageCode": "91058",
+                    "Price": price_str,
+                    "SPIC": "10199001007000000",
+                    "Units": 1,
+                    "VAT": round(tiyin * 0.12),
+                    "VATPercent": 12,
+                }
+            ],
+            "Location": {"Latitude": 41.554459, "Longitude": 60.622758},
+            "Operation": 0,
+            "ReceivedCard": price_str if paytype == "card" else 0,
+            "ReceivedCash": price_str if paytype == "cash" else 0,
+            "RefundInfo": None,
+            "Time": time_str,
+            "Type": 0,
+        },
+    }
+
+
+class UnikassaClient:
+    """Pooled, retrying client for the Unikassa integration API."""
+
+    def __init__(
+        self,
+        base_url=None,
+        fiscal=None,
+        timeout=None,
+        retries=None,
+        backoff=None,
+        pool_size=None,
+    ):
+        self._base_url = base_url
+        self._fiscal = fiscal
+        self._timeout = timeout
+        self._retries = retries
+        self._backoff = backoff
+        self._pool_size = pool_size
+        self._session = None
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retried = 0
+
+    def _setting(self, value, name, default):
+        return value if value is not None else getattr(settings, name, default)
+
+    @property
+    def base_url(self):
+        return self._setting(
+            self._base_url, "UNIKASSA_BASE_URL", DEFAULT_BASE_URL
+        ).rstrip("/")
+
+    @property
+    def fiscal(self):
+        return self._setting(self._fiscal, "UNIKASSA_FISCAL", DEFAULT_FISCAL)
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    pool_size = self._setting(
+                        self._pool_size, "UNIKASSA_POOL_SIZE", DEFAULT_POOL_SIZE
+                    )
+                    session = requests.Session()
+                    # Qayta urinishlarni o'zimiz boshqaramiz (max_retries=0)
+                    adapter = HTTPAdapter(
+                        pool_connections=1, pool_maxsize=pool_size, max_retries=0
+                    )
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    session.headers["Content-Type"] = "application/json"
+                    self._session = session
+        return self._session
+
+    def close(self):
+        with self._lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.close()
+
+    def post(self, path, payload):
+        """POST ``payload`` as JSON; returns the decoded answer or raises FiscalError."""
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        timeout = self._setting(self._timeout, "UNIKASSA_TIMEOUT", DEFAULT_TIMEOUT)
+        retries = self._setting(self._retries, "UNIKASSA_RETRIES", DEFAULT_RETRIES)
+        attempt = 0
+        while True:
+            self.requests += 1
+            try:
+                response = self.session.post(url, json=payload, timeout=timeout)
+            except requests.ConnectionError as e:
+                # Ulanib bo'lmadi (ConnectTimeout ham shu yerda): so'rov yetib bormagan
+                error = FiscalUnavailable(f"Unikassa bilan ulanib bo'lmadi: {e}")
+            except requests.Timeout as e:
+                # So'rov yetib borgan, chek ro'yxatga olingan bo'lishi mumkin
+                raise FiscalUncertain(f"Unikassa javob bermadi: {e}") from e
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    return self._decode(response)
+                error = FiscalUnavailable(f"Unikassa HTTP {response.status_code}")
+            if attempt >= retries:
+                raise error
+            self.retried += 1
+            self._sleep(attempt)
+            attempt += 1
+
+    def _sleep(self, attempt):
+        backoff = self._setting(self._backoff, "UNIKASSA_BACKOFF", DEFAULT_BACKOFF)
+        delay = backoff * 2**attempt
+        time.sleep(delay + random.uniform(0, delay / 2))
+
+    @staticmethod
+    def _decode(response):
+        if response.status_code >= 500:
+            raise FiscalUnavailable(f"Unikassa HTTP {response.status_code}")
+        try:
+            result = response.json()
+        except ValueError:
+            error = FiscalRejected if response.status_code >= 400 else FiscalUncertain
+            raise error(
+                f"Unikassa JSON qaytarmadi (HTTP {response.status_code})"
+            ) from None
+        if response.status_code >= 400:
+            raise FiscalRejected(f"Unikassa HTTP {response.status_code}: {result}")
+        if isinstance(result, dict) and (result.get("error") or result.get("Error")):
+            raise FiscalRejected(str(result.get("error") or result.get("Error")))
+        return result
+
+    def send_sale(self, payload):
+        return self.post("/send/sale", payload)
+
+    def sync(self):
+        return self.post("/get/sync", {"Fiscal": self.fiscal})
+
+
+unikassa = UnikassaClient()
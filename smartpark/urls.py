@@ -13,6 +13,9 @@ from .views import (
     block_car,
     get_unpaid_entries,
     get_receipt,
+    image_thumbnail,
+    scheduler_status,
+    fiscal_outbox_status,
     FreePlateNumberView,
     DeleteFreePlateView,
     CarsManagementView,
@@ -44,6 +47,10 @@ urlpatterns = (
         path("", RedirectView.as_view(url="home/", permanent=True)),
         path("receive-entry/", receive_entry),
         path("receive-exit/", receive_exit),
+        # Ko'p yo'lakli rejim: GATE_LANES dagi yo'lak nomi bilan
+        path("receive-entry/<str:lane>/", receive_entry),
+        path("receive-exit/<str:lane>/", receive_exit),
+        path("thumbs/<path:name>", image_thumbnail, name="image_thumbnail"),
         path("accounts/login/", LoginView.as_view(), name="login"),
         path("accounts/logout/", LogoutView.as_view(), name="logout"),
         path("home/", HomeView.as_view(), name="home"),
@@ -55,6 +62,7 @@ urlpatterns = (
         path("api/cars/upload-license/", upload_license, name="upload_license"),
         # New API endpoints
         path("api/statistics/", get_statistics, name="get_statistics"),
+        path("api/scheduler/", scheduler_status, name="scheduler_status"),
         path("api/vehicle-entries/", get_vehicle_entries, name="get_vehicle_entries"),
         path("api/mark-paid/", mark_as_paid, name="mark_as_paid"),
         path("api/add-car/", add_car, name="add_car"),
@@ -97,6 +105,7 @@ urlpatterns = (
         path("mark_error/", MarkErrorView.as_view(), name="mark_error"),
         # UNIKASSA
         path("api/send/sale/", SaleSend.as_view(), name="send_sale"),
+        path("api/fiscal/outbox/", fiscal_outbox_status, name="fiscal_outbox_status"),
     ]
     + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     + staticfiles_urlpatterns()
@@ -1,4 +1,6 @@
 import sys
+import threading
+import time
 from django.conf import settings
 from datetime import datetime
 
@@ -65,8 +67,120 @@ def _resolve_printer_name(preferred_name: str | None) -> str:
     )
 
 
-def print_receipt(
-    printer_name=None,
+DEFAULT_PRINTER_CACHE_SECONDS = 300
+
+_resolved_printers = {}
+_resolved_lock = threading.Lock()
+
+
+def resolve_printer_cached(preferred_name: str | None = None) -> str:
+    """``_resolve_printer_name`` remembered for ``PRINTER_CACHE_SECONDS``.
+
+    EnumPrinters is slow (it asks every network printer connection), so
+    it runs once per cache period instead of once per receipt.
+    """
+    timeout = getattr(settings, "PRINTER_CACHE_SECONDS", DEFAULT_PRINTER_CACHE_SECONDS)
+    now = time.monotonic()
+    with _resolved_lock:
+        cached = _resolved_printers.get(preferred_name)
+        if cached and now - cached[1] < timeout:
+            return cached[0]
+    name = _resolve_printer_name(preferred_name)
+    with _resolved_lock:
+        _resolved_printers[preferred_name] = (name, now)
+    return name
+
+
+def forget_printers():
+    """Drop cached printer names (after a failed job the printer is looked up again)."""
+    with _resolved_lock:
+        _resolved_printers.clear()
+
+
+def send_raw(data: bytes, doc_name: str = "Chek", printer_name=None):
+    """Send ready ESC/POS bytes to the printer and return its name.
+
+    Raises on failure. On non-Windows platforms the data is only logged
+    and ``None`` is returned.
+    """
+    if win32print is None:
+        # Linux yoki boshqa non-Windows platformalarda faqat log, printerga yubormaymiz
+        print(
+            f"[INFO] {doc_name}: win32print mavjud emas (non-Windows). Chek konsolga chiqarildi:"
+        )
+        print(data)
+        return None
+
+    resolved_printer = resolve_printer_cached(printer_name)
+    try:
+        hprinter = win32print.OpenPrinter(resolved_printer)
+        try:
+            win32print.StartDocPrinter(hprinter, 1, (doc_name, None, "RAW"))
+            win32print.StartPagePrinter(hprinter)
+            win32print.WritePrinter(hprinter, data)
+            win32print.EndPagePrinter(hprinter)
+            win32print.EndDocPrinter(hprinter)
+        finally:
+            win32print.ClosePrinter(hprinter)
+    except Exception:
+        # Printer o'chirilgan yoki nomi o'zgargan bo'lishi mumkin
+        forget_printers()
+        raise
+    return resolved_printer
+
+
+def format_duration(entry_time, exit_time) -> str:
+    """Parking duration for receipts: minutes, hours and days, rounded up to a minute."""
+    if not (exit_time and entry_time):
+        return "0 daqiqa"
+    total_seconds = int((exit_time - entry_time).total_seconds())
+    if total_seconds < 3600:
+        minutes = (total_seconds + 59) // 60  # ceil to next minute
+        return f"{minutes} daqiqa"
+    if total_seconds < 86400:
+        hours = total_seconds // 3600
+        remaining_seconds = total_seconds % 3600
+        minutes = (remaining_seconds + 59) // 60  # ceil minutes
+        if minutes == 60:
+            hours += 1
+            minutes = 0
+        if minutes == 0:
+            return f"{hours} soat"
+        return f"{hours} soat {minutes} daqiqa"
+    days = total_seconds // 86400
+    remaining_seconds = total_seconds % 86400
+    hours = remaining_seconds // 3600
+    remaining_seconds = remaining_seconds % 3600
+    minutes = (remaining_seconds + 59) // 60  # ceil minutes
+    if minutes == 60:
+        hours += 1
+        minutes = 0
+    if hours == 24:
+        days += 1
+        hours = 0
+    if hours == 0 and minutes == 0:
+        return f"{days} kun"
+    if minutes == 0:
+        return f"{days} kun {hours} soat"
+    return f"{days} kun {hours} soat {minutes} daqiqa"
+
+
+def entry_receipt_fields(entry) -> dict:
+    """``build_receipt`` arguments for a VehicleEntry."""
+    return {
+        "car_number": entry.number_plate,
+        "entry_time": entry.entry_time.strftime("%Y-%m-%d %H:%M"),
+        "exit_time": (
+            entry.exit_time.strftime("%Y-%m-%d %H:%M") if entry.exit_time else "--"
+        ),
+        "duration": format_duration(entry.entry_time, entry.exit_time),
+        "payment_amount": (
+            f"{int(entry.total_amount)} so'm" if entry.total_amount else "0 so'm"
+        ),
+    }
+
+
+def build_receipt(
     company_name="IDSOFT GROUP",
     project_name="SMART AUTO PARK",
     location="URGANCH MARKAZIY DEHQON BOZORI",
@@ -79,10 +193,9 @@ def print_receipt(
     thank_message="Tashrifingiz uchun Rahmat!",
 ):
     """
-    Print receipt to thermal printer with customizable parameters
+    Build the ESC/POS bytes of a payment receipt
 
     Args:
-        printer_name (str): Printer name (default: "XP-80")
         company_name (str): Company name (default: "IDSOFT GROUP")
         project_name (str): Project name (default: "SMART AUTO PARK")
         location (str): Location address (default: "URGANCH MARKAZIY DEHQON BOZORI")
@@ -94,7 +207,7 @@ def print_receipt(
         thank_message (str): Thank you message (default: "Rahmat!")
 
     Returns:
-        bool: True if successful, False otherwise
+        bytes: data ready for ``send_raw``
     """
 
     # ESC/POS commands
@@ -124,30 +237,27 @@ def print_receipt(
     data += CENTER + thank_message.encode("utf-8") + b"\n\n\n\n\n\n"
     data += NORMAL
     data += CUT
+    return data
 
-    if win32print is None:
-        # Linux yoki boshqa non-Windows platformalarda faqat log, printerga yubormaymiz
-        print(
-            "[INFO] print_receipt: win32print mavjud emas (non-Windows). Chek konsolga chiqarildi:"
-        )
-        print(data)
-        return True
 
-    try:
-        # Resolve printer name robustly
-        resolved_printer = _resolve_printer_name(printer_name)
-        # Send to printer
-        hprinter = win32print.OpenPrinter(resolved_printer)
-        win32print.StartDocPrinter(hprinter, 1, ("Chek", None, "RAW"))
-        win32print.StartPagePrinter(hprinter)
-        win32print.WritePrinter(hprinter, data)
-        win32print.EndPagePrinter(hprinter)
-        win32print.EndDocPrinter(hprinter)
-        win32print.ClosePrinter(hprinter)
+def print_receipt(printer_name=None, **fields):
+    """
+    Print receipt to thermal printer with customizable parameters
 
-        print(
-            f"[OK] Chiroyli chek '{resolved_printer}' printeriga chiqarildi va qirqildi!"
-        )
+    Args:
+        printer_name (str): Printer name (default: settings.PRINTER_NAME)
+        **fields: ``build_receipt`` arguments
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    data = build_receipt(**fields)
+    try:
+        resolved_printer = send_raw(data, "Chek", printer_name)
+        if resolved_printer:
+            print(
+                f"[OK] Chiroyli chek '{resolved_printer}' printeriga chiqarildi va qirqildi!"
+            )
         return True
 
     except Exception as e:
@@ -237,24 +347,10 @@ def print_stats_receipt(
     data += b"\n\n\n\n"
     data += CUT
 
-    if win32print is None:
-        # Non-Windows: printer yo'q, faqat data ni log qilamiz
-        print(
-            "[INFO] print_stats_receipt: win32print mavjud emas (non-Windows). Statistika cheki konsolga chiqarildi:"
-        )
-        print(data)
-        return True, None
-
     try:
-        resolved_printer = _resolve_printer_name(printer_name)
-        h = win32print.OpenPrinter(resolved_printer)
-        win32print.StartDocPrinter(h, 1, ("Statistika", None, "RAW"))
-        win32print.StartPagePrinter(h)
-        win32print.WritePrinter(h, data)
-        win32print.EndPagePrinter(h)
-        win32print.EndDocPrinter(h)
-        win32print.ClosePrinter(h)
-        print(f"[OK] Statistika cheki '{resolved_printer}' ga yuborildi")
+        resolved_printer = send_raw(data, "Statistika", printer_name)
+        if resolved_printer:
+            print(f"[OK] Statistika cheki '{resolved_printer}' ga yuborildi")
         return True, None
     except Exception as e:
         err = str(e)
@@ -1,7 +1,22 @@
-from django.http import JsonResponse, HttpResponse
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from .models import VehicleEntry, Cars
 from .utils import print_stats_receipt, _resolve_printer_name
+from .camera_parser import parse_camera_upload
+from .exports import DAILY_LAYOUT, csv_response, export_cache, xlsx_response
+from .fiscal_outbox import fiscal_outbox
+from .images import THUMB_CONTENT_TYPE, image_store, thumbnail_url
+from .lanes import LaneBusy, UnknownLane, gate_lanes
+from .pagination import KEYSET_ORDERING, InvalidCursor, cached_count, keyset_page
+from .plate_index import open_plates
+from .plate_policy import plate_policies
+from .print_spooler import print_spooler
+from .retention import retention_runner
+from .rollups import exit_summary, range_summary
+from .scheduler import scheduler
+from .stats import day_bounds, local_date, local_today, parse_day, statistics_for
+import asyncio
 import sys
 from django.views import View
 from django.contrib.auth import login, logout, authenticate
@@ -9,14 +24,12 @@ from django.shortcuts import render, redirect
 from django.utils import timezone
 from django.contrib.auth.mixins import LoginRequiredMixin
 import json
-from datetime import datetime, timedelta
-import re
-from django.core.files.base import ContentFile
+from datetime import datetime
+from django.core.exceptions import SuspiciousFileOperation
 from django.db import transaction
 from django.views.decorators.http import require_POST, require_GET
-from django.db.models import Sum, Q
+from django.db.models import Q
 from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
 
 # MIN_TIME_BETWEEN_ENTRIES available in settings if needed elsewhere
 from django.contrib.auth.decorators import login_required
@@ -65,119 +78,170 @@ class HomeView(LoginRequiredMixin, View):
         return render(request, "home.html")
 
 
+async def lane_response(direction, request, lane_name=None):
+    """Parse a camera event and handle it on its gate lane (in order, per lane and per plate).
+
+    The view is async: while the event waits in its lane queue no server
+    thread is held, and the operator notifications the handler collected
+    are sent with a plain ``await group_send`` after its transaction.
+    """
+    try:
+        # 1-2. So'rov oqimini bir marta o'qib, <licensePlate> va JPEG qismini
+        # nusxa olmasdan (memoryview) ajratamiz. Tana ASGI handler tomonidan allaqachon
+        # qabul qilingan, ajratish ~0.1 ms - event loopda bajarish thread almashishidan arzon
+        upload = parse_camera_upload(request)
+        received_at = timezone.now()
+        lane = gate_lanes.resolve(
+            direction, name=lane_name, camera=request.META.get("REMOTE_ADDR")
+        )
+        number_plate = (
+            upload.number_plate or f"TEMP{received_at.strftime('%H%M%S')}"
+        )
+        handler = _handle_entry if direction == "entry" else _handle_exit
+        notices = []
+        event = asyncio.ensure_future(
+            lane.acall(number_plate, handler, lane, upload, number_plate, received_at, notices)
+        )
+        try:
+            response = await asyncio.wait_for(
+                asyncio.shield(event), getattr(settings, "GATE_EVENT_TIMEOUT", 30)
+            )
+        except asyncio.TimeoutError:
+            # Hodisa navbatda qoladi va tartib bo'yicha baribir bajariladi;
+            # bildirishnomalari esa u tugagach yuboriladi
+            event.add_done_callback(
+                lambda _: asyncio.ensure_future(_send_notices(notices))
+            )
+            return JsonResponse(
+                {"status": "accepted", "message": "Hodisa navbatda"}, status=202
+            )
+        await _send_notices(notices)
+        return response
+    except UnknownLane as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=404)
+    except LaneBusy as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=503)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+def _notice(notices, title, message, notification_type):
+    """Operatorga bildirishnoma; lane_response uni tranzaksiyadan keyin yuboradi"""
+    notices.append(
+        {
+            "type": "broadcast_notification",
+            "title": title,
+            "message": message,
+            "notification_type": notification_type,
+            "timestamp": timezone.now().isoformat(),
+        }
+    )
+
+
+async def _send_notices(notices):
+    channel_layer = get_channel_layer()
+    for notice in notices:
+        try:
+            await channel_layer.group_send("home_updates", notice)
+        except Exception as e:
+            print("[NOTIFICATION ERROR]:", e)
+
+
 @csrf_exempt
 @require_POST
-def receive_entry(request):
-    try:
-        with transaction.atomic():
-            content_type = request.headers.get("Content-Type", "")
-            body_bytes = request.body
-            body_str = body_bytes.decode("utf-8", errors="ignore")
+async def receive_entry(request, lane=None):
+    return await lane_response("entry", request, lane)
 
-            # 1. XML'dan davlat raqamini ajratamiz (masalan <licensePlate> tagidan)
-            number_plate_match = re.search(
-                r"<licensePlate>(.*?)</licensePlate>", body_str
+
+def _handle_entry(lane, upload, number_plate, received_at, notices):
+    """Kirish hodisasi; lane workerida ishlaydi"""
+    with transaction.atomic():
+        if not upload.has_boundary:
+            return JsonResponse(
+                {"status": "error", "message": "Multipart boundary topilmadi"},
+                status=400,
+            )
+
+        image_data = upload.image
+        # Bloklangan raqamlar xotiradagi to'plamdan tekshiriladi (DB so'rovisiz)
+        if plate_policies.is_blocked(number_plate):
+            _notice(
+                notices,
+                "🚫 Bloklangan avtomobil",
+                f"Avtomobil {number_plate} bloklangan! Chiqish taqiqlanadi.",
+                "error",
+            )
+
+            return JsonResponse(
+                {
+                    "status": "error",
+                    "message": f"Bu avtomobilga taqiq qo'shilgan! {number_plate}",
+                }
+            )
+        if not image_data:
+            # Agar rasm topilmasa, xatolik xabarini qaytaramiz
+            return JsonResponse(
+                {
+                    "status": "ok",
+                    "message": f"Avtomobil {number_plate} uchun rasm topilmadi. Iltimos qayta urinib ko'ring.",
+                },
+                status=200,
             )
-            number_plate = (
-                number_plate_match.group(1)
-                if number_plate_match
-                else f"TEMP{timezone.now().strftime('%H%M%S')}"
+
+        # 3. Rasm fon threadida yoziladi; nom (raqam + kontent hash) darhol ma'lum
+        image_file = image_store.save(
+            "entries", number_plate, image_data, local_date(received_at)
+        )
+
+        # 5. Bazaga yozamiz - kirish vaqti hodisa kelgan payt (navbatda kutgan vaqt qo'shilmaydi)
+        open_entry = (
+            VehicleEntry.objects.select_for_update()
+            .filter(number_plate=number_plate, exit_time__isnull=True)
+            .last()
+        )
+        if open_entry is not None:
+            open_entry.delete()
+            VehicleEntry.objects.create(
+                number_plate=number_plate,
+                entry_time=received_at,
+                entry_image=image_file,
+                total_amount=0,
             )
+            transaction.on_commit(lambda: _auto_open(lane))
 
-            # 2. Faylni multipart dan ajratish
-            # Bu oddiy variant: multipart so'rovdan rasmni olish
-            boundary = (
-                content_type.split("boundary=")[-1]
-                if "boundary=" in content_type
-                else None
+            return JsonResponse(
+                {
+                    "status": "ok",
+                    "message": f"Bu avtomobilga taqiq qo'shilgan! {number_plate}",
+                }
             )
+        entry = VehicleEntry.objects.create(
+            number_plate=number_plate,
+            entry_time=received_at,
+            entry_image=image_file,
+            total_amount=0,
+        )
+        transaction.on_commit(lambda: _auto_open(lane))
 
-            if boundary:
-                parts = body_bytes.split(boundary.encode())
-                image_data = None
-                for part in parts:
-                    if b"Content-Type: image/jpeg" in part:
-                        image_data = part.split(b"\r\n\r\n", 1)[-1].rsplit(b"\r\n", 1)[
-                            0
-                        ]
-                        break
-                car = Cars.objects.filter(
-                    number_plate=number_plate, is_blocked=True
-                ).first()
-                if car:
-                    channel_layer = get_channel_layer()
-                    async_to_sync(channel_layer.group_send)(
-                        "home_updates",
-                        {
-                            "type": "broadcast_notification",
-                            "title": "🚫 Bloklangan avtomobil",
-                            "message": f"Avtomobil {number_plate} bloklangan! Chiqish taqiqlanadi.",
-                            "notification_type": "error",
-                            "timestamp": timezone.now().isoformat(),
-                        },
-                    )
+        return JsonResponse(
+            {
+                "status": "ok",
+                "message": "VehicleEntry created",
+                "number_plate": number_plate,
+                "file_saved": image_file,
+                "entry_id": entry.id,
+                "lane": lane.name,
+            }
+        )
 
-                    return JsonResponse(
-                        {
-                            "status": "error",
-                            "message": f"Bu avtomobilga taqiq qo'shilgan! {number_plate}",
-                        }
-                    )
-                if image_data:
-                    # 3. Fayl nomi: Raqam + sana (20250717_135501.jpg)
-                    current_time = timezone.now()
-                    timestamp = current_time.strftime("%Y%m%d_%H%M%S")
-                    filename = f"{number_plate}_{timestamp}.jpg"
-
-                    # 4. Rasmdan ImageField fayl obyektini yasaymiz
-                    image_file = ContentFile(image_data, name=filename)
-
-                    # 5. Bazaga yozamiz - entry_time auto_now_add=True bo'lgani uchun o'rnatmaymiz
-                    if VehicleEntry.objects.filter(
-                        number_plate=number_plate, exit_time__isnull=True
-                    ).exists():
-                        latest_entry = VehicleEntry.objects.filter(
-                            number_plate=number_plate, exit_time__isnull=True
-                        ).last()
-                        latest_entry.delete()
-                        VehicleEntry.objects.create(
-                            number_plate=number_plate,
-                            entry_image=image_file,
-                            total_amount=0,
-                        )
-
-                        return JsonResponse(
-                            {
-                                "status": "ok",
-                                "message": f"Bu avtomobilga taqiq qo'shilgan! {number_plate}",
-                            }
-                        )
-                    entry = VehicleEntry.objects.create(
-                        number_plate=number_plate,
-                        entry_image=image_file,
-                        total_amount=0,
-                    )
 
-                    return JsonResponse(
-                        {
-                            "status": "ok",
-                            "message": "VehicleEntry created",
-                            "number_plate": number_plate,
-                            "file_saved": filename,
-                            "entry_id": entry.id,
-                        }
-                    )
-                else:
-                    # Agar rasm topilmasa, xatolik xabarini qaytaramiz
-                    return JsonResponse(
-                        {
-                            "status": "ok",
-                            "message": f"Avtomobil {number_plate} uchun rasm topilmadi. Iltimos qayta urinib ko'ring.",
-                        },
-                        status=200,
-                    )
-    except Exception as e:
-        return JsonResponse({"error": str(e)}, status=500)
+def _auto_open(lane):
+    """Yo'lakda avtomatik ochish yoqilgan bo'lsa shlakbaumni ochadi"""
+    if lane.auto_open:
+        try:
+            lane.open_barrier()
+        except Exception as e:
+            print("[BARRIER ERROR]:", e)
 
 
 @csrf_exempt
@@ -259,297 +323,256 @@ def default_create_entry(request):
 
 @csrf_exempt
 @require_POST
-def receive_exit(request):
-    try:
-        with transaction.atomic():
-            content_type = request.headers.get("Content-Type", "")
-            body_bytes = request.body
-            body_str = body_bytes.decode("utf-8", errors="ignore")
-            current_time = timezone.now()
+async def receive_exit(request, lane=None):
+    return await lane_response("exit", request, lane)
 
-            # Create timezone-aware datetime range for today
-            today = current_time.date()
-            start_datetime = timezone.make_aware(
-                datetime.combine(today, datetime.min.time())
-            )
-            end_datetime = timezone.make_aware(
-                datetime.combine(today, datetime.max.time())
-            )
 
-            # 1. XML'dan davlat raqamini ajratamiz (masalan <licensePlate> tagidan)
-            number_plate_match = re.search(
-                r"<licensePlate>(.*?)</licensePlate>", body_str
-            )
-            number_plate = (
-                number_plate_match.group(1)
-                if number_plate_match
-                else f"TEMP{current_time.strftime('%H%M%S')}"
-            )
+def _handle_exit(lane, upload, number_plate, received_at, notices):
+    """Chiqish hodisasi; lane workerida ishlaydi"""
+    with transaction.atomic():
+        current_time = received_at
+        start_datetime, end_datetime = day_bounds(local_date(current_time))
 
-            car = Cars.objects.filter(number_plate=number_plate).first()
+        policy = plate_policies.get(number_plate)
 
-            # 2. Faylni multipart dan ajratish
-            # Bu oddiy variant: multipart so'rovdan rasmni olish
-            boundary = (
-                content_type.split("boundary=")[-1]
-                if "boundary=" in content_type
-                else None
+        # 2. Faylni multipart dan ajratish (parse_camera_upload allaqachon topgan)
+        image_data = upload.image
+        if not upload.has_boundary and image_data is None:
+            if upload.declares_jpeg:
+                return JsonResponse(
+                    {
+                        "status": "error",
+                        "message": "Rasm topilmadi",
+                    },
+                    status=400,
+                )
+            return JsonResponse(
+                {
+                    "status": "error",
+                    "message": "Multipart boundary topilmadi",
+                },
+                status=400,
             )
 
-            if not boundary:
-                # Try to find image data without boundary
-                if b"Content-Type: image/jpeg" in body_bytes:
-                    # Simple approach: look for JPEG data
-                    jpeg_start = body_bytes.find(b"\xff\xd8\xff")  # JPEG start marker
-                    if jpeg_start != -1:
-                        image_data = body_bytes[jpeg_start:]
-                    else:
-                        return JsonResponse(
-                            {
-                                "status": "error",
-                                "message": "Rasm topilmadi",
-                            },
-                            status=400,
-                        )
-                else:
-                    return JsonResponse(
-                        {
-                            "status": "error",
-                            "message": "Multipart boundary topilmadi",
-                        },
-                        status=400,
-                    )
-            else:
-                parts = body_bytes.split(boundary.encode())
-                image_data = None
-                for i, part in enumerate(parts):
-                    if b"Content-Type: image/jpeg" in part:
-                        image_data = part.split(b"\r\n\r\n", 1)[-1].rsplit(b"\r\n", 1)[
-                            0
-                        ]
-                        break
-
-            # If no image data found, we'll still process the exit
-            # This handles cases where only XML data is sent
-            if not image_data:
-                # Create a placeholder image file or skip image processing
-                image_file = None
-            else:
-                # 3. Fayl nomi: Raqam + sana (20250717_135501.jpg)
-                timestamp = current_time.strftime("%Y%m%d_%H%M%S")
-                filename = f"{number_plate}_{timestamp}.jpg"
-                # 4. Rasmdan ImageField fayl obyektini yasaymiz
-                image_file = ContentFile(image_data, name=filename)
-
-            # Use timezone-aware datetime range instead of naive date
+        # If no image data found, we'll still process the exit
+        # This handles cases where only XML data is sent
+        # 3. Rasm fon threadida yoziladi (rasm bo'lmasa None)
+        image_file = image_store.save(
+            "exits", number_plate, image_data or None, local_date(current_time)
+        )
 
-            # First, prefer the OLDEST open entry (edited/backdated entries should be used)
-            latest_entry = (
-                VehicleEntry.objects.filter(
-                    number_plate=number_plate,
-                    exit_time__isnull=True,
-                )
-                .order_by("entry_time")
-                .first()
+        # First, prefer the OLDEST open entry (edited/backdated entries should be used).
+        # Qator qulflanadi: boshqa yo'lakdagi bir vaqtdagi chiqish shu yozuvni ololmaydi
+        latest_entry = (
+            VehicleEntry.objects.select_for_update()
+            .filter(
+                number_plate=number_plate,
+                exit_time__isnull=True,
             )
+            .order_by("entry_time", "id")
+            .first()
+        )
 
-            if not latest_entry:
-                # Fall back to the most recent entry if no open entry exists
+        read_plate, match, suggestion = number_plate, None, None
+        if not latest_entry:
+            # Kamera bitta belgini noto'g'ri o'qigan bo'lishi mumkin (0/O, 8/B ...):
+            # ochiq yozuvlar orasidan eng yaqin raqam taklif qilinadi
+            match = open_plates.best_match(number_plate)
+            if match is not None and not match.auto:
+                # Boshqa belgi farqi - boshqa avtomobil bo'lishi mumkin: yopmaymiz
+                suggestion, match = match, None
+                _notify_plate_suggestion(notices, read_plate, suggestion)
+            if match is not None:
                 latest_entry = (
-                    VehicleEntry.objects.filter(number_plate=number_plate)
-                    .order_by("-entry_time")
+                    VehicleEntry.objects.select_for_update()
+                    .filter(number_plate=match.plate, exit_time__isnull=True)
+                    .order_by("entry_time", "id")
                     .first()
                 )
-                if not latest_entry:
-                    # Instead of returning 404, we'll create a temporary entry and continue
-                    # This allows the exit to proceed even if no entry was found
-                    latest_entry = None
-
-            # If no entry was found, we'll just process the exit without updating a database entry
-            if latest_entry is None:
-                # Send notification that vehicle exited but no entry was found
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    "home_updates",
-                    {
-                        "type": "broadcast_notification",
-                        "title": "⚠️ Avtomobil chiqib ketdi",
-                        "message": f"Avtomobil {number_plate} chiqib ketdi (kirish yozuvi topilmadi)",
-                        "notification_type": "warning",
-                        "timestamp": timezone.now().isoformat(),
-                    },
-                )
-
-                # Return success response even without database entry
-                return JsonResponse(
-                    {
-                        "status": "ok",
-                        "number_plate": number_plate,
-                        "amount": 0,
-                        "message": "Exit processed (no entry found)",
-                    }
-                )
+                if latest_entry is None:
+                    match = None
+                else:
+                    number_plate = match.plate
+                    policy = plate_policies.get(number_plate)
+                    _notify_plate_match(notices, read_plate, match)
 
-            # Check if vehicle has already exited
-            if latest_entry.exit_time:
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    "home_updates",
-                    {
-                        "type": "broadcast_notification",
-                        "title": "🚫 Avtomobil allaqachon chiqib ketgan",
-                        "message": f"Avtomobil {number_plate} allaqachon chiqib ketgan!",
-                        "notification_type": "warning",
-                        "timestamp": timezone.now().isoformat(),
-                    },
-                )
-                return JsonResponse(
-                    {
-                        "status": "error",
-                        "message": f"Avtomobil {number_plate} allaqachon chiqib ketgan!",
-                    }
-                )
+        if not latest_entry:
+            # Fall back to the most recent entry if no open entry exists
+            latest_entry = (
+                VehicleEntry.objects.filter(number_plate=number_plate)
+                .order_by("-entry_time")
+                .first()
+            )
 
-            # Check if car is blocked
-            if car and car.is_blocked:
-                # Send real-time notification about blocked car
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    "home_updates",
-                    {
-                        "type": "broadcast_notification",
-                        "title": "🚫 Bloklangan avtomobil",
-                        "message": f"Avtomobil {number_plate} bloklangan! Chiqish taqiqlanadi.",
-                        "notification_type": "error",
-                        "timestamp": timezone.now().isoformat(),
-                    },
-                )
+        # If no entry was found, we'll just process the exit without updating a database entry
+        if latest_entry is None:
+            # Send notification that vehicle exited but no entry was found
+            _notice(
+                notices,
+                "⚠️ Avtomobil chiqib ketdi",
+                f"Avtomobil {number_plate} chiqib ketdi (kirish yozuvi topilmadi)",
+                "warning",
+            )
 
-                return JsonResponse(
-                    {
-                        "status": "error",
-                        "message": f"Bu avtomobilga taqiq qo'shilgan! {number_plate}",
-                    }
-                )
+            # Return success response even without database entry
+            response = {
+                "status": "ok",
+                "number_plate": number_plate,
+                "amount": 0,
+                "message": "Exit processed (no entry found)",
+            }
+            if suggestion is not None:
+                response["suggested_plate"] = suggestion.plate
+                response["match_confidence"] = round(suggestion.confidence, 3)
+            return JsonResponse(response)
+
+        # Check if vehicle has already exited
+        if latest_entry.exit_time:
+            _notice(
+                notices,
+                "🚫 Avtomobil allaqachon chiqib ketgan",
+                f"Avtomobil {number_plate} allaqachon chiqib ketgan!",
+                "warning",
+            )
+            return JsonResponse(
+                {
+                    "status": "error",
+                    "message": f"Avtomobil {number_plate} allaqachon chiqib ketgan!",
+                }
+            )
 
-            # Process the exit based on car type
-            if car and car.is_free and not car.is_blocked:
-                if image_file:
-                    latest_entry.exit_image = image_file
-                latest_entry.total_amount = 0
-                latest_entry.exit_time = current_time
-                latest_entry.save()
-            elif car and car.is_special_taxi and not car.is_blocked:
-                if image_file:
-                    latest_entry.exit_image = image_file
-                latest_entry.total_amount = (
-                    latest_entry.calculate_amount()
-                    if VehicleEntry.objects.filter(
-                        entry_time__gte=start_datetime,
-                        entry_time__lte=end_datetime,
-                        number_plate=number_plate,
-                    ).count()
-                    < 2
-                    else 0
-                )
-                latest_entry.exit_time = current_time
-                latest_entry.save()
-            else:
-                if (car and not car.is_blocked) or not car:
-                    if image_file:
-                        latest_entry.exit_image = image_file
-                    latest_entry.exit_time = current_time
-                    latest_entry.total_amount = latest_entry.calculate_amount()
-                    latest_entry.save()
+        # Check if car is blocked
+        if policy.is_blocked:
+            # Send real-time notification about blocked car
+            _notice(
+                notices,
+                "🚫 Bloklangan avtomobil",
+                f"Avtomobil {number_plate} bloklangan! Chiqish taqiqlanadi.",
+                "error",
+            )
 
             return JsonResponse(
                 {
-                    "status": "ok",
-                    "number_plate": number_plate,
-                    "amount": latest_entry.total_amount,
+                    "status": "error",
+                    "message": f"Bu avtomobilga taqiq qo'shilgan! {number_plate}",
                 }
             )
 
+        # Process the exit based on car type
+        if image_file:
+            latest_entry.exit_image = image_file
+        latest_entry.exit_time = current_time
+        if policy.is_free:
+            # "free" toifasi uchun reja bo'lmasa summa 0
+            latest_entry.total_amount = latest_entry.calculate_amount(
+                policy.tariff_category
+            )
+        elif policy.is_special_taxi:
+            # exit_time summadan oldin qo'yiladi, aks holda summa doim 0 chiqadi
+            latest_entry.total_amount = (
+                latest_entry.calculate_amount(policy.tariff_category)
+                if VehicleEntry.objects.filter(
+                    entry_time__gte=start_datetime,
+                    entry_time__lte=end_datetime,
+                    number_plate=number_plate,
+                ).count()
+                < 2
+                else 0
+            )
+        else:
+            latest_entry.total_amount = latest_entry.calculate_amount()
+        latest_entry.save()
+
+        if not latest_entry.total_amount:
+            # To'lov yo'q - yo'lakda avtomatik ochish yoqilgan bo'lsa shlakbaum ochiladi
+            transaction.on_commit(lambda: _auto_open(lane))
+
+        return JsonResponse(
+            {
+                "status": "ok",
+                "number_plate": number_plate,
+                "amount": latest_entry.total_amount,
+                "entry_id": latest_entry.id,
+                "lane": lane.name,
+                "read_plate": read_plate,
+                "match_confidence": round(match.confidence, 3) if match else 1.0,
+            }
+        )
+
+
+def _notify_plate_match(notices, read_plate, match):
+    """Operatorga raqam taxminiy moslashtirilganini bildiradi"""
+    _notice(
+        notices,
+        "🔎 Raqam moslashtirildi",
+        (
+            f"Kamera {read_plate} deb o'qidi, {match.plate} kirish yozuvi olindi "
+            f"(ishonch {match.confidence:.0%})"
+        ),
+        "warning",
+    )
+
+
+def _notify_plate_suggestion(notices, read_plate, match):
+    """Ishonchsiz moslik: yozuv yopilmaydi, operator o'zi tekshiradi"""
+    _notice(
+        notices,
+        "🔎 Raqamni tekshiring",
+        (
+            f"Kamera {read_plate} deb o'qidi, ochiq yozuv topilmadi. "
+            f"{match.plate} bo'lishi mumkin (ishonch {match.confidence:.0%}) - "
+            "yozuv avtomatik yopilmadi"
+        ),
+        "warning",
+    )
+
+
+@login_required
+@require_GET
+def scheduler_status(request):
+    """Fon vazifalari holati: yetakchi, oxirgi ishga tushish, xatolar"""
+    try:
+        return JsonResponse(scheduler.status())
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 
-# New API endpoints for WebSocket functionality
+@login_required
+@require_GET
+def fiscal_outbox_status(request):
+    """Unikassa navbati: nechta savdo kutmoqda, yuborildi, xato"""
+    try:
+        return JsonResponse(fiscal_outbox.status())
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
 
 
-@csrf_exempt
 @login_required
 @require_GET
-def get_statistics(request):
-    """Get statistics for a specific date"""
-    date_str = request.GET.get("date", timezone.now().date().isoformat())
+def image_thumbnail(request, name):
+    """Ro'yxatlar uchun kichik rasm; hali yo'q bo'lsa asl rasmdan yasaladi"""
     try:
-        # Convert date string to timezone-aware datetime for proper filtering
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
-        # Create timezone-aware datetime range for the entire day
-        start_datetime = timezone.make_aware(
-            datetime.combine(date_obj, datetime.min.time())
-        )
-        end_datetime = timezone.make_aware(
-            datetime.combine(date_obj, datetime.max.time())
-        )
-    except ValueError:
-        # Fallback to today if date parsing fails
-        today = timezone.now().date()
-        start_datetime = timezone.make_aware(
-            datetime.combine(today, datetime.min.time())
-        )
-        end_datetime = timezone.make_aware(datetime.combine(today, datetime.max.time()))
+        data = image_store.thumbnail(name)
+    except (OSError, SuspiciousFileOperation):
+        raise Http404("Rasm topilmadi")
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+    response = HttpResponse(data, content_type=THUMB_CONTENT_TYPE)
+    # Nomda kontent hash bor - fayl hech qachon o'zgarmaydi
+    response["Cache-Control"] = "private, max-age=31536000, immutable"
+    return response
 
-    # Get entries that either:
-    # 1. Entered today (normal case)
-    # 2. Entered yesterday but exited today (overnight parking)
-    today_entries = VehicleEntry.objects.filter(
-        entry_time__gte=start_datetime, entry_time__lte=end_datetime
-    )
 
-    # Also include vehicles that entered yesterday but exited today
-    yesterday_start = timezone.make_aware(
-        datetime.combine(date_obj - timezone.timedelta(days=1), datetime.min.time())
-    )
-    yesterday_end = timezone.make_aware(
-        datetime.combine(date_obj - timezone.timedelta(days=1), datetime.max.time())
-    )
+# New API endpoints for WebSocket functionality
 
-    overnight_entries = VehicleEntry.objects.filter(
-        entry_time__gte=yesterday_start,
-        entry_time__lte=yesterday_end,
-        exit_time__gte=start_datetime,
-        exit_time__lte=end_datetime,
-    )
 
-    # Calculate statistics separately for each queryset
-    today_total = today_entries.count()
-    today_exits = today_entries.filter(exit_time__isnull=False).count()
-    today_inside = today_entries.filter(exit_time__isnull=True).count()
-    today_unpaid = today_entries.filter(is_paid=False, exit_time__isnull=False).count()
-
-    overnight_total = overnight_entries.count()
-    overnight_exits = overnight_entries.filter(exit_time__isnull=False).count()
-    overnight_inside = overnight_entries.filter(exit_time__isnull=True).count()
-    overnight_unpaid = overnight_entries.filter(
-        is_paid=False, exit_time__isnull=False
-    ).count()
-
-    # Combine the results
-    total_entries = today_total + overnight_total
-    total_exits = today_exits + overnight_exits
-    total_inside = today_inside + overnight_inside
-    unpaid_entries = today_unpaid + overnight_unpaid
-
-    return JsonResponse(
-        {
-            "total_entries": total_entries,
-            "total_exits": total_exits,
-            "total_inside": total_inside,
-            "unpaid_entries": unpaid_entries,
-        }
-    )
+@csrf_exempt
+@login_required
+@require_GET
+def get_statistics(request):
+    """Get statistics for a specific date"""
+    # Bitta agregat so'rov (bugun uchun esa xotiradagi hisoblagich)
+    return JsonResponse(statistics_for(parse_day(request.GET.get("date"))))
 
 
 @csrf_exempt
@@ -651,6 +674,8 @@ def get_vehicle_entries(request):
                     "is_paid": entry.is_paid,
                     "entry_image": entry.entry_image.url if entry.entry_image else None,
                     "exit_image": entry.exit_image.url if entry.exit_image else None,
+                    "entry_thumb": thumbnail_url(entry.entry_image),
+                    "exit_thumb": thumbnail_url(entry.exit_image),
                     "status": "inside"
                     if not entry.exit_time
                     else ("paid" if entry.is_paid else "unpaid"),
@@ -667,33 +692,24 @@ def get_vehicle_entries(request):
 @require_GET
 @login_required
 def export_entries_xls(request):
-    """Avtomobil yozuvlarini tanlangan sana uchun .xls formatida eksport qiladi"""
+    """Avtomobil yozuvlarini tanlangan sana uchun XLSX (?format=csv - CSV) ko'rinishida eksport qiladi"""
     try:
-        date_str = request.GET.get("date", timezone.now().date().isoformat())
+        day = parse_day(request.GET.get("date"))
+        date_str = day.isoformat()
         number_plate_filter = request.GET.get("number_plate", "")
         status_filter = request.GET.get("status", "all")
+        # Eski havolalar uchun "xls" ham XLSX beradi
+        export_format = request.GET.get("format", "xlsx").lower()
+        if export_format == "xls":
+            export_format = "xlsx"
+        if export_format not in ("xlsx", "csv"):
+            return JsonResponse({"error": "Noto'g'ri format"}, status=400)
 
-        try:
-            date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
-            start_datetime = timezone.make_aware(
-                datetime.combine(date_obj, datetime.min.time())
-            )
-            end_datetime = timezone.make_aware(
-                datetime.combine(date_obj, datetime.max.time())
-            )
-        except ValueError:
-            today = timezone.now().date()
-            start_datetime = timezone.make_aware(
-                datetime.combine(today, datetime.min.time())
-            )
-            end_datetime = timezone.make_aware(
-                datetime.combine(today, datetime.max.time())
-            )
-
+        start_datetime, end_datetime = day_bounds(day)
         entries = VehicleEntry.objects.filter(
             entry_time__gte=start_datetime,
             entry_time__lte=end_datetime,
-        ).order_by("-entry_time")
+        ).order_by("-entry_time", "-id")
 
         if number_plate_filter:
             entries = entries.filter(number_plate__icontains=number_plate_filter)
@@ -707,56 +723,21 @@ def export_entries_xls(request):
         elif status_filter == "exited":
             entries = entries.filter(exit_time__isnull=False)
 
-        # Excel ochishi uchun HTML jadval yaratamiz (to'liq o'zbekcha)
-        rows = [
-            "<tr><th>Avtomobil raqami</th><th>Kirish vaqti</th><th>Chiqish vaqti</th><th>To'lov miqdori (so'm)</th><th>Holati</th></tr>"
-        ]
-        for entry in entries:
-            entry_time = entry.entry_time.strftime("%H:%M") if entry.entry_time else ""
-            exit_time = entry.exit_time.strftime("%H:%M") if entry.exit_time else ""
-            # Holatni o'zbekchaga o'tkazamiz
-            if not entry.exit_time:
-                status = "Ichkarida"
-            else:
-                status = "To'langan" if entry.is_paid else "To'lanmagan"
-            rows.append(
-                f"<tr>"
-                f"<td>{entry.number_plate}</td>"
-                f"<td>{entry_time}</td>"
-                f"<td>{exit_time}</td>"
-                f"<td>{entry.total_amount or 0}</td>"
-                f"<td>{status}</td>"
-                f"</tr>"
+        filename = f"avtomobillar_{date_str}.{export_format}"
+        title = "KUNLIK HISOBOT"
+        if day < local_today():
+            # Tugagan kun: bir xil so'rov diskdagi tayyor fayldan beriladi
+            params = {
+                "date": date_str,
+                "number_plate": number_plate_filter,
+                "status": status_filter,
+            }
+            return export_cache.response(
+                entries, filename, export_format, params, title, date_str, DAILY_LAYOUT
             )
-
-        # Jadval uchun style qo'shamiz: barcha kataklarga chegaralar, collapse yoqilgan
-        table_html = (
-            "<html>"
-            "<head>"
-            "<meta http-equiv='Content-Type' content='application/vnd.ms-excel; charset=UTF-8'/>"
-            "<meta charset='UTF-8'/>"
-            "<style>"
-            "table { border-collapse: collapse; }"
-            "th, td { border: 1px solid #000000; padding: 4px; mso-number-format:'\@'; }"
-            "th { background: #f1f5f9; }"
-            "</style>"
-            "</head>"
-            "<body>"
-            "<table>" + "".join(rows) + "</table>"
-            "</body>"
-            "</html>"
-        )
-
-        # UTF-8 BOM qo'shamiz (Excelda o'zbekcha harflar to'g'ri chiqishi uchun)
-        content_with_bom = "\ufeff" + table_html
-
-        response = HttpResponse(
-            content_with_bom, content_type="application/vnd.ms-excel; charset=UTF-8"
-        )
-        response["Content-Disposition"] = (
-            f"attachment; filename=avtomobillar_{date_str}.xls"
-        )
-        return response
+        if export_format == "csv":
+            return csv_response(entries, filename, DAILY_LAYOUT)
+        return xlsx_response(entries, filename, title, date_str, DAILY_LAYOUT)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
@@ -1294,59 +1275,64 @@ def get_detailed_entries(request):
             entries = entries.filter(number_plate__icontains=search_query)
 
         # Handle export
-        if export_format == "xls":
+        if export_format in ("xls", "csv"):
             # Use date_from if available, otherwise use current date
             export_date = date_from if date_from else timezone.now().date().isoformat()
-            return export_detailed_entries_xls(entries, export_date)
+            return export_detailed_entries_xls(entries, export_date, export_format)
 
         # Compute summary (exit-based for revenue; exclude zero-amount from paid)
-        summary_qs = VehicleEntry.objects.all()
-        if start_datetime:
-            summary_qs = summary_qs.filter(exit_time__gte=start_datetime)
-        if end_datetime:
-            summary_qs = summary_qs.filter(exit_time__lte=end_datetime)
-        # Apply plate/search filters to summary as well
-        if number_plate_filter:
-            summary_qs = summary_qs.filter(number_plate__icontains=number_plate_filter)
-        if search_query:
-            summary_qs = summary_qs.filter(number_plate__icontains=search_query)
-        # Compute metrics
-        paid_qs = summary_qs.filter(
-            is_paid=True, total_amount__gt=0, exit_time__isnull=False
-        )
-        paid_count = paid_qs.count()
-        paid_sum = paid_qs.aggregate(total=Sum("total_amount"))["total"] or 0
-        unpaid_zero_count = summary_qs.filter(is_paid=True, total_amount=0).count()
-        # Inside count for today's (or selected) date only
-        inside_qs = VehicleEntry.objects.filter(exit_time__isnull=True)
-        try:
-            if date_from:
-                start_date = datetime.strptime(date_from, "%Y-%m-%d").date()
-                start_datetime = timezone.make_aware(
-                    datetime.combine(start_date, datetime.min.time())
-                )
+        if start_datetime and end_datetime and not (number_plate_filter or search_query):
+            # Butun kunlar oralig'i: tugagan kunlar DailyParkingStats dan o'qiladi
+            summary = range_summary(start_date, end_date)
+        else:
+            summary_qs = VehicleEntry.objects.all()
+            if start_datetime:
+                summary_qs = summary_qs.filter(exit_time__gte=start_datetime)
+            if end_datetime:
+                summary_qs = summary_qs.filter(exit_time__lte=end_datetime)
+            # Apply plate/search filters to summary as well
+            if number_plate_filter:
+                summary_qs = summary_qs.filter(number_plate__icontains=number_plate_filter)
+            if search_query:
+                summary_qs = summary_qs.filter(number_plate__icontains=search_query)
+            summary = exit_summary(summary_qs)
+            # Inside count for today's (or selected) date only
+            inside_qs = VehicleEntry.objects.filter(exit_time__isnull=True)
+            if start_datetime:
                 inside_qs = inside_qs.filter(entry_time__gte=start_datetime)
-            if date_to:
-                end_date = datetime.strptime(date_to, "%Y-%m-%d").date()
-                end_datetime = timezone.make_aware(
-                    datetime.combine(end_date, datetime.max.time())
-                )
+            if end_datetime:
                 inside_qs = inside_qs.filter(entry_time__lte=end_datetime)
-        except ValueError:
-            pass
-        inside_count = inside_qs.count()
-        exited_count = summary_qs.filter(exit_time__isnull=False).count()
+            summary["inside_count"] = inside_qs.count()
 
         # Pagination
         page = int(request.GET.get("page", 1))
         per_page = int(request.GET.get("per_page", 50))
-        start = (page - 1) * per_page
-        end = start + per_page
+        cursor = request.GET.get("cursor", "")
+        count_filters = {
+            key: value
+            for key, value in request.GET.items()
+            if key not in ("page", "per_page", "cursor", "paginate", "count")
+        }
+        next_cursor = None
 
-        # Order by most recent activity
-        ordered = entries.order_by("-exit_time", "-entry_time")
-        total_count = ordered.count()
-        entries_page = ordered[start:end]
+        if cursor or request.GET.get("paginate") == "cursor":
+            # Keyset: har bir sahifa chuqurligidan qat'i nazar bir xil tez
+            try:
+                entries_page, next_cursor = keyset_page(entries, per_page, cursor)
+            except InvalidCursor as e:
+                return JsonResponse({"error": str(e)}, status=400)
+            total_count = None
+            if request.GET.get("count", "1") != "0":
+                # Birinchi sahifada qayta sanaymiz, keyingilari keshdan
+                total_count = cached_count(entries, count_filters, refresh=not cursor)
+        else:
+            start = (page - 1) * per_page
+            end = start + per_page
+
+            # Order by most recent activity
+            ordered = entries.order_by(*KEYSET_ORDERING)
+            total_count = ordered.count()
+            entries_page = ordered[start:end]
 
         # Prepare data for response
         entries_data = []
@@ -1381,6 +1367,8 @@ def get_detailed_entries(request):
                     else "Chiqib ketgan",
                     "entry_image": entry.entry_image.url if entry.entry_image else None,
                     "exit_image": entry.exit_image.url if entry.exit_image else None,
+                    "entry_thumb": thumbnail_url(entry.entry_image),
+                    "exit_thumb": thumbnail_url(entry.exit_image),
                 }
             )
 
@@ -1392,14 +1380,17 @@ def get_detailed_entries(request):
                     "current_page": page,
                     "per_page": per_page,
                     "total_count": total_count,
-                    "total_pages": (total_count + per_page - 1) // per_page,
+                    "total_pages": (total_count + per_page - 1) // per_page
+                    if total_count is not None
+                    else None,
+                    "next_cursor": next_cursor,
                 },
                 "summary": {
-                    "paid_count": paid_count,
-                    "paid_sum": paid_sum,
-                    "unpaid_zero_count": unpaid_zero_count,
-                    "inside_count": inside_count,
-                    "exited_count": exited_count,
+                    "paid_count": summary["paid_count"],
+                    "paid_sum": summary["paid_sum"],
+                    "unpaid_zero_count": summary["unpaid_zero_count"],
+                    "inside_count": summary["inside_count"],
+                    "exited_count": summary["exited_count"],
                 },
             }
         )
@@ -1475,33 +1466,41 @@ def print_detailed_stats_receipt(request):
             entries = entries.filter(number_plate__icontains=search_query)
 
         # Summary-only (exit-based for revenue; exclude zero-amount from paid)
-        # Paid metrics: only those with exit today and amount > 0
-        paid_qs = entries.filter(
-            is_paid=True, total_amount__gt=0, exit_time__isnull=False
-        )
-        paid_count = paid_qs.count()
-        paid_sum = paid_qs.aggregate(total=Sum("total_amount"))["total"] or 0
-        # Zero-paid (0 so'm) among paid within window
-        unpaid_zero_count = entries.filter(is_paid=True, total_amount=0).count()
-        # inside_count should reflect cars that entered within the date range and have no exit
-        inside_qs = VehicleEntry.objects.filter(exit_time__isnull=True)
         try:
-            if date_from:
-                start_date = datetime.strptime(date_from, "%Y-%m-%d").date()
-                start_datetime = timezone.make_aware(
-                    datetime.combine(start_date, datetime.min.time())
-                )
-                inside_qs = inside_qs.filter(entry_time__gte=start_datetime)
-            if date_to:
-                end_date = datetime.strptime(date_to, "%Y-%m-%d").date()
-                end_datetime = timezone.make_aware(
-                    datetime.combine(end_date, datetime.max.time())
-                )
-                inside_qs = inside_qs.filter(entry_time__lte=end_datetime)
+            report_days = (
+                datetime.strptime(date_from, "%Y-%m-%d").date(),
+                datetime.strptime(date_to, "%Y-%m-%d").date(),
+            )
         except ValueError:
-            pass
-        inside_count = inside_qs.count()
-        exited_count = entries.filter(exit_time__isnull=False).count()
+            report_days = None
+        if (
+            report_days
+            and payment_status == "all"
+            and entry_status in ("all", "exited")
+            and not (number_plate_filter or search_query)
+        ):
+            # Filtrsiz hisobot: tugagan kunlar DailyParkingStats dan o'qiladi
+            summary = range_summary(*report_days)
+        else:
+            summary = exit_summary(entries)
+            # inside_count should reflect cars that entered within the date range and have no exit
+            inside_qs = VehicleEntry.objects.filter(exit_time__isnull=True)
+            try:
+                if date_from:
+                    start_date = datetime.strptime(date_from, "%Y-%m-%d").date()
+                    start_datetime = timezone.make_aware(
+                        datetime.combine(start_date, datetime.min.time())
+                    )
+                    inside_qs = inside_qs.filter(entry_time__gte=start_datetime)
+                if date_to:
+                    end_date = datetime.strptime(date_to, "%Y-%m-%d").date()
+                    end_datetime = timezone.make_aware(
+                        datetime.combine(end_date, datetime.max.time())
+                    )
+                    inside_qs = inside_qs.filter(entry_time__lte=end_datetime)
+            except ValueError:
+                pass
+            summary["inside_count"] = inside_qs.count()
 
         filters_snapshot = {
             "date_from": date_from,
@@ -1529,11 +1528,11 @@ def print_detailed_stats_receipt(request):
             date_from=date_from or "",
             date_to=date_to or "",
             filters=filters_snapshot,
-            paid_count=paid_count,
-            paid_sum=paid_sum,
-            unpaid_zero_count=unpaid_zero_count,
-            inside_count=inside_count,
-            exited_count=exited_count,
+            paid_count=summary["paid_count"],
+            paid_sum=summary["paid_sum"],
+            unpaid_zero_count=summary["unpaid_zero_count"],
+            inside_count=summary["inside_count"],
+            exited_count=summary["exited_count"],
         )
 
         return JsonResponse(
@@ -1589,203 +1588,21 @@ def list_printers(request):
         return JsonResponse({"status": "error", "error": str(e)}, status=500)
 
 
-def export_detailed_entries_xls(entries, date_str=None):
-    """Export detailed entries to Excel format using openpyxl"""
+def export_detailed_entries_xls(entries, date_str=None, export_format="xls"):
+    """Export detailed entries to Excel (or CSV), streamed with constant memory"""
     try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-        from openpyxl.utils import get_column_letter
-        from io import BytesIO
-
-        # Create workbook and worksheet
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Batafsil yozuvlar"
-
-        # Define styles
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(
-            start_color="366092", end_color="366092", fill_type="solid"
-        )
-        border = Border(
-            left=Side(style="thin"),
-            right=Side(style="thin"),
-            top=Side(style="thin"),
-            bottom=Side(style="thin"),
-        )
-        center_alignment = Alignment(horizontal="center", vertical="center")
-
-        # Calculate daily statistics
-        total_entries = len(entries)
-        free_exits = sum(
-            1
-            for entry in entries
-            if entry.exit_time
-            and (entry.total_amount == 0 or entry.total_amount is None)
-        )
-        paid_exits = sum(
-            1
-            for entry in entries
-            if entry.exit_time and entry.total_amount and entry.total_amount > 0
-        )
-        total_revenue = sum(
-            entry.total_amount or 0
-            for entry in entries
-            if entry.exit_time and entry.total_amount
-        )
-        inside_count = sum(1 for entry in entries if not entry.exit_time)
-        exited_count = sum(1 for entry in entries if entry.exit_time)
-
-        # Add title and date
-        ws["A1"] = "SMART AUTOPARK - Batafsil yozuvlar"
-        ws["A1"].font = Font(bold=True, size=16)
-        ws.merge_cells("A1:H1")
-
+        entries = entries.order_by(*KEYSET_ORDERING)
+        stamp = timezone.now().strftime("%Y%m%d_%H%M%S")
         if date_str:
-            ws["A2"] = f"Sana: {date_str}"
-            ws["A2"].font = Font(bold=True, size=12)
-            ws.merge_cells("A2:H2")
-
-        # Add statistics section
-        stats_start_row = 4
-        ws[f"A{stats_start_row}"] = "KUNLIK STATISTIKA"
-        ws[f"A{stats_start_row}"].font = Font(bold=True, size=14)
-        ws[f"A{stats_start_row}"].fill = PatternFill(
-            start_color="E7E6E6", end_color="E7E6E6", fill_type="solid"
-        )
-        ws.merge_cells(f"A{stats_start_row}:H{stats_start_row}")
-
-        # Statistics rows
-        stats_data = [
-            ("Jami kirishlar:", total_entries),
-            ("Bepul chiqishlar (0 so'm):", free_exits),
-            ("To'lovli chiqishlar:", paid_exits),
-            ("Jami tushum:", f"{total_revenue:,} so'm"),
-            ("Ichkarida qolganlar:", inside_count),
-            ("Chiqib ketganlar:", exited_count),
-        ]
-
-        for i, (label, value) in enumerate(stats_data, start=stats_start_row + 1):
-            ws[f"A{i}"] = label
-            ws[f"B{i}"] = value
-            ws[f"A{i}"].font = Font(bold=True)
-            ws[f"B{i}"].font = Font(bold=True)
-            if "tushum" in label.lower():
-                ws[f"B{i}"].font = Font(bold=True, color="008000")  # Green for revenue
-
-        # Add empty row before table
-        table_start_row = stats_start_row + len(stats_data) + 2
-
-        # Add table headers
-        headers = [
-            "Avtomobil raqami",
-            "Kirish vaqti",
-            "Chiqish vaqti",
-            "Davomiyligi",
-            "To'lov miqdori (so'm)",
-            "To'lov holati",
-            "Holat",
-        ]
-
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=table_start_row, column=col, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = center_alignment
-            cell.border = border
-
-        # Add data rows
-        for row_idx, entry in enumerate(entries, start=table_start_row + 1):
-            # Calculate duration
-            if entry.exit_time:
-                duration = entry.exit_time - entry.entry_time
-                duration_hours = duration.total_seconds() / 3600
-                duration_str = f"{duration_hours:.1f} soat"
-            else:
-                duration_str = "Ichkarida"
+            stamp = f"{date_str.replace('-', '')}_{timezone.now().strftime('%H%M%S')}"
+        filename = f"batafsil_yozuvlar_{stamp}"
 
-            # Format times
-            entry_time = (
-                entry.entry_time.strftime("%Y-%m-%d %H:%M") if entry.entry_time else ""
-            )
-            exit_time = (
-                entry.exit_time.strftime("%Y-%m-%d %H:%M") if entry.exit_time else ""
-            )
-
-            # Status
-            payment_status = "To'langan" if entry.is_paid else "To'lanmagan"
-            entry_status = "Ichkarida" if not entry.exit_time else "Chiqib ketgan"
-
-            # Add row data
-            row_data = [
-                entry.number_plate,
-                entry_time,
-                exit_time,
-                duration_str,
-                entry.total_amount or 0,
-                payment_status,
-                entry_status,
-            ]
-
-            for col, value in enumerate(row_data, 1):
-                cell = ws.cell(row=row_idx, column=col, value=value)
-                cell.border = border
-                cell.alignment = center_alignment
-
-                # Color coding for payment status
-                if col == 6:  # Payment status column
-                    if value == "To'langan":
-                        cell.fill = PatternFill(
-                            start_color="C6EFCE", end_color="C6EFCE", fill_type="solid"
-                        )
-                    else:
-                        cell.fill = PatternFill(
-                            start_color="FFC7CE", end_color="FFC7CE", fill_type="solid"
-                        )
-
-                # Color coding for entry status
-                if col == 7:  # Entry status column
-                    if value == "Ichkarida":
-                        cell.fill = PatternFill(
-                            start_color="FFEB9C", end_color="FFEB9C", fill_type="solid"
-                        )
-                    else:
-                        cell.fill = PatternFill(
-                            start_color="C6EFCE", end_color="C6EFCE", fill_type="solid"
-                        )
-
-        # Auto-adjust column widths
-        for col in range(1, len(headers) + 1):
-            column_letter = get_column_letter(col)
-            max_length = 0
-
-            for row in range(1, table_start_row + len(entries) + 1):
-                cell_value = ws[f"{column_letter}{row}"].value
-                if cell_value:
-                    max_length = max(max_length, len(str(cell_value)))
-
-            # Set minimum width and add some padding
-            adjusted_width = min(max(max_length + 2, 12), 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
-
-        # Save to BytesIO
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-
-        # Create response
-        response = HttpResponse(
-            output.getvalue(),
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        if export_format == "csv":
+            return csv_response(entries, f"{filename}.csv")
+        return xlsx_response(
+            entries, f"{filename}.xlsx", "Batafsil yozuvlar", date_str
         )
 
-        filename = f"batafsil_yozuvlar_{timezone.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        if date_str:
-            filename = f"batafsil_yozuvlar_{date_str.replace('-', '')}_{timezone.now().strftime('%H%M%S')}.xlsx"
-
-        response["Content-Disposition"] = f"attachment; filename={filename}"
-        return response
-
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
@@ -1937,18 +1754,11 @@ def process_uuid_payment(request):
 
         entry.save()
 
-        # Oddiy chekni chiqarish (consumers.py dagi funksiyadan foydalanish)
+        # Chek navbatga qo'yiladi: printer sekin yoki o'chiq bo'lsa ham javob kutmaydi.
+        # Natija home_updates guruhiga print_job_update bo'lib keladi
+        print_job = None
         try:
-            from .consumers import HomeConsumer
-
-            consumer = HomeConsumer()
-            print_result = consumer.print_receipt_to_xprinter_sync(entry.id)
-            # Chek chiqarish natijasini log qilish (ixtiyoriy)
-            if not print_result.get("success"):
-                import logging
-
-                logger = logging.getLogger(__name__)
-                logger.warning(f"Chek chiqarishda xatolik: {print_result.get('error')}")
+            print_job = print_spooler.submit_entry(entry).as_dict()
         except Exception as e:
             # Chek chiqarishda xatolik bo'lsa ham to'lov saqlanadi
             import logging
@@ -1971,6 +1781,7 @@ def process_uuid_payment(request):
                     ).total_seconds()
                     / 3600,
                 },
+                "print_job": print_job,
             }
         )
 
@@ -1983,12 +1794,16 @@ def process_uuid_payment(request):
 def delete_final_20_days_entries(request):
     """Delete entries that are 20 days old"""
     try:
-        with transaction.atomic():
-            cutoff_date = timezone.now() - timedelta(days=20)
-
-            VehicleEntry.objects.filter(entry_time__lt=cutoff_date).delete()
-            messages.success(request, "20 kunlik yozuvlar o'chirildi")
-            return redirect("home")
+        # So'rov ichida emas: fon threadida partiyalab o'chiriladi
+        if retention_runner.start():
+            messages.success(request, "20 kunlik yozuvlarni o'chirish fonda boshlandi")
+        else:
+            status = retention_runner.status()
+            messages.info(
+                request,
+                f"O'chirish davom etmoqda: {status['rows']} ta yozuv o'chirildi",
+            )
+        return redirect("home")
     except Exception as e:
         messages.error(request, "Xatolik yuz berdi: " + str(e))
         return redirect("home")